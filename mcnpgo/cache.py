@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+"""
+Cache of the intermediate states of an assembly (go objects), used for the
+incremental builds of the command line interface.
+
+Each state is identified by a key, hash of the inputs which produced it
+(content of the files, key of the previous state, parameters of the
+operation). A chain of operations restarts from its last state found in the
+cache and only computes the following ones.
+"""
+
+import os, time, json, hashlib, struct
+from mcnpgo.mcnpgo import go
+from mcnpgo.mctk import ExpandIncludes
+
+# Version of the cache, to change if the states are no longer compatible
+CACHE_VERSION = 2
+
+
+def HashKey(*parts):
+    """
+    Returns the key of a state from its inputs (values serializable in JSON).
+    """
+
+    sParts = json.dumps([CACHE_VERSION] + list(parts), sort_keys=True, default=str)
+
+    return hashlib.sha256(sParts.encode()).hexdigest()
+
+
+def HashInput(sFile):
+    """
+    Returns the hash of an input file of go, the files included with
+    'read file=' being expanded: a modification of an included file changes
+    the hash.
+    """
+
+    with open(sFile,'r',errors='ignore') as fid:
+        sText = ExpandIncludes(fid.read(), os.path.dirname(sFile))
+
+    return hashlib.sha256(sText.encode()).hexdigest()
+
+
+class BuildCache:
+    """
+    Class for managing a directory of cached go objects.
+    """
+
+    def __init__(self, path, max_size=1e9, max_age=30):
+        # Directory of the cache
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        # Eviction: total size in bytes and age in days (since the last use)
+        self.max_size = max_size
+        self.max_age = max_age
+
+        # Log of the steps: (label, status, time), status being hit/miss
+        self.log = list()
+
+        # Time saved by the hits
+        self.saved = 0.
+
+    def _File(self, sKey):
+        return os.path.join(self.path, sKey + '.mgo')
+
+    def Has(self, sKey):
+        """
+        Has(key):
+
+        Returns True if the state is in the cache.
+        """
+
+        return os.path.isfile(self._File(sKey))
+
+    def Get(self, sKey):
+        """
+        Get(key):
+
+        Returns (object, cost) of a state, None if it is not in the cache.
+        cost is the time needed to compute the state from the input files.
+        """
+
+        try:
+            with open(self._File(sKey),'rb') as fid:
+                dCost, = struct.unpack('<d', fid.read(8))
+                obj = go.Load(fid)
+        except (OSError, struct.error):
+            return None
+        if obj is None:
+            return None
+
+        # Date of last use, for the eviction
+        os.utime(self._File(sKey))
+
+        return obj, dCost
+
+    def Put(self, sKey, obj, cost):
+        """
+        Put(key, obj, cost):
+
+        Stores a state: cost (float64) followed by the object saved by
+        go.Save. The file is written in a temporary file then renamed, so
+        that several processes can share the cache.
+        """
+
+        sTemp = self._File(sKey) + f".{os.getpid()}.tmp"
+        with open(sTemp,'wb') as fid:
+            fid.write(struct.pack('<d', cost))
+            obj.Save(fid)
+        os.replace(sTemp, self._File(sKey))
+
+    def Chain(self, lsSteps, obj=None):
+        """
+        Chain(lsSteps, obj=None):
+
+        Computes a chain of operations, lsSteps being a list of
+        (key, function, label), each function taking the previous object
+        and returning the new one (obj for the first function).
+        The chain restarts from the last state in the cache.
+        Returns the last object.
+
+        Example:
+        oCache.Chain([(k1, lambda o: go(file), 'load'), (k2, Translate, 'translat')])
+        """
+
+        # Last state in the cache
+        iStart = -1
+        dCost = 0.
+        for i in range(len(lsSteps)-1,-1,-1):
+            t0 = time.time()
+            res = self.Get(lsSteps[i][0]) if self.Has(lsSteps[i][0]) else None
+            if res is not None:
+                obj, dCost = res
+                dLoad = time.time() - t0
+                self.saved = self.saved + max(dCost - dLoad, 0.)
+                self.log.append((lsSteps[i][2], 'hit', dLoad))
+                iStart = i
+                break
+
+        # Following states
+        for sKey,fct,sLabel in lsSteps[iStart+1:]:
+            t0 = time.time()
+            obj = fct(obj)
+            dTime = time.time() - t0
+            dCost = dCost + dTime
+            self.Put(sKey, obj, dCost)
+            self.log.append((sLabel, 'miss', dTime))
+
+        return obj
+
+    def Evict(self):
+        """
+        Evict():
+
+        Removes the states unused for more than max_age days, then the
+        oldest ones until the size of the cache is below max_size.
+        Returns the number of removed states.
+        """
+
+        lsEntry = list()
+        for sFile in os.listdir(self.path):
+            if sFile.endswith('.mgo'):
+                oStat = os.stat(os.path.join(self.path, sFile))
+                lsEntry.append((oStat.st_mtime, oStat.st_size, sFile))
+        lsEntry.sort()
+
+        iRemoved = 0
+        dNow = time.time()
+        iSize = sum([e[1] for e in lsEntry])
+        for dTime,iFileSize,sFile in lsEntry:
+            if dNow - dTime <= self.max_age*86400 and iSize <= self.max_size:
+                break
+            os.remove(os.path.join(self.path, sFile))
+            iSize = iSize - iFileSize
+            iRemoved = iRemoved + 1
+
+        return iRemoved
+
+    def Report(self):
+        """
+        Report():
+
+        Returns the report of the steps: hits/misses and time saved.
+        """
+
+        lsOut = list()
+        for sLabel,sStatus,dTime in self.log:
+            lsOut.append(f"  {sStatus:<5s} {dTime:8.3f} s  {sLabel}")
+        iHit = len([e for e in self.log if e[1] == 'hit'])
+        lsOut.append(f"  cache: {iHit} hits, {len(self.log)-iHit} misses, {self.saved:.3f} s saved")
+
+        return '\n'.join(lsOut)
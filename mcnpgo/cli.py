@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+"""
+Command line interface of mcnpgo: assembly of MCNP files described by a
+manifest (JSON, TOML or YAML if PyYAML is installed).
+
+Example of manifest (JSON):
+{
+    "output": "results/room_det.mcnp",
+    "components": {
+        "room":     {"file": "room.mcnp"},
+        "detector": {"file": "detector.mcnp", "parent": "room",
+                     "transforms": [{"TrRotY": {"trans": [0,400,0], "angle": 1}}],
+                     "options": {"location": "inside"}},
+        "ccd":      {"file": "ccd.mcnp", "parent": "detector",
+                     "transforms": [{"Translat": [60,50,0]}],
+                     "options": {"location": "inside"}},
+        "copies":   {"file": "ccd.mcnp", "parent": "room", "mode": "InsertInstance",
+                     "instances": [["tr",-200,0,0], ["tr",-200,100,0]]}
+    },
+    "cards": [{"banner": "PHYSICS"}, ["MODE N P", "PHYS:P 30.0"], {"file": "source.txt"}],
+    "tallies": [{"tally": "F4:P", "comment": "flux", "group": "F4"},
+                {"point": {"comment": "point", "group": "F5"}}],
+    "write": {"imp": "out", "mergetr": true}
+}
+
+Components are placed in the frame of their parent, the component without
+parent is the host of the assembly. The transforms are the methods of go
+(Translat, TrRotX, TrRotY, TrRotZ, TrEuler, TrRotU, Transform) with their
+arguments as a list or a dict. They are applied once the children of the
+component are inserted, so that the children move with their parent.
+
+With --cache, the intermediate objects (after the loading, each transform
+and each insertion) are kept in a cache directory and only the states
+depending on modified files or parameters are computed again.
+
+Usage:
+mcnpgo manifest.json [-o output.mcnp] [-j workers] [--cache dir]
+"""
+
+import sys, os, time, json, argparse
+from concurrent.futures import ProcessPoolExecutor
+from mcnpgo.mcnpgo import go, Assembly
+import mcnpgo.mctk as tk
+from mcnpgo.cache import BuildCache, HashInput, HashKey
+
+# Transforms allowed in a manifest
+TS_MANIFEST_TRANSFORMS = ('Translat', 'TrRotX', 'TrRotY', 'TrRotZ', 'TrEuler', 'TrRotU', 'Transform')
+
+# Insertion modes allowed in a manifest
+TS_MANIFEST_MODES = ('Insert', 'InsertCells', 'InsertInstance')
+
+
+def ReadManifest(sFile):
+    """
+    Reads a manifest, the format is given by the extension of the file
+    (.json, .toml, .yaml/.yml).
+    Returns the dict of the manifest.
+    """
+
+    sExt = os.path.splitext(sFile)[1].lower()
+    if sExt == '.json':
+        with open(sFile,'r') as fid:
+            dictMan = json.load(fid)
+    elif sExt == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                print("ReadManifest: Error, tomllib (python >= 3.11) or tomli is needed for TOML manifests.")
+                sys.exit()
+        with open(sFile,'rb') as fid:
+            dictMan = tomllib.load(fid)
+    elif sExt in ('.yaml','.yml'):
+        try:
+            import yaml
+        except ImportError:
+            print("ReadManifest: Error, PyYAML is needed for YAML manifests.")
+            sys.exit()
+        with open(sFile,'r') as fid:
+            dictMan = yaml.safe_load(fid)
+    else:
+        print(f"ReadManifest: Error, unknown manifest format '{sExt}'.")
+        sys.exit()
+
+    CheckManifest(dictMan)
+
+    return dictMan
+
+
+def CheckManifest(dictMan):
+    """
+    Verification of a manifest, exits with a message if it is not valid.
+    """
+
+    if "components" not in dictMan or len(dictMan["components"]) == 0:
+        print("CheckManifest: Error, no components in the manifest.")
+        sys.exit()
+
+    lsRoot = list()
+    for sName,dictComp in dictMan["components"].items():
+        if "file" not in dictComp:
+            print(f"CheckManifest: Error, no file for the component '{sName}'.")
+            sys.exit()
+        if "parent" not in dictComp:
+            lsRoot.append(sName)
+        elif dictComp["parent"] not in dictMan["components"] or dictComp["parent"] == sName:
+            print(f"CheckManifest: Error, unknown parent '{dictComp['parent']}' for the component '{sName}'.")
+            sys.exit()
+        if dictComp.get("mode",'Insert') not in TS_MANIFEST_MODES:
+            print(f"CheckManifest: Error, unknown mode '{dictComp['mode']}' for the component '{sName}'.")
+            sys.exit()
+        for dictTr in dictComp.get("transforms",[]):
+            for sTr in dictTr.keys():
+                if sTr not in TS_MANIFEST_TRANSFORMS:
+                    print(f"CheckManifest: Error, unknown transform '{sTr}' for the component '{sName}'.")
+                    sys.exit()
+
+    if len(lsRoot) != 1:
+        print(f"CheckManifest: Error, one component without parent is needed, found {lsRoot}.")
+        sys.exit()
+
+    # No cycle in the tree
+    for sName in dictMan["components"].keys():
+        lsPath = [sName]
+        while "parent" in dictMan["components"][lsPath[-1]]:
+            lsPath.append(dictMan["components"][lsPath[-1]]["parent"])
+            if lsPath[-1] in lsPath[:-1]:
+                print(f"CheckManifest: Error, cycle in the components {lsPath}.")
+                sys.exit()
+
+
+def LoadComponent(sFile):
+    """
+    Loads a component (function run by the workers).
+    """
+
+    return go(sFile)
+
+
+def LoadComponents(dictMan, sDir='', workers=None):
+    """
+    Loads the components of a manifest on a pool of processes
+    (sequentially if workers = 1).
+    Returns the dict of the go objects by component.
+    """
+
+    dictArgs = dict()
+    for sName,dictComp in dictMan["components"].items():
+        dictArgs[sName] = (os.path.join(sDir, dictComp["file"]),)
+
+    if workers == 1 or len(dictArgs) == 1:
+        return {sName: LoadComponent(*args) for sName,args in dictArgs.items()}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        dictFut = {sName: pool.submit(LoadComponent, *args) for sName,args in dictArgs.items()}
+        return {sName: oFut.result() for sName,oFut in dictFut.items()}
+
+
+def BuildAssembly(dictMan, dictObj):
+    """
+    Builds the assembly tree of a manifest from the loaded components, the
+    transforms of a component are those of its node (applied to the
+    component with its children).
+    Returns the root node.
+    """
+
+    dictComp = dictMan["components"]
+    sRoot = [s for s in dictComp.keys() if "parent" not in dictComp[s]][0]
+    dictNode = {sRoot: Assembly(dictObj[sRoot], name=sRoot)}
+
+    # Parents are created before their children
+    lsTodo = [s for s in dictComp.keys() if s != sRoot]
+    while len(lsTodo) > 0:
+        for sName in [s for s in lsTodo if dictComp[s]["parent"] in dictNode]:
+            sMode = dictComp[sName].get("mode",'Insert')
+            dictNode[sName] = dictNode[dictComp[sName]["parent"]].Add(dictObj[sName],
+                                  transforms=dictComp[sName].get("transforms",[]) + dictComp[sName].get("instances",[]),
+                                  mode=sMode, name=sName, **dictComp[sName].get("options",{}))
+            lsTodo.remove(sName)
+
+    return dictNode[sRoot]
+
+
+def ChildrenOf(dictMan, sParent):
+    """
+    Returns the children of a component, in the order of the manifest.
+    """
+
+    return [s for s,dictComp in dictMan["components"].items() if dictComp.get("parent",'') == sParent]
+
+
+def StateKeys(dictMan, sDir=''):
+    """
+    Returns the keys of the successive states of the components of a manifest:
+    dict name -> {"base": [(key, label)] for the loading,
+                  "insert": [(key, label, child)] for the insertions,
+                  "transform": [(key, label, transform)] for the transforms,
+                  applied after the insertions}.
+    """
+
+    dictComp = dictMan["components"]
+    dictFileHash = dict()
+    dictKeys = dict()
+
+    def _Keys(sName):
+        if sName in dictKeys:
+            return dictKeys[sName]
+        sFile = os.path.join(sDir, dictComp[sName]["file"])
+        if sFile not in dictFileHash:
+            dictFileHash[sFile] = HashInput(sFile)
+        lsBase = [(HashKey('load', dictFileHash[sFile]), f"{sName}: load {dictComp[sName]['file']}")]
+
+        lsInsert = list()
+        sPrev = lsBase[-1][0]
+        for sChild in ChildrenOf(dictMan, sName):
+            dictChild = dictComp[sChild]
+            sMode = dictChild.get("mode",'Insert')
+            sChildKey = _Keys(sChild)["final"]
+            sPrev = HashKey(sPrev, sMode, sChildKey, dictChild.get("options",{}), dictChild.get("instances",[]))
+            lsInsert.append((sPrev, f"{sName}: {sMode} {sChild}", sChild))
+
+        lsTransform = list()
+        for dictTr in dictComp[sName].get("transforms",[]):
+            sPrev = HashKey(sPrev, 'transform', dictTr)
+            lsTransform.append((sPrev, f"{sName}: {list(dictTr.keys())[0]}", dictTr))
+
+        dictKeys[sName] = {"base": lsBase, "insert": lsInsert, "transform": lsTransform, "final": sPrev}
+        return dictKeys[sName]
+
+    for sName in dictComp.keys():
+        _Keys(sName)
+
+    return dictKeys
+
+
+def LoadComponentCached(sFile, lsBase, sCache):
+    """
+    Loads a component using the cache (function run by the workers).
+    Returns the object, the log of the steps and the time saved.
+    """
+
+    oCache = BuildCache(sCache)
+    obj = oCache.Chain([(lsBase[0][0], lambda o: go(sFile), lsBase[0][1])])
+
+    return obj, oCache.log, oCache.saved
+
+
+def BuildCached(dictMan, oCache, sDir='', workers=None):
+    """
+    Builds the flat object of a manifest, reusing the states of the cache.
+    Only the components whose loaded state is needed are loaded (on a pool
+    of processes).
+    Returns the object.
+    """
+
+    dictComp = dictMan["components"]
+    dictKeys = StateKeys(dictMan, sDir)
+    sRoot = [s for s in dictComp.keys() if "parent" not in dictComp[s]][0]
+
+    # Components to load: their chain restarts before the end of the loading
+    def _Needed(sName):
+        lsKeys = [k[0] for k in dictKeys[sName]["base"] + dictKeys[sName]["insert"] + dictKeys[sName]["transform"]]
+        iLast = max([i for i,k in enumerate(lsKeys) if oCache.Has(k)], default=-1)
+        if iLast == len(lsKeys) - 1:
+            return set()
+        setNeeded = set()
+        if iLast < len(dictKeys[sName]["base"]) - 1:
+            setNeeded.add(sName)
+        for i,(sKey,sLabel,sChild) in enumerate(dictKeys[sName]["insert"]):
+            if len(dictKeys[sName]["base"]) + i > iLast:
+                setNeeded = setNeeded | _Needed(sChild)
+        return setNeeded
+
+    dictArgs = dict()
+    for sName in [s for s in dictComp.keys() if s in _Needed(sRoot)]:
+        dictArgs[sName] = (os.path.join(sDir, dictComp[sName]["file"]), dictKeys[sName]["base"], oCache.path)
+    dictBase = dict()
+    if workers == 1 or len(dictArgs) <= 1:
+        for sName,args in dictArgs.items():
+            dictBase[sName] = LoadComponentCached(*args)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            dictFut = {sName: pool.submit(LoadComponentCached, *args) for sName,args in dictArgs.items()}
+            dictBase = {sName: oFut.result() for sName,oFut in dictFut.items()}
+    for sName in dictBase.keys():
+        oCache.log.extend(dictBase[sName][1])
+        oCache.saved = oCache.saved + dictBase[sName][2]
+
+    # Insertions, the children are built only if needed
+    def _Insert(obj, sChild):
+        dictChild = dictComp[sChild]
+        oChild = _Build(sChild)
+        if dictChild.get("mode",'Insert') == 'InsertInstance':
+            obj.InsertInstance(oChild, transforms=dictChild.get("instances",[]), **dictChild.get("options",{}))
+        else:
+            getattr(obj, dictChild.get("mode",'Insert'))(oChild, **dictChild.get("options",{}))
+        return obj
+
+    def _Build(sName):
+        lsSteps = list()
+        for sKey,sLabel,sChild in dictKeys[sName]["insert"]:
+            lsSteps.append((sKey, lambda o,c=sChild: _Insert(o,c), sLabel))
+        for sKey,sLabel,dictTr in dictKeys[sName]["transform"]:
+            lsSteps.append((sKey, lambda o,d=dictTr: Assembly.ApplyTransforms(o,[d]), sLabel))
+        if sName in dictBase:
+            return oCache.Chain(lsSteps, obj=dictBase[sName][0])
+        # The loaded state is in the cache, the file is loaded again if it
+        # cannot be read (corrupted, other version, evicted meanwhile)
+        sKey,sLabel = dictKeys[sName]["base"][-1]
+        sFile = os.path.join(sDir, dictComp[sName]["file"])
+        return oCache.Chain([(sKey, lambda o: go(sFile), sLabel)] + lsSteps)
+
+    return _Build(sRoot)
+
+
+def AddCards(obj, dictMan, sDir=''):
+    """
+    Adds to the object the extra cards and the tallies of a manifest.
+    "cards" is a list of lists of cards, {"banner": title} or {"file": path},
+    "tallies" is a list of arguments of AddMCNPTally, or {"point": arguments}
+    for AddMCNPPointTally.
+    """
+
+    for card in dictMan.get("cards",[]):
+        if isinstance(card, dict) and "banner" in card:
+            obj.AddMCNPBanner(card["banner"])
+        elif isinstance(card, dict) and "file" in card:
+            obj.AddMCNPCardFromFile(os.path.join(sDir, card["file"]))
+        elif isinstance(card, str):
+            obj.AddMCNPCard([card])
+        else:
+            obj.AddMCNPCard(card)
+
+    for dictTally in dictMan.get("tallies",[]):
+        if "point" in dictTally:
+            obj.AddMCNPPointTally(**dictTally["point"])
+        else:
+            obj.AddMCNPTally(**dictTally)
+
+    return obj
+
+
+def main(argv=None):
+    """
+    Entry point of the command line interface.
+    """
+
+    oParser = argparse.ArgumentParser(prog='mcnpgo', description='Assembly of MCNP files described by a manifest.')
+    oParser.add_argument('manifest', help='manifest file (.json, .toml, .yaml)')
+    oParser.add_argument('-o', '--output', default='', help='output file (default: "output" of the manifest)')
+    oParser.add_argument('-j', '--workers', type=int, default=None, help='number of processes for loading (default: number of CPUs)')
+    oParser.add_argument('--cache', default='', help='directory of the cache for the incremental builds')
+    oParser.add_argument('--cache-size', type=float, default=1000., help='maximum size of the cache in MB (default: 1000)')
+    oParser.add_argument('--cache-age', type=float, default=30., help='maximum age in days of the unused states (default: 30)')
+    args = oParser.parse_args(argv)
+
+    dictTime = dict()
+    t0 = time.time()
+    dictMan = ReadManifest(args.manifest)
+    sDir = os.path.dirname(args.manifest)
+    sOutput = args.output if len(args.output) > 0 else dictMan.get("output",'')
+    if len(sOutput) == 0:
+        print("mcnpgo: Error, no output file.")
+        sys.exit()
+    if len(args.output) == 0:
+        sOutput = os.path.join(sDir, sOutput)
+    dictTime["manifest"] = time.time() - t0
+
+    # Phases of the build
+    if len(args.cache) == 0:
+        t0 = time.time()
+        dictObj = LoadComponents(dictMan, sDir, workers=args.workers)
+        dictTime["load"] = time.time() - t0
+
+        t0 = time.time()
+        obj = BuildAssembly(dictMan, dictObj).Flatten()
+        sRoot = [s for s,dictComp in dictMan["components"].items() if "parent" not in dictComp][0]
+        Assembly.ApplyTransforms(obj, dictMan["components"][sRoot].get("transforms",[]))
+        dictTime["assemble"] = time.time() - t0
+    else:
+        t0 = time.time()
+        oCache = BuildCache(args.cache, max_size=args.cache_size*1e6, max_age=args.cache_age)
+        obj = BuildCached(dictMan, oCache, sDir, workers=args.workers)
+        dictTime["build"] = time.time() - t0
+
+    t0 = time.time()
+    AddCards(obj, dictMan, sDir)
+    dictTime["cards"] = time.time() - t0
+
+    t0 = time.time()
+    dictStats0 = dict(tk.dictGWriteStats)
+    bChanged = obj.WriteMCNPFile(sOutput, **dictMan.get("write",{}))
+    dictTime["write"] = time.time() - t0
+
+    # Report
+    if bChanged:
+        print(f"mcnpgo: {len(dictMan['components'])} components written to {sOutput}")
+    else:
+        print(f"mcnpgo: {len(dictMan['components'])} components, {sOutput} unchanged")
+    for sPhase,dTime in dictTime.items():
+        print(f"  {sPhase:<10s} {dTime:8.3f} s")
+    print(f"  {'total':<10s} {sum(dictTime.values()):8.3f} s")
+    dictStats = {sKey: tk.dictGWriteStats[sKey] - dictStats0[sKey] for sKey in dictStats0}
+    if dictStats["unchanged"] > 0:
+        print(f"  files: {dictStats['written']} written, {dictStats['unchanged']} unchanged ({dictStats['saved']} bytes not rewritten)")
+    if len(args.cache) > 0:
+        print(oCache.Report())
+        iRemoved = oCache.Evict()
+        if iRemoved > 0:
+            print(f"  cache: {iRemoved} states removed")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
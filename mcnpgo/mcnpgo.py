@@ -2,11 +2,12 @@
 
 # @author Alexandre Friou
 
-import sys, math
+import sys, os, math, re
 from copy import deepcopy
 import mcnpgo.mctk as tk
 import numpy as np
 import json
+from concurrent.futures import ProcessPoolExecutor
 
 MCNP_FIRST_TALLY = dict()
 MCNP_FIRST_TALLY["F1"] = 1
@@ -23,6 +24,10 @@ class go:
     Class for managing files/geometry objects.
     """
 
+    # If True, the references are checked (see Validate) after Insert,
+    # InsertCells, Extract and Renum. Ex: go.debug = True
+    debug = False
+
     def __init__(self, geom):
         # Path to the mcnp file
         self.geom = geom
@@ -36,10 +41,20 @@ class go:
         # List of transformations applied to the object
         self._FctTrans = []
 
+        # Blocks of the inserted objects, in the order of the file:
+        # [file, number of cells, number of surfaces] (see WriteMCNPFile, split)
+        self._InParts = list()
+
+        # Number blocks reserved for the inserted objects (see ReserveRanges)
+        self._Reserve = None
+
         # Open file
         with open(geom,'r',errors='ignore') as fid:
             sFichier = fid.read()
 
+            # Included files (read file=)
+            sFichier = tk.ExpandIncludes(sFichier, os.path.dirname(geom))
+
             # Correct and check file for tabs, &, etc
             lsLignes = tk._Caveats(sFichier,geom)
 
@@ -58,6 +73,18 @@ class go:
         Display the properties of the object.
         """
 
+        return self._Header()
+
+    def _Header(self, provenance='full', sidecar=''):
+        """
+        _Header(provenance='full', sidecar=''):
+
+        Returns the description of the object (see __str__), with the whole
+        history of the inserted objects (provenance='full'), a summary of it
+        (provenance='summary') or a summary and the name of the JSON file
+        holding the history (provenance='json').
+        """
+
         # Euler angles of the current file
         npMat = np.reshape(np.array(self._Trans[4:-1]),(3,3))
         dAngEulerA, dAngEulerB, dAngEulerG = tk.AnglesEulerZXZ(npMat)
@@ -69,7 +96,7 @@ class go:
 
         # List of transformations applied to the object
         if len(self._FctTrans) > 0:
-            lsPrint.append(" "*5 + f"Applied translation: {self._Trans[1:4]}")
+            lsPrint.append(" "*5 + f"Applied translation: {[np.asarray(x).tolist() for x in self._Trans[1:4]]}")
             lsPrint.append(" "*5 + f"Applied Euler angles: a={np.rad2deg(dAngEulerA)}, b={np.rad2deg(dAngEulerB)}, g={np.rad2deg(dAngEulerG)} " )
             lsPrint.append(" "*5 + "Rotation matrix: ")
             for i in range(3):
@@ -80,13 +107,32 @@ class go:
         else:
             lsPrint.append(" "*5 + "No transforms were applied")
         lsPrint.append(' - Inserted files: ')
-        lsPrint.extend(self._InGeom)
+        if provenance == 'full':
+            lsPrint.extend(tk.FormatProvenance(self._InGeom))
+        else:
+            lsPrint.extend(tk.SummaryProvenance(self._InGeom))
+            if provenance == 'json':
+                lsPrint.append(" "*5 + f"History of the insertions in {sidecar}")
 
         # Final string
         sPrint = '\n'.join(lsPrint)
 
         return sPrint
 
+    def _ProvenanceNode(self):
+        """
+        _ProvenanceNode():
+
+        Returns the node of the history of the insertions describing the
+        object: {"geom": file, "trans": object transform, "fct": applied
+        transforms, "ops": other operations, "children": nodes of the objects
+        inserted in it}. The nodes of the children are shared, not copied,
+        and are never modified.
+        """
+
+        return {"geom": self.geom, "trans": list(self._Trans), "fct": list(self._FctTrans),
+                "ops": list(), "children": list(self._InGeom)}
+
     def ShowGroups(self):
         """
         ShowGroups():
@@ -158,9 +204,9 @@ class go:
             print("CheckGroup: Warning, object does not contain any group.")
             return False
 
-    def Insert(self, Elem, location = 'unknown', renum = 'no'):
+    def Insert(self, Elem, location = 'unknown', renum = 'no', bake = False):
         """
-        Insert(Elem, location = 'unknown', renum = 'no'):
+        Insert(Elem, location = 'unknown', renum = 'no', bake = False):
 
         Allows to insert an object into another by copying the enclosing surfaces.
         obj1.Insert(obj2)
@@ -172,17 +218,25 @@ class go:
         allows to optimize the calculation.
         If obj2 is completely outside of obj1, then the option location = 'outside'
         allows to optimize the calculation.
+        With location = 'none', the cells of obj2 are inserted without
+        modifying the ambient and world cells of obj1 (ex: cells of a universe).
 
         The option "renum" allows to force the renumbering of "obj2", the calculation is then slower.
+        Otherwise, only the numbers of "obj1" also used by "obj2" are renumbered
+        (into the lowest free numbers), the other ones are preserved.
+
+        The option "bake" writes the surfaces of "obj2" in the global frame
+        instead of refering to its transformation cards (see Transform).
 
         Example:
         obj1.Insert(obj2, location = 'inside')
         obj1.Insert(obj2, location = 'inside', renum = 'yes') # force the renumbering of "obj2"
+        obj1.Insert(obj2, location = 'inside', bake = True)
 
         """
 
         # Verification
-        if location != 'unknown' and location != 'inside' and location != 'outside':
+        if location not in ('unknown','inside','outside','none'):
             print("Insert: Warning, unknown input for 'location', default mode chosen")
             location = 'unknown'
         if renum != 'yes' and renum != 'no':
@@ -194,47 +248,36 @@ class go:
         # Finally, we take everything into account, the new object contains everything
         # It is more practical when applying a transfo to the whole set
 
-        # Euler angles of the inserted file
-        npMat = np.reshape(np.array(Elem._Trans[4:4+9]),(3,3))
-        dAngEulerA, dAngEulerB, dAngEulerG = tk.AnglesEulerZXZ(npMat)
-
         # List of inserted files
-        self._InGeom.append(Elem.geom)
+        self._InGeom.append(Elem._ProvenanceNode())
 
-        # List of transformations applied to the inserted object
-        if len(Elem._FctTrans) > 0:
-            self._InGeom.append(" "*5 + f"Applied translation: {Elem._Trans[1:4]}")
-            self._InGeom.append(" "*5 + f"Applied Euler angles: a={np.rad2deg(dAngEulerA)}, b={np.rad2deg(dAngEulerB)}, g={np.rad2deg(dAngEulerG)} " )
-            self._InGeom.append(" "*5 + "Rotation matrix:")
-            for i in range(3):
-                self._InGeom.append(" "*10 + f"{npMat[i]}")
-            self._InGeom.append(" "*5 + "List of applied transforms:")
-            for i in range(len(Elem._FctTrans)):
-                self._InGeom.append(" "*10 + Elem._FctTrans[i])
-        else:
-            self._InGeom.append(" "*5 + "No transforms was applied")
-
-        # Files contained in the inserted object
-        if len(Elem._InGeom) > 0:
-            self._InGeom.append(" "*5 + ' - Files contained in ' + Elem.geom + ' :')
-            for s in Elem._InGeom:
-                self._InGeom.append(" "*6 + s)
+        # Surfaces of the newcomer in the global frame
+        dictIn = Elem._dictElem
+        if bake is True:
+            dictIn = tk.BakeSurfTr(dictIn, keeptr = Elem._tiTrTally)
 
         # Two cases depending on whether we renumber the newcomer or not
-        if renum == 'yes':
+        # (with reserved blocks, Elem always goes to its block)
+        iMatStart = None
+        if getattr(self, '_Reserve', None) is not None:
+            # Renumbering of Elem in its reserved block
+            dictOut, iMatStart = self._ReserveBlock(dictIn)
+            renum = 'no'
+        elif renum == 'yes':
             # Renumbering of Elem
-            dictOut = tk.Renum(Elem._dictElem, [-1], 1, [-1], 1, 1)
+            dictOut = tk.Renum(dictIn, [-1], 1, [-1], 1, 1)
 
             # Interpretation of the new element created
             dictOut = tk.LectElem(dictOut["fich"])
         else:
             # Interpretation of the incoming element
-            dictOut = tk.LectElem(Elem._dictElem["fich"])
+            dictOut = tk.LectElem(dictIn["fich"])
 
         # Two cases depending on whether we renumber or not
         if renum == 'yes':
             # Renumbering of self after Elem
-            dictElem0 = tk.Renum(self._dictElem, [-1], dictOut["mmcell"][1]+1, [-1], dictOut["mmsurf"][1]+1, dictOut["mmtrans"][1]+1)
+            dictElem0 = tk.Renum(self._dictElem, [-1], dictOut["mmcell"][1]+1, [-1], dictOut["mmsurf"][1]+1, dictOut["mmtrans"][1]+1,
+                                 self._UnivStart(dictOut))
 
             # Interpretation of the new element created
             dictElem0 = tk.LectElem(dictElem0["fich"])
@@ -243,27 +286,15 @@ class go:
             # We create dictElem0
             dictElem0 = deepcopy(self._dictElem)
 
-            # Verification if it is compatible
-            if (dictOut["mmcell"][1] - self._dictElem["mmcell"][0])*(self._dictElem["mmcell"][1] - dictOut["mmcell"][0]) >= 0:
-                # The elements have ranges with numbers in common
-                # Renumbering of the cells
-                dictElem0 = tk.Renum(dictElem0, [-1], dictOut["mmcell"][1]+1, [], -1, -1)
-                dictElem0 = tk.LectElem(dictElem0["fich"])
-
-            if (dictOut["mmsurf"][1] - self._dictElem["mmsurf"][0])*(self._dictElem["mmsurf"][1] - dictOut["mmsurf"][0]) >= 0:
-                # The elements have ranges with numbers in common
-                # Renumbering of the surfaces
-                dictElem0 = tk.Renum(dictElem0, [], -1, [-1], dictOut["mmsurf"][1]+1, -1)
-                dictElem0 = tk.LectElem(dictElem0["fich"])
-
-            if (dictOut["mmtrans"][1] - self._dictElem["mmtrans"][0])*(self._dictElem["mmtrans"][1] - dictOut["mmtrans"][0]) >= 0:
-                # The elements have ranges with numbers in common
-                # Renumbering of the transfo
-                dictElem0 = tk.Renum(dictElem0, [], -1, [], -1, dictOut["mmtrans"][1]+1)
+            # Only the numbers of self used by Elem are renumbered, into the
+            # free numbers of both objects, the other ones are preserved
+            lsMap = [self._CollisionMap(dictOut, sType) for sType in ("cell","surf","trans","univ")]
+            if sum([len(d) for d in lsMap]) > 0:
+                dictElem0 = tk.RenumMap(dictElem0, *lsMap)
                 dictElem0 = tk.LectElem(dictElem0["fich"])
 
         # Merge of the material lists
-        lsMatFusion = self._InsertMat(dictOut,Elem.geom) # dictOut is modified in the operation
+        lsMatFusion = self._InsertMat(dictOut,Elem.geom,iMatStart) # dictOut is modified in the operation
 
         # Merge of the transformation cards
         lsTrCardFusion = tk.ConcatCard(dictOut,"trans")
@@ -379,6 +410,70 @@ class go:
 
         # Last update
         self._dictElem = deepcopy(dictElemNew)
+        self._InParts.insert(0, [Elem.geom, len(dictOut["cell"])-1, len(dictOut["surf"])])
+        self._Debug('Insert')
+
+    def _CollisionMap(self, dictOut, sType, dictRef=None):
+        """
+        Returns the correspondences {old number: new number} of the numbers of
+        dictRef (self by default, sType in "cell", "surf", "trans" or "univ")
+        which are also used by dictOut. The new numbers fill the lowest free
+        numbers of both objects.
+        """
+
+        oAlloc = tk.BuildNumAlloc(self._dictElem if dictRef is None else dictRef, sType)
+        oAllocOut = tk.BuildNumAlloc(dictOut, sType)
+
+        tiCollision = sorted([i for i in oAllocOut if i in oAlloc])
+        for i in oAllocOut:
+            oAlloc.Add(i)
+
+        return {i: oAlloc.Next() for i in tiCollision}
+
+    def _ReserveBlock(self, dictIn):
+        """
+        Renumbers dictIn in the next block reserved by ReserveRanges.
+        Returns (dictOut, first material number of the block or None).
+        """
+
+        dictSize = self._Reserve["size"]
+        iBlock = self._Reserve["next"]
+
+        # Number of blocks needed by the object
+        iNbBlock = 1
+        for sType,iSize in dictSize.items():
+            if iSize is not None:
+                iNbBlock = max(iNbBlock, -(-len(tk.BuildNumAlloc(dictIn, sType))//iSize))
+        self._Reserve["next"] = iBlock + iNbBlock
+
+        # First numbers of the block, -1 if not reserved
+        dictStart = {sType: iBlock*iSize if iSize is not None else -1 for sType,iSize in dictSize.items()}
+
+        dictOut = tk.Renum(dictIn, [-1] if dictStart["cell"] > 0 else [], dictStart["cell"],
+                           [-1] if dictStart["surf"] > 0 else [], dictStart["surf"], dictStart["trans"])
+        dictOut = tk.LectElem(dictOut["fich"])
+
+        # The types which are not reserved keep their numbers, except the ones
+        # of dictOut already used by self (the numbers of self never change)
+        lsMap = [self._CollisionMap(self._dictElem, sType, dictOut) if dictStart[sType] < 0 else dict()
+                 for sType in ("cell","surf","trans")]
+        if sum([len(d) for d in lsMap]) > 0:
+            dictOut = tk.RenumMap(dictOut, *lsMap)
+            dictOut = tk.LectElem(dictOut["fich"])
+
+        return dictOut, (dictStart["mat"] if dictStart["mat"] > 0 else None)
+
+    def _UnivStart(self, dictOut):
+        """
+        Returns the first universe number for the renumbering of the universes
+        of self if they have numbers in common with the ones of dictOut, -1 otherwise.
+        """
+
+        tiUniv0 = self._dictElem["mmuniv"]
+        tiUniv = dictOut["mmuniv"]
+        if tiUniv0[1] > 0 and tiUniv[1] > 0 and (tiUniv[1] - tiUniv0[0])*(tiUniv0[1] - tiUniv[0]) >= 0:
+            return tiUniv[1] + 1
+        return -1
 
     def InsertCells(self, Elem):
         """
@@ -400,46 +495,36 @@ class go:
         # Finally, we take everything into account, the new object contains everything
         # It is more practical when applying a transfo to the whole set
 
-        # Euler angles of the inserted file
-        npMat = np.reshape(np.array(Elem._Trans[4:4+9]),(3,3))
-        dAngEulerA, dAngEulerB, dAngEulerG = tk.AnglesEulerZXZ(npMat)
-
         # List of inserted files
-        self._InGeom.append(Elem.geom)
+        self._InGeom.append(Elem._ProvenanceNode())
 
-        # List of transformations applied to the inserted object
-        if len(Elem._FctTrans) > 0:
-            self._InGeom.append(" "*5 + f"Applied translation: {Elem._Trans[1:4]}")
-            self._InGeom.append(" "*5 + f"Applied Euler angles: a={np.rad2deg(dAngEulerA)}, b={np.rad2deg(dAngEulerB)}, g={np.rad2deg(dAngEulerG)} " )
-            self._InGeom.append(" "*5 + "Rotation matrix:")
-            for i in range(3):
-                self._InGeom.append(" "*10 + f"{npMat[i]}")
-            self._InGeom.append(" "*5 + "List of applied transforms:")
-            for i in range(len(Elem._FctTrans)):
-                self._InGeom.append(" "*10 + Elem._FctTrans[i])
-        else:
-            self._InGeom.append(" "*5 + "No transforms was applied")
-
-        # Files contained in the inserted object
-        if len(Elem._InGeom) > 0:
-            self._InGeom.append(" "*5 + ' - Files contained in ' + Elem.geom + ' :')
-            for s in Elem._InGeom:
-                self._InGeom.append(" "*6 + s)
+        iMatStart = None
+        if getattr(self, '_Reserve', None) is not None:
+            # Renumbering of Elem in its reserved block
+            dictOut, iMatStart = self._ReserveBlock(Elem._dictElem)
 
-        # Renumbering of Elem
-        dictOut = tk.Renum(Elem._dictElem, [-1], 1, [-1], 1, 1)
+            # Only the numbers of self used by Elem are renumbered
+            dictElem0 = deepcopy(self._dictElem)
+            lsMap = [self._CollisionMap(dictOut, sType) for sType in ("cell","surf","trans","univ")]
+            if sum([len(d) for d in lsMap]) > 0:
+                dictElem0 = tk.RenumMap(dictElem0, *lsMap)
+                dictElem0 = tk.LectElem(dictElem0["fich"])
+        else:
+            # Renumbering of Elem
+            dictOut = tk.Renum(Elem._dictElem, [-1], 1, [-1], 1, 1)
 
-        # Interpretation of the new element created
-        dictOut = tk.LectElem(dictOut["fich"])
+            # Interpretation of the new element created
+            dictOut = tk.LectElem(dictOut["fich"])
 
-        # Renumbering of self after Elem
-        dictElem0 = tk.Renum(self._dictElem, [-1], dictOut["mmcell"][1]+1, [-1], dictOut["mmsurf"][1]+1, dictOut["mmtrans"][1]+1)
+            # Renumbering of self after Elem
+            dictElem0 = tk.Renum(self._dictElem, [-1], dictOut["mmcell"][1]+1, [-1], dictOut["mmsurf"][1]+1, dictOut["mmtrans"][1]+1,
+                                 self._UnivStart(dictOut))
 
-        # Interpretation of the new element created
-        dictElem0 = tk.LectElem(dictElem0["fich"])
+            # Interpretation of the new element created
+            dictElem0 = tk.LectElem(dictElem0["fich"])
 
         # Merge of the material lists
-        lsMatFusion = self._InsertMat(dictOut,Elem.geom) # dictOut is modified in the operation
+        lsMatFusion = self._InsertMat(dictOut,Elem.geom,iMatStart) # dictOut is modified in the operation
 
         # Merge of the transformation cards
         lsTrCardFusion = tk.ConcatCard(dictOut,"trans")
@@ -529,19 +614,266 @@ class go:
 
         # Last update
         self._dictElem = deepcopy(dictElemNew)
+        self._InParts.insert(0, [Elem.geom, len(lsNumCellNew), len(dictOut["surf"])])
+        self._Debug('InsertCells')
+
+    def InsertInstance(self, Elem, transforms=None, location = 'inside'):
+        """
+        InsertInstance(Elem, transforms=None, location = 'inside'):
+
+        Allows to insert several copies of an object with a single description
+        of its cells. The cells of Elem (except the outside world) are inserted
+        once as a universe, each copy is a cell bounded by the enclosing
+        surface of Elem and filled by the universe, placed by a transformation
+        card (trcl).
+
+        The universe number is chosen free in both objects, the copies are
+        added to the ambient cell (location = 'inside'), to the world cell
+        (location = 'outside') or both (location = 'unknown').
+
+        transforms is a list of transformations in the format of Transform.
+        The copies use trcl cards, you may have to call ResolveTRCL.
+
+        Example:
+        obj1.InsertInstance(obj2, transforms=[['tr',0,0,0], ['tr',100,0,0]])
+        obj1.InsertInstance(obj2, transforms=[['*tr',0,50,0, 0,90,90, 90,0,90, 90,90,0]])
+        """
+
+        # Verification
+        if location not in ('unknown','inside','outside'):
+            print("InsertInstance: Warning, unknown input for 'location', default mode chosen")
+            location = 'inside'
+        if transforms is None or len(transforms) == 0:
+            print("InsertInstance: Warning, no transforms given, nothing inserted.")
+            return
+
+        # Universe number free in both objects
+        oAllocUniv = self.GetNumAlloc("univ")
+        for iCell in Elem._dictElem["cell"]:
+            oAllocUniv.Add(tk.GetCellUniv(Elem._dictElem["fich"][iCell]))
+        iUniv = oAllocUniv.Next()
+
+        # The cells of the object are put in the universe, except the outside world
+        oUniv = deepcopy(Elem)
+        for iCell in oUniv._dictElem["cell"][:-1]:
+            if tk.GetCellUniv(oUniv._dictElem["fich"][iCell]) == 0:
+                tk.AddCellKeyWord(oUniv._dictElem["fich"][iCell], f'u={iUniv}')
+        sEnglob = oUniv._dictElem["englob"]
+
+        # Insertion of the cells of the universe
+        # The numbers of Elem are kept (renum = 'no'), the enclosing surface is still valid
+        self.Insert(oUniv, location = 'none')
+        dictNode = self._InGeom[-1]
+        self._InGeom[-1] = dict(dictNode, ops=dictNode["ops"] + [f"Inserted as universe {iUniv}, {len(transforms)} copies"])
+        dictElem = self._dictElem
+
+        # Importances of the copies, same as the ambient cell
+        dictDiese = tk.GatherCellGeo(dictElem["fich"][dictElem["cell"][-2]])
+        lsImp = [s for s in ' '.join(dictDiese["strfin"]).split() if s.lower().startswith('imp')]
+
+        # One cell and one tr card per copy
+        oAllocCell = self.GetNumAlloc("cell")
+        oAllocTr = self.GetNumAlloc("trans")
+        lsCellCopy = list()
+        lsTrCopy = list()
+        tiCellCopy = list()
+        for lsInput in transforms:
+            iCell = oAllocCell.Next()
+            iTr = oAllocTr.Next()
+            tiCellCopy.append(iCell)
+
+            # Card, in cosinuses and forward transform
+            sTr = lsInput[0] + str(iTr) + ' ' + ' '.join([str(d) for d in lsInput[1:]])
+            tdCanon = tk.CanonicalTr(tk.ReadTrCard([sTr]))
+            lsTrCopy.append(['c Copy of ' + Elem.geom + f' in cell {iCell}'])
+            lsTrCopy.append(tk.FormatTrCard(iTr, tdCanon))
+
+            lsCellCopy.append([f'{iCell} 0 #{sEnglob} fill={iUniv} trcl={iTr} ' + ' '.join(lsImp) + ' $ ' + Elem.geom])
+
+        # Complement of the copies in the ambient and world cells
+        sCellCopy = '#' + ' #'.join([str(i) for i in tiCellCopy])
+        tiIndCell = list()
+        if location == 'inside' or location == 'unknown':
+            tiIndCell.append(dictElem["cell"][-2])
+        if location == 'outside' or location == 'unknown':
+            tiIndCell.append(dictElem["cell"][-1])
+        for iIndCell in tiIndCell:
+            dictCell = tk.GetCellGeo(' '.join(dictElem["fich"][iIndCell]))
+            lsNewCell = list()
+            if len(dictElem["fich"][iIndCell]) == 1:
+                lsNewCell.append(dictCell["strdeb"].strip() + ' ' + dictCell["strgeo"].strip())
+                lsNewCell.append('      ' + sCellCopy + ' $ ' + Elem.geom)
+                if len(dictCell["strfin"]) > 0 and dictCell["strfin"].isspace() == False:
+                    lsNewCell.append('      ' + dictCell["strfin"].strip() + ' ' + dictCell["strcom"])
+                else:
+                    lsNewCell.append('c      ' + dictCell["strcom"])
+            else:
+                lsNewCell.append(dictElem["fich"][iIndCell][0].strip())
+                lsNewCell.append('      ' + sCellCopy + ' $ ' + Elem.geom)
+                for s in dictElem["fich"][iIndCell][1:]:
+                    lsNewCell.append('      ' + s.strip())
+            dictElem["fich"][iIndCell] = lsNewCell
+
+        # Insertion of the tr cards after the others, of the cells before the ambient cell
+        if len(dictElem["trans"]) > 0:
+            iIndTr = dictElem["trans"][-1] + 1
+        else:
+            iIndTr = dictElem["saut"][1] + 1
+        dictElem["fich"][iIndTr:iIndTr] = lsTrCopy
+        iIndCell = dictElem["cell"][-2]
+        dictElem["fich"][iIndCell:iIndCell] = lsCellCopy
+
+        # Interpretation of the new element created
+        dictElemNew = tk.LectElem(dictElem["fich"])
+        if "mcnp" in dictElem.keys():
+            dictElemNew["mcnp"] = dictElem["mcnp"]
+        self._dictElem = dictElemNew
+        self._Debug('InsertInstance')
+
+    def OptimizeAmbient(self, leaf = 8, margin = 1.):
+        """
+        OptimizeAmbient(leaf = 8, margin = 1.):
+
+        Shortens the expression of the ambient cell, which receives the
+        enclosing surfaces of each inserted object (see Insert).
+        The terms of the ambient cell bounding an object (inserted object,
+        #cell...) are gathered in a box (RPP) enclosing them with a margin
+        in cm, this box is cut by planes (binary space partition) until each
+        part intersects at most "leaf" objects. Each part becomes a cell with
+        the material and keywords of the ambient cell, and only the terms of
+        the objects it intersects. The ambient cell only keeps its other terms
+        and the outside of the box.
+        Should be called once all the objects are inserted.
+
+        Example:
+        obj1.Insert(obj2, location = 'inside')
+        ...
+        obj1.OptimizeAmbient()
+        obj1.OptimizeAmbient(leaf = 4, margin = 5.)
+        """
+
+        dictElem = self._dictElem
+        lsCard = dictElem["fich"]
+        iIndAmb = dictElem["cell"][-2]
+
+        # Geometry and keywords of the ambient cell
+        lsLine = [sLine for sLine in lsCard[iIndAmb] if not tk.IsComment(sLine)]
+        if tk.GetLikeBut(lsLine[0]) is not None:
+            print("OptimizeAmbient: Warning, the ambient cell is a like but cell, nothing is done.")
+            return
+        dictFirst = tk.GetCellGeo(lsLine[0])
+        lsGeo = list()
+        lsFin = list()
+        lsLineGeo = tk.GetCellLinesGeo(lsLine)
+        for j,dictLine in enumerate(lsLineGeo):
+            lsGeo.append(dictLine["strgeo"])
+            if len(dictLine["strfin"].strip()) > 0:
+                lsFin.append(dictLine["strfin"].strip())
+                lsFin.extend([s.split('$')[0].strip() for s in lsLine[j+1:]])
+                break
+        sFin = ' '.join([s for s in lsFin if len(s) > 0])
+        lsCom = [dictLine["strcom"].strip() for dictLine in lsLineGeo]
+        sCom = ([''] + [s for s in lsCom if len(s) > 0])[-1]
+
+        oTree = tk.ParseCellGeo(' '.join(lsGeo))
+        if oTree is None or oTree[0] == 'or':
+            print("OptimizeAmbient: Warning, the ambient cell is not an intersection, nothing is done.")
+            return
+        lsTerm = oTree[1] if oTree[0] == 'and' else [oTree]
+
+        # Boxes of the complements of the terms (the objects)
+        dictCanon, dictSurfBox, dictSurfLocal = tk.SurfBBoxes(dictElem)
+        npInf = np.array([-np.inf, np.inf]*3)
+        npCellBox = tk.CellBBoxes(dictElem)
+        dictCellPos = {tk.GetCellNum(lsCard[i][0]): iCell for iCell,i in enumerate(dictElem["cell"])}
+
+        def _Surf(d):
+            if d != int(d) or abs(int(d)) not in dictSurfBox:
+                return npInf
+            return dictSurfBox[abs(int(d))][0 if d < 0 else 1]
+
+        def _Cell(n):
+            return npCellBox[dictCellPos[n]] if n in dictCellPos else npInf
+
+        lsObj = list()
+        lsFrame = list()
+        for oTerm in lsTerm:
+            npBox = tk.ComplementBBox(oTerm, _Surf, _Cell)
+            if np.all(np.isfinite(npBox)) and np.all(npBox[0::2] <= npBox[1::2]):
+                lsObj.append((tk.FormatCellGeo(oTerm, True), npBox))
+            else:
+                lsFrame.append(tk.FormatCellGeo(oTerm, True))
+        if len(lsObj) <= leaf:
+            print(f"OptimizeAmbient: {len(lsObj)} objects in the ambient cell, nothing is done.")
+            return
+
+        # Partition of the box enclosing the objects
+        npBoxes = np.array([o[1] for o in lsObj])
+        npRoot = np.empty(6)
+        npRoot[0::2] = np.floor(npBoxes[:,0::2].min(axis=0) - margin)
+        npRoot[1::2] = np.ceil(npBoxes[:,1::2].max(axis=0) + margin)
+        lsPart = tk.SplitBoxesBSP(npBoxes, npRoot, leaf)
+
+        # New surfaces: the box and the planes
+        oAllocSurf = tk.BuildNumAlloc(dictElem, "surf")
+        oAllocCell = tk.BuildNumAlloc(dictElem, "cell")
+        iRoot = oAllocSurf.Next()
+        lsSurfNew = [[f"{iRoot} RPP " + ' '.join([f"{d:.10g}" for d in npRoot]) + " $ ambient box"]]
+        dictPlane = dict()
+        for npBox,lsPlane,npInd in lsPart:
+            for iAxis,dPos,iSense in lsPlane:
+                if (iAxis,dPos) not in dictPlane:
+                    dictPlane[(iAxis,dPos)] = oAllocSurf.Next()
+                    lsSurfNew.append([f"{dictPlane[(iAxis,dPos)]} P{'XYZ'[iAxis]} {dPos:.10g} $ ambient plane"])
+
+        # New cells: the parts of the box
+        sMat = dictFirst["strdeb"].split(None, 1)[1].strip() if len(dictFirst["strdeb"].split()) > 1 else ''
+        lsCellNew = list()
+        for iPart,(npBox,lsPlane,npInd) in enumerate(lsPart):
+            sPlane = ' '.join([f"{'-' if iSense < 0 else ''}{dictPlane[(iAxis,dPos)]}" for iAxis,dPos,iSense in lsPlane])
+            lsNewCell = [f"{oAllocCell.Next()} {sMat} -{iRoot} {sPlane} {' '.join(lsFrame)}".rstrip() + f" $ ambient part {iPart+1}"]
+            for i in npInd:
+                lsNewCell.append('      ' + lsObj[i][0])
+            if len(sFin) > 0:
+                lsNewCell.append('      ' + sFin)
+            lsCellNew.append(lsNewCell)
+
+        # Ambient cell: outside of the box
+        lsNewAmb = [f"{dictFirst['strdeb'].strip()} {' '.join(lsFrame)} {iRoot} {sCom}".rstrip()]
+        if len(sFin) > 0:
+            lsNewAmb.append('      ' + sFin)
+
+        # Insertion of the surfaces after the others, of the cells before the ambient cell
+        lsFich = list(lsCard)
+        iIndSurf = dictElem["saut"][1]
+        lsFich[iIndSurf:iIndSurf] = lsSurfNew
+        lsFich[iIndAmb] = lsNewAmb
+        lsFich[iIndAmb:iIndAmb] = lsCellNew
+
+        # Interpretation of the new element created
+        dictElemNew = tk.LectElem(lsFich)
+        if "mcnp" in dictElem.keys():
+            dictElemNew["mcnp"] = dictElem["mcnp"]
+        self._dictElem = dictElemNew
+        self._Debug('OptimizeAmbient')
 
-    def Transform(self,lsInput, comment=''):
+    def Transform(self,lsInput, comment='', bake=False):
         """
-        Transform(lsInput, comment=''):
+        Transform(lsInput, comment='', bake=False):
 
         Allows to apply a transformation to a file.
         Takes as input the content of the MCNP transformation card.
 
+        If bake=True, the surfaces are written directly in the global frame
+        when it is exact (planes, spheres, quadrics, macrobodies...) instead of
+        refering to a transformation card, the unused tr cards are removed.
+
         Example:
         obj.Transform(['tr',12,3,5]) # Translation only
         obj.Transform(['tr',12,3,5, 0,-1,0, 0,0,1, -1,0,0]) # Translation + rotation
         obj.Transform(['*tr',12,3,5, 90,180,90, 90,90,180, -180,90,90]) # Translation + rotation in degrees
         obj.Transform(['tr',12,3,5], comment='translation equipement') # Comment to insert before the transfo card
+        obj.Transform(['tr',12,3,5], bake=True) # Surfaces written in the global frame
         """
 
         # We substitute the trcl cards with their value
@@ -550,6 +882,10 @@ class go:
         # We apply the transfo
         self._dictElem = tk.ApplyTransfo(dictElem, lsInput, comment)
 
+        # Surfaces in the global frame
+        if bake is True:
+            self._dictElem = tk.BakeSurfTr(self._dictElem, keeptr=self._tiTrTally)
+
         # Conversion to scalar unit
         lsInputScal = tk.ConvertTr(lsInput)
         if len(lsInput) <= 4:
@@ -596,6 +932,31 @@ class go:
 
         return self._Trans
 
+    def GetNumAlloc(self, sType):
+        """
+        GetNumAlloc(sType):
+
+        Returns an allocator of free numbers for the object, sType being
+        "cell", "surf", "trans", "mat", "univ" or a tally type ("F1", "F5", ...).
+        Method Next() of the allocator gives a free number.
+
+        Example:
+        oAlloc = obj.GetNumAlloc("trans")
+        iTr = oAlloc.Next()        # lowest free transform number
+        iCell = obj.GetNumAlloc("cell").Next(1000) # first free cell number from 1000
+        """
+
+        if sType in MCNP_FIRST_TALLY.keys():
+            # Tally numbers of a given type end with the same digit
+            oAlloc = tk.NumAlloc(self._tiNumTally[sType], start=MCNP_FIRST_TALLY[sType], step=10)
+        else:
+            oAlloc = tk.BuildNumAlloc(self._dictElem, sType)
+            if sType == "trans":
+                for iTr in self._tiTrTally:
+                    oAlloc.Add(iTr)
+
+        return oAlloc
+
     def FindTrCard(self,iTr):
         """
         FindTrCard(iTr):
@@ -629,48 +990,161 @@ class go:
 
         return res
 
-    def Renum(self,cell = 1, surf = 1, trans = 1):
+    def MergeTrCards(self):
+        """
+        MergeTrCards():
+
+        Function for merging identical transform cards.
+        All the transform cards are converted to a canonical form (cosinuses,
+        forward transform, values rounded), duplicates are removed and the
+        surfaces, trcl/fill cards and groups are updated accordingly.
+        Constant trcl/fill cards are only converted to transform numbers when
+        writing the file, use WriteMCNPFile(..., mergetr=True) to merge them too.
+
+        Example:
+        obj.MergeTrCards()
         """
-        Renum(cell = 1, surf = 1, trans = 1):
+
+        dictElem = tk.MergeTrCards(self._dictElem)
+
+        # The "mcnp" category is not read by LectElem
+        if "mcnp" in self._dictElem.keys():
+            dictElem["mcnp"] = self._dictElem["mcnp"]
+        self._dictElem = dictElem
+
+        return
+
+    def Renum(self,cell = 1, surf = 1, trans = 1, univ = -1):
+        """
+        Renum(cell = 1, surf = 1, trans = 1, univ = -1):
 
         Function for renumbering an object (cells, surfaces and transformations),
         by default from 1.
+        The universes (u=, fill= and lattice arrays) are renumbered if univ > 0.
 
         Example:
         obj.Renum()
         obj.Renum(cell = 100) # renumber cells from 100
+        obj.Renum(univ = 10)  # renumber also the universes from 10
         """
 
-        dictOut = tk.Renum(self._dictElem, [-1], cell, [-1], surf, trans)
+        dictOut = tk.Renum(self._dictElem, [-1], cell, [-1], surf, trans, univ)
         self._dictElem = deepcopy(tk.LectElem(dictOut["fich"]))
+        self._Debug('Renum')
 
         return
 
-    def Extract(self,tiListeInputCell, mode = 'extract', radius = 2000):
+    def ReserveRanges(self, cells = 10000, surfaces = 10000, transforms = None, materials = None):
+        """
+        ReserveRanges(cells = 10000, surfaces = 10000, transforms = None, materials = None):
+
+        Reserves a block of numbers for each object inserted afterwards
+        (Insert and InsertCells): the k-th block holds the cells k*cells to
+        (k+1)*cells-1, and the same for the surfaces, transformations and
+        materials. Each inserted object is renumbered once into its block
+        (several consecutive blocks if it is too large), so that the numbers
+        of self never change. The first block follows the numbers already
+        used by self. A type given as None is not reserved: the inserted
+        object keeps its numbers of this type, except the ones already used by
+        self which are moved to free numbers.
+        The transformation numbers of MCNP are limited to 999.
+        Without any argument given as an integer, the reservation is removed.
+
+        Example:
+        obj.ReserveRanges()                      # cells and surfaces by blocks of 10000
+        obj.ReserveRanges(cells = 1000, surfaces = 1000, transforms = 100, materials = 100)
+        obj.Insert(obj2)                         # cells 1000..., surfaces 1000..., tr 100...
+        obj.Insert(obj3)                         # cells 2000..., surfaces 2000..., tr 200...
         """
-        Extract(tiListeInputCell, mode = 'extract', radius = 2000):
+
+        dictSize = {"cell": cells, "surf": surfaces, "trans": transforms, "mat": materials}
+        for sType,iSize in dictSize.items():
+            if iSize is not None and (not isinstance(iSize, (int, np.integer)) or iSize <= 0):
+                print(f"ReserveRanges: Error, the size of the blocks must be a positive integer ({sType}: {iSize} ?).")
+                sys.exit()
+
+        if all([iSize is None for iSize in dictSize.values()]):
+            self._Reserve = None
+            return
+
+        # First block after the numbers of self
+        iBlock = 1
+        for sType,iSize in dictSize.items():
+            if iSize is not None:
+                tiUsed = list(tk.BuildNumAlloc(self._dictElem, sType))
+                if len(tiUsed) > 0:
+                    iBlock = max(iBlock, max(tiUsed)//iSize + 1)
+
+        self._Reserve = {"size": dictSize, "next": iBlock}
+
+        return
+
+    def Validate(self, verbose=True):
+        """
+        Validate(verbose=True):
+
+        Checks the references of the object in a single pass: surfaces and
+        cells (#) of the cells, like but, materials, transformations,
+        universes of the fill cards and entries of the groups.
+        Returns the list of the diagnostics (dicts with keys level, type,
+        line, num, ref and message), empty if no error was found.
+        The line is the line of the card in the file written without header.
+
+        With go.debug = True, Validate is called after Insert, InsertCells,
+        Extract and Renum.
+
+        Example:
+        lsDiag = obj.Validate()
+        lsDiag = obj.Validate(verbose=False)
+        """
+
+        lsDiag = tk.ValidateElem(self._dictElem)
+        if verbose is True:
+            for dictDiag in lsDiag:
+                print(f"Validate: Error line {dictDiag['line']}, {dictDiag['message']}.")
+
+        return lsDiag
+
+    def _Debug(self, sOperation):
+        """
+        Checks the references after an operation in debug mode.
+        """
+
+        if go.debug is True:
+            for dictDiag in tk.ValidateElem(self._dictElem):
+                print(f"{sOperation}: Error line {dictDiag['line']}, {dictDiag['message']}.")
+
+    def Extract(self,tiListeInputCell, mode = 'extract', radius = 2000, bound = 'rpp', margin = 1.):
+        """
+        Extract(tiListeInputCell, mode = 'extract', radius = 2000, bound = 'rpp', margin = 1.):
 
         Function to extract a list of cells (and necessary surfaces, material
         and transformation) from an object.
-        By default, a bounding cell of radius 20m is added to visualize the
-        file with mcnp.
+        A bounding cell is added to visualize the file with mcnp, the smallest
+        box (RPP) enclosing the extracted cells by default.
         This function can be used to then make an insertion by cell with
         'InsertCells', the insertion by bounding surface not working in the
         general case.
 
-        Warning: mat not work on lattices due to dependance issues between
-        between universes and fill cells (work in progress).
+        The cells of the universes filling the extracted cells (fill cards and
+        lattice arrays) are extracted with them.
 
         Parametres:
         mode     : 'extract' (default) extracts cells in 'tiListeInputCell'.
                    'subtract' allows to extract the complement of the list of
                    cells given (ignores the last two cells, i.e., the gas cell
                    and graveyard cell).
-        radius   : radius of the bounding sphere in cm.
+        radius   : radius of the bounding sphere (SO) in cm, used if bound = 'radius'
+                   or if one of the cells is not bounded.
+        bound    : 'rpp' (default) or 'sph', box or sphere enclosing the bounding
+                   boxes of the cells (see Select, bbox), 'radius' for the sphere
+                   of radius "radius".
+        margin   : margin in cm added around the cells by 'rpp' and 'sph'.
 
         Example:
         new_obj = objet.Extract([3, 4, 5])
-        new_obj = objet.Extract([3, 4, 5], radius = 10e2) # set bounding shere radius to 10m
+        new_obj = objet.Extract([3, 4, 5], bound = 'sph', margin = 5.)
+        new_obj = objet.Extract([3, 4, 5], bound = 'radius', radius = 10e2) # set bounding shere radius to 10m
         new_obj = objet.Extract(range(3,1000))
         new_obj = objet.Extract([3, 4, 5],mode='subtract')
         """
@@ -679,6 +1153,9 @@ class go:
         if mode != 'extract' and mode != 'subtract':
             print(f"Extract: Error, unknown input 'mode' ({mode} ?), default mode chosen.")
             mode = 'extract'
+        if bound not in ('rpp','sph','radius'):
+            print("Extract: Warning, unknown input for 'bound', default mode chosen")
+            bound = 'rpp'
 
         # Construction of the list of cells
         tiListeCellNew = list()
@@ -692,10 +1169,19 @@ class go:
                 if iNum not in tiListeInputCell:
                     tiListeCellNew.append(iNum)
 
+        # Cells of the universes needed by the extracted cells
+        tiListeCellDep = tk.GetFillDependencies(self._dictElem, tiListeCellNew)
+
         # Extraction of the cells of interest
         lsLignes = deepcopy(self._dictElem["fich"])
         dictGroupes = deepcopy(self._dictElem["groups"])
-        dictNew = tk.Extract(lsLignes, tiListeCellNew, radius, dictGroupes = dictGroupes)
+        dictCellBox = dict()
+        if bound != 'radius':
+            npBox = tk.CellBBoxes(self._dictElem)
+            for iCell,i in enumerate(self._dictElem["cell"]):
+                dictCellBox[tk.GetCellNum(self._dictElem["fich"][i][0])] = npBox[iCell]
+        dictNew = tk.Extract(lsLignes, tiListeCellDep, radius, dictGroupes = dictGroupes,
+                             dictCellBox = dictCellBox, sBound = bound, dMargin = margin)
 
         # Creation of the new object
         NewElem = object.__new__(go)
@@ -706,18 +1192,22 @@ class go:
         # Autre attribut
         NewElem.geom = 'Extract of cells ' + str(tiListeCellNew) + ' from ' + self.geom
         NewElem._InGeom = list()
+        NewElem._InParts = list()
+        NewElem._Reserve = None
         NewElem._Trans = self.GetTr()
         NewElem._tiNumTally = dict()
         for s in MCNP_FIRST_TALLY.keys():
             self._tiNumTally[s] = list()
         NewElem._tiTrTally = list()
         NewElem._FctTrans = list()
+        NewElem._Debug('Extract')
 
         return NewElem
 
-    def _InsertMat(self,dictNew,geom):
+    def _InsertMat(self,dictNew,geom,iMatStart=None):
         """
         Function for merging the materials of two files.
+        The new materials are numbered from iMatStart if given (see ReserveRanges).
         Modifies dictNew.
         """
 
@@ -784,6 +1274,9 @@ class go:
         # Liste des matériaux à insérer
         lsMatInsert = list()
 
+        # Allocator of material numbers (self and new)
+        oAllocMat = tk.NumAlloc(dict_tiMatNumberSelf["mat"] + dict_tiMatNumberNew["mat"])
+
         # On parcours les materiaux par numéro
         tiMatNumberFind = list()
         for iNew,iMatNumber in enumerate(dict_tiMatNumberNew["mat"]):
@@ -858,27 +1351,24 @@ class go:
 
             else: # iFlagMatInsert == 1
                 # On choisi un numero et on insere le nouveau materiau
-                if iMatNumber not in dict_tiMatNumberSelf["mat"]:
+                if iMatStart is not None:
+                    # Numero dans le bloc reserve
+                    iMatNumberNew = oAllocMat.Next(iMatStart)
+                    if iMatNumberNew != iMatNumber:
+                        tk.SwapMatNumber(dictNew,iMatNumberNew,iMatNumber)
+                elif iMatNumber not in dict_tiMatNumberSelf["mat"]:
                     iMatNumberNew = iMatNumber
                 else:
-                    iFlagStop = 0
-                    iMatNumberNew = iMatNumber
-                    while iFlagStop == 0:
-                        iMatNumberNew = iMatNumberNew + 1
-
-                        # Si le nouveau numero n'est ni dans lles listes initiales
-                        # de self ou de new, alors a priori aucun risque
-                        if (iMatNumberNew not in dict_tiMatNumberSelf["mat"]) \
-                            and (iMatNumberNew not in dict_tiMatNumberNew["mat"])\
-                            and iMatNumberNew not in tiMatNumberFind:
-
-                            iFlagStop = 1
+                    # Si le nouveau numero n'est ni dans les listes initiales
+                    # de self ou de new, alors a priori aucun risque
+                    iMatNumberNew = oAllocMat.Next(iMatNumber + 1)
 
                     # On change le numero
                     tk.SwapMatNumber(dictNew,iMatNumberNew,iMatNumber)
 
                 # Mise a jour de la liste des matériaux trouvés
                 tiMatNumberFind.append(iMatNumberNew)
+                oAllocMat.Add(iMatNumberNew)
 
                 # Insertion de la carte materiau
                 for sKey in lsKeyMat:
@@ -924,9 +1414,9 @@ class go:
 
         return lsMatFichSelf#, dictNew
 
-    def WriteMCNPFile(self,fichier, imp='in'):
+    def WriteMCNPFile(self,fichier, imp='in', mergetr=False, data=(), split=False, provenance='full'):
         """
-        WriteMCNPFile(filename, imp='in'):
+        WriteMCNPFile(filename, imp='in', mergetr=False, data=(), split=False, provenance='full'):
 
         Writes the object in MCNP format.
         A formatting of the file is performed beforehand.
@@ -935,9 +1425,115 @@ class go:
             imp     : if imp='in' then the 'imp' cards are left on the
                       cell lines,
                       if imp='out', the 'imp' cards are relegated to the card block.
+            mergetr : if True, identical transform cards are merged (see MergeTrCards).
+            data    : list of other cell keywords relegated to the card block
+                      (ex: ['vol','tmp','pwt','wwn']), 'j' is used for the
+                      cells without value.
+            split   : if True, the cells and surfaces of each inserted object
+                      and the material cards are written in separate files,
+                      included with 'read file=' cards in filename
+                      (in the same directory).
+            provenance : history of the inserted objects in the header of
+                      the file, 'full' (whole history), 'summary' (number of
+                      insertions of each file) or 'json' (summary, the whole
+                      history being written in filename + '.json').
+
+        The files are only written if their content changed (the existing
+        files keep their date), through a temporary file renamed at the end.
+        Returns True if a file was written.
 
         Example:
         obj.WriteMCNPFile('myfile')
+        obj.WriteMCNPFile('myfile', mergetr=True)
+        obj.WriteMCNPFile('myfile', imp='out', data=['vol'])
+        obj.WriteMCNPFile('myfile', split=True)
+        obj.WriteMCNPFile('myfile', provenance='json')
+        if obj.WriteMCNPFile('myfile'):
+            print('to be run again')
+        """
+
+        # Verification
+        if provenance not in ('full','summary','json'):
+            print("WriteMCNPFile: Warning, unknown input for 'provenance', default mode chosen")
+            provenance = 'full'
+
+        sSidecar = fichier + '.json' if provenance == 'json' else ''
+        lsFich, dictIdx = self._RenderMCNP(imp, mergetr, data, provenance, os.path.basename(sSidecar))
+        bChanged = False
+        if provenance == 'json':
+            dictProv = {"geom": self.geom, "trans": self._Trans, "fct": self._FctTrans, "children": self._InGeom}
+            sJson = json.dumps(dictProv, indent=1, default=lambda o: o.tolist() if hasattr(o, 'tolist') else str(o))
+            bChanged = tk.WriteIfChanged(sSidecar, sJson + '\n')
+        if split is True:
+            lsFich, bSplit = self._SplitMCNP(fichier, lsFich, dictIdx)
+            bChanged = bChanged or bSplit
+
+        # Ecriture, seulement si le contenu a change
+        bChanged = tk.WriteIfChanged(fichier, [''.join([s + '\n' for s in i]) for i in lsFich]) or bChanged
+
+        return bChanged
+
+    def _SplitMCNP(self, fichier, lsFich, dictIdx):
+        """
+        _SplitMCNP(filename, lsFich, dictIdx):
+
+        Writes the included files of WriteMCNPFile(split=True) and returns
+        the cards of the master file and True if an included file changed.
+        """
+
+        sDir, sName = os.path.split(fichier)
+        sRoot = os.path.splitext(sName)[0]
+        lsPart = getattr(self, '_InParts', list())
+
+        # Blocks of entries to move: (first, last, include file)
+        lsBlock = list()
+        for sKey,iStart,sExt in (("cell", 1, 'cell'), ("surf", dictIdx["saut"][0]+1, 'surf')):
+            tiIdx = dictIdx[sKey]
+            iNb = 0
+            for k,lsInfo in enumerate(lsPart):
+                iNb = iNb + lsInfo[1 if sKey == "cell" else 2]
+                if iNb > len(tiIdx) - (2 if sKey == "cell" else 0):
+                    # The object was modified, the remaining cards stay in the master file
+                    break
+                if iNb > 0 and tiIdx[iNb-1] >= iStart:
+                    sGeom = os.path.splitext(os.path.basename(lsInfo[0]))[0]
+                    lsBlock.append((iStart, tiIdx[iNb-1], f"{sRoot}_{len(lsPart)-k}_{sGeom}.{sExt}"))
+                    iStart = tiIdx[iNb-1] + 1
+
+        # Material cards with their comments
+        tiMat = list()
+        for i in dictIdx["matall"]:
+            j = i
+            while j-1 > dictIdx["saut"][1] and j-1 not in tiMat and tk.IsComment(lsFich[j-1][0]):
+                j = j - 1
+            tiMat.extend(range(j, i+1))
+        if len(tiMat) > 0:
+            lsBlock.append((tiMat[0], tiMat[-1], f"{sRoot}.mat", tiMat))
+
+        # Writing of the included files, the first entry of each block is
+        # replaced by the read card
+        dictRead = dict()
+        setRemoved = set()
+        bChanged = False
+        for tBlock in lsBlock:
+            tiBlock = tBlock[3] if len(tBlock) > 3 else range(tBlock[0], tBlock[1]+1)
+            lsText = [''.join([s + '\n' for s in lsFich[i]]) for i in tiBlock]
+            bChanged = tk.WriteIfChanged(os.path.join(sDir, tBlock[2]), lsText) or bChanged
+            dictRead[tiBlock[0]] = [f"read file={tBlock[2]}"]
+            setRemoved.update(tiBlock)
+
+        lsMaster = [dictRead[i] if i in dictRead else lsCard for i,lsCard in enumerate(lsFich)
+                    if i in dictRead or i not in setRemoved]
+
+        return lsMaster, bChanged
+
+    def _RenderMCNP(self, imp='in', mergetr=False, data=(), provenance='full', sidecar=''):
+        """
+        _RenderMCNP(imp='in', mergetr=False, data=(), provenance='full', sidecar=''):
+
+        Returns the cards of the file written by WriteMCNPFile and the index
+        of the cards: lists "cell", "surf", "matall", "saut" as in LectElem
+        and dictionary "pos" {cell number: index of the card}.
         """
 
         # Copie locale
@@ -946,22 +1542,148 @@ class go:
         # On remplace les trcl constantes par un numero de transfo
         dictElem = tk.SwapCstTrclByNum(dictElemIn, addtr = self._tiTrTally) # Attention la categorie MCNP est detruite par LectElem
 
+        # Merge of identical transform cards
+        if mergetr is True:
+            dictElem = tk.MergeTrCards(dictElem)
+
         # Mise en forme
-        dictElem = tk.FormatImpOut(dictElem, imp=imp)
+        dictElem = tk.FormatImpOut(dictElem, imp=imp, data=data)
 
-        # Insertion des blocs MCNP si présents
+        # Insertion des blocs MCNP si présents (après les cellules)
         if "mcnp" in dictElemIn.keys():
             dictElem["fich"].insert(dictElem["saut"][2],dictElemIn["mcnp"])
 
         # Insertion des infos fichiers
-        sInfo = 'c ' + self.__str__()
+        sInfo = 'c ' + self._Header(provenance, sidecar)
         dictElem["fich"].insert(0,[sInfo.replace('\n','\nc ')])
 
-        # Ecriture
-        with open(fichier,'w') as File:
-            for i in dictElem["fich"]:
-                for s in i:
-                    File.write(s + '\n')
+        # Index of the cards in the file (after the insertions)
+        iMcnp = dictElem["saut"][2] if "mcnp" in dictElemIn.keys() else len(dictElem["fich"])
+        dictIdx = dict()
+        for sKey in ["cell", "surf", "matall", "saut"]:
+            dictIdx[sKey] = [i+1 if i < iMcnp else i+2 for i in dictElem[sKey]]
+        dictIdx["pos"] = {tk.GetCellNum(dictElem["fich"][i][0]): i for i in dictIdx["cell"]}
+
+        return dictElem["fich"], dictIdx
+
+    def WriteMCNPVariants(self, variants, imp='in', mergetr=False, data=()):
+        """
+        WriteMCNPVariants(variants, imp='in', mergetr=False, data=()):
+
+        Writes several variants of the object differing only by the materials
+        of some cells, variants being a dictionary {filename: {cell: (mat, dens)}}
+        (see SwapCellMat). The file is formatted once, then only the cards of
+        the modified cells are rewritten for each variant.
+        The object itself is not modified. The options are those of WriteMCNPFile.
+        As with WriteMCNPFile, the unchanged files are not written again.
+        Returns the list of the files written.
+
+        Example:
+        obj.WriteMCNPVariants({'lead.i': {10: (82,11.35)}, 'steel.i': {10: (26,7.9)}})
+        obj.WriteMCNPVariants({f'al_{d}.i': dict.fromkeys(obj.Select(mat=13), (-1,d)) for d in (2.6,2.7)})
+        """
+
+        # Rendu unique
+        lsFich, dictIdx = self._RenderMCNP(imp, mergetr, data)
+        dictPos = dictIdx["pos"]
+        lsText = [''.join([s + '\n' for s in lsCard]) for lsCard in lsFich]
+
+        lsWritten = list()
+        for fichier,dictVariant in variants.items():
+            dictMap = self._MatMapping(dictVariant, 0, 0, 'WriteMCNPVariants')
+            if dictMap is None:
+                continue
+
+            # Only the modified cells are rewritten
+            lsOut = list(lsText)
+            for iCell,(iMat,dDens) in dictMap.items():
+                if iCell not in dictPos:
+                    print(f"WriteMCNPVariants: Warning, cell {iCell} is not part of the object: " + self.geom)
+                    continue
+                lsCard = tk.FormatCellCard(tk.SwapCardMat(lsFich[dictPos[iCell]], iMat, dDens))
+                lsOut[dictPos[iCell]] = ''.join([s + '\n' for s in lsCard])
+
+            if tk.WriteIfChanged(fichier, lsOut):
+                lsWritten.append(fichier)
+
+        return lsWritten
+
+    def RenderTemplate(self, slots, imp='in', mergetr=False, data=()):
+        """
+        RenderTemplate(slots, imp='in', mergetr=False, data=()):
+
+        Formats the file once (as WriteMCNPFile) and returns a DeckTemplate
+        whose Emit method writes variants of it, only the named slots being
+        rendered again. slots is a dictionary {name: slot}, slot being:
+            ('cell', num)          : material and density of a cell, value (mat, dens)
+                                     as in SwapCellMat
+            ('tr', num)            : transform card, value [dx,dy,dz(,matrix)(,m)]
+            ('*tr', num)           : same with a matrix in degrees
+            ('card', name)         : whole data card (ex: 'sdef', 'nps'), value
+                                     a string or a list of lines
+            ('card', name, key)    : value of a keyword of a data card (ex: 'erg'),
+                                     value a number, a string or a list
+
+        Example:
+        tpl = obj.RenderTemplate({'pos': ('tr', 5), 'erg': ('card', 'sdef', 'erg'), 'al': ('cell', 3)})
+        tpl.Emit('run1.i', pos=[0,0,10], erg=14.1, al=(13,2.65))
+        """
+
+        lsFich, dictIdx = self._RenderMCNP(imp, mergetr, data)
+        setMat = set([tk.GetLineNum(self._dictElem["fich"][i][0]) for i in self._dictElem["mat"]])
+
+        return DeckTemplate(lsFich, dictIdx["pos"], slots, setMat, self.geom)
+
+    def Save(self, fichier):
+        """
+        Save(filename):
+
+        Saves the whole object (cells, surfaces, cards, groups, transforms and
+        list of inserted files) in a binary file, read back by go.Load.
+        This is much faster than WriteMCNPFile followed by go(filename), and
+        no information is lost. filename can also be a binary file object.
+
+        Example:
+        obj.Save('myobject.mgo')
+        obj2 = go.Load('myobject.mgo')
+        """
+
+        dictMeta = {sKey: value for sKey,value in vars(self).items() if sKey not in ('_dictElem','_CellIndex','_CellPos')}
+        if isinstance(fichier, str):
+            with open(fichier,'wb') as fid:
+                tk.SaveElem(fid, self._dictElem, dictMeta)
+        else:
+            tk.SaveElem(fichier, self._dictElem, dictMeta)
+
+    @classmethod
+    def Load(cls, fichier):
+        """
+        Load(filename):
+
+        Creates an object from a file written by Save,
+        returns None if the file is not valid.
+        filename can also be a binary file object.
+
+        Example:
+        obj = go.Load('myobject.mgo')
+        """
+
+        if isinstance(fichier, str):
+            with open(fichier,'rb') as fid:
+                res = tk.LoadElem(fid)
+        else:
+            res = tk.LoadElem(fichier)
+        if res is None:
+            print(f"Load: Warning, {fichier} could not be read.")
+            return None
+
+        obj = cls.__new__(cls)
+        dictElem, dictMeta = res
+        for sKey,value in dictMeta.items():
+            setattr(obj, sKey, value)
+        obj._dictElem = dictElem
+
+        return obj
 
     def ResolveTRCL(self):
         """
@@ -971,7 +1693,10 @@ class go:
         cards that poses problem if surfaces numbers are >= 1000 or if generated
         surfaces numbers already exist.
 
-        If one call to the function is not enough, you may call it several times.
+        The cells are read once, the new numbers are all chosen among the free
+        numbers and the renumbering is done in a single pass.
+        Returns True, or False without any change if there are not enough free
+        numbers below 1000 for the surfaces or the cells.
 
         Note: MCNP manual states that cell numbers with trcl cards should not be
         >= 1000, but in practice, that does not seem to be a problem. It also
@@ -982,148 +1707,86 @@ class go:
         obj.ResolveTRCL()
         """
 
-        # Init
-        iOK = 0
-        bOK_1 = False
-        bOK_2 = False
-        dictElemBoucle = deepcopy(self._dictElem)
-
-        # Boucles successives to cover all cases
-        for iDict in range(10):
-            # Init
-            tiCellRenumUnique = list()
-            tiCellRenum = list()
-            tiSurfRenum = list()
-            tiCellInLine = list()
-            tiLNCellTrcl = list()
-
-            # On parcourt les cellules
-            tiCell = deepcopy(dictElemBoucle["cell"])
-            for iLigne in tiCell:
-
-                # Interpretation de la ligne
-                dictCell = tk.GatherCellGeo(dictElemBoucle["fich"][iLigne])
-
-                # For trcl cards
-                if "trcl" in ' '.join(dictCell["strfin"]).lower():
-                    tiLNCellTrcl.append(iLigne)
-
-                    # On collecte la cellule si >= 1000
-                    # This is according to MCNP manual but does not seem to be
-                    # necessary
-                    iCellNum = dictCell["num"][0]
-                    if iCellNum >= 1000 and iCellNum not in tiCellRenum:
-                        tiCellRenum.append(iCellNum)
-
-                    # On collecte les surfaces >= 1000
-                    for i in dictCell["surf"]:
-                        iSurf = abs(int(i))
-                        if iSurf >= 1000 and iSurf not in tiSurfRenum:
-                            tiSurfRenum.append(abs(int(i)))
-
-                    # On memorise les cellules concernees par les likes
-                    # if "like" in sSubLineSum.lower():
-                    #     tiCellLikeLine.extend(dictCell["cell"])
-                    tiCellInLine.extend(dictCell["cell"])
-
-
-            # Traitements des likes
-            if len(tiCellInLine) > 0:
-                for iLigne in tiCell:
-
-                    # Numero de cellule
-                    iCellNum = tk.GetCellNum(dictElemBoucle["fich"][iLigne][0])
-
-                    if iCellNum in tiCellInLine:
-                        # Interpretation de la ligne
-                        dictCell = tk.GatherCellGeo(dictElemBoucle["fich"][iLigne])
-
-                        # On collecte les surfaces > 1000
-                        for i in dictCell["surf"]:
-                            iSurf = abs(int(i))
-                            if iSurf >= 1000 and iSurf not in tiSurfRenum:
-                                tiSurfRenum.append(abs(int(i)))
-
-            # Renumerotation des surfaces
-            if len(tiCellRenum) > 0 or len(tiSurfRenum) > 0:
-
-                # Re-numbering
-                dictOut = tk.Renum(dictElemBoucle,\
-                                   tiCellRenum, 1,\
-                                   tiSurfRenum, 1,\
-                                       -1)
-
-                dictElemBoucle = deepcopy(tk.LectElem(dictOut["fich"]))
-            else:
-                bOK_1 = True
-
-
-            # Now checking if there are conflicts with generated surfaces and
-            # cells
-
-            # Liste des surfaces
-            tiFoundSurf = list()
-            for iLigne in dictElemBoucle["surf"]:
-                tiFoundSurf.append(tk.GetLineNum(dictElemBoucle["fich"][iLigne][0]))
-
-            # List of surfaces within cells
-            lSurfInCells = list()
-            tiSurfInCellsIndex = list()
-            for iLigne in dictElemBoucle["cell"]:
-                # Interpretation de la ligne
-                dictCell = tk.GatherCellGeo(dictElemBoucle["fich"][iLigne])
-
-                tiSurfInCellsIndex.append(dictCell["num"][0])
-                lSurfInCells.append([abs(int(i)) for i in dictCell["surf"]])
-
-            # Check de l'unicité des surfaces
-            for iLigne in tiLNCellTrcl:
-
-                # Interpretation de la ligne
-                dictCell = tk.GatherCellGeo(dictElemBoucle["fich"][iLigne])
-
-                # Surface en plus de la cellule
-                tiSurfMore = list()
-                for i in dictCell["cell"]:
-                    tiSurfMore.extend(lSurfInCells[tiSurfInCellsIndex.index(i)])
-
-                # Parcours des surfaces de la cellule
-                for i in dictCell["surf"] + tiSurfMore:
-                    iS = abs(int(i))
-                    iC = dictCell["num"][0]
-                    iSGen = iS + 1000*iC
-                    if iSGen in tiFoundSurf:
-                        # Problem, generated surface already exists
-                        tiCellRenumUnique.append(iC)
-
-            # Renumerotation
-            if len(tiCellRenumUnique) > 0:
-                # We choose to renumber from this
-                iCellStart = min(tiCellRenumUnique)+1
-
-                # Re-numbering
-                dictOut = tk.Renum(dictElemBoucle,\
-                                   tiCellRenumUnique, iCellStart,\
-                                       [], 1, -1) # don't renumber surfaces
-
-                dictElemBoucle = deepcopy(tk.LectElem(dictOut["fich"]))
-            else:
-                bOK_2 = True
-
-            # Check if a solution has been found
-            if bOK_1 and bOK_2:
-                self._dictElem = deepcopy(dictElemBoucle)
-                iOK = 1
-                break
-
+        def _Conflict(tiSurf, iCellNum, tiSurfFinal):
+            # Surface generated by the trcl (surface + 1000*cell) already exists
+            for iS in tiSurf:
+                if iS + 1000*iCellNum in tiSurfFinal:
+                    return True
+            return False
 
-        # Si pas de solution
-        if iOK == 0:
-            print("ResolveTRCL: No solution found after 10 tries. Try to run ResolveTRCL multiple times.")
+        # Init
+        dictElem = self._dictElem
+        dictCellSurf = dict()
+        dictCellRef = dict()
+        tiCellTrcl = list()
+
+        # Single reading of the cells
+        for iLigne in dictElem["cell"]:
+            dictCell = tk.GatherCellGeo(dictElem["fich"][iLigne])
+            iCellNum = dictCell["num"][0]
+            dictCellSurf[iCellNum] = set([abs(int(i)) for i in dictCell["surf"]])
+            dictCellRef[iCellNum] = dictCell["cell"]
+
+            # For trcl cards
+            if "trcl" in ' '.join(dictCell["strfin"]).lower():
+                tiCellTrcl.append(iCellNum)
+
+        # Surfaces of the trcl cells, with the ones of the cells in # and like
+        dictTrclSurf = dict()
+        for iCellNum in tiCellTrcl:
+            tiSurf = set(dictCellSurf[iCellNum])
+            for i in dictCellRef[iCellNum]:
+                tiSurf.update(dictCellSurf.get(i,set()))
+            dictTrclSurf[iCellNum] = tiSurf
+
+        # Surfaces >= 1000 are moved to free numbers < 1000
+        tiSurfFound = [tk.GetLineNum(dictElem["fich"][i][0]) for i in dictElem["surf"]]
+        oAllocSurf = tk.NumAlloc(tiSurfFound)
+        dictSurfMap = dict()
+        for iSurf in sorted(set().union(*dictTrclSurf.values())):
+            if iSurf >= 1000:
+                iSurfRep = oAllocSurf.Next()
+                if iSurfRep >= 1000:
+                    print('ResolveTRCL: Error, no free surface number < 1000 for surface {}, nothing is renumbered.'.format(iSurf))
+                    return False
+                dictSurfMap[iSurf] = iSurfRep
+
+        # Final surfaces
+        tiSurfFinal = set([dictSurfMap.get(i,i) for i in tiSurfFound])
+        for iCellNum in tiCellTrcl:
+            dictTrclSurf[iCellNum] = set([dictSurfMap.get(i,i) for i in dictTrclSurf[iCellNum]])
+
+        # Cells >= 1000 or whose generated surfaces already exist
+        oAllocCell = tk.NumAlloc(dictCellSurf.keys())
+        dictCellMap = dict()
+        for iCellNum in sorted(tiCellTrcl):
+            if iCellNum < 1000 and not _Conflict(dictTrclSurf[iCellNum], iCellNum, tiSurfFinal):
+                continue
+
+            # First free number without conflict, the others are given back
+            tiReject = list()
+            iCellRep = oAllocCell.Next()
+            while iCellRep < 1000 and _Conflict(dictTrclSurf[iCellNum], iCellRep, tiSurfFinal):
+                tiReject.append(iCellRep)
+                iCellRep = oAllocCell.Next()
+            if iCellRep >= 1000:
+                print('ResolveTRCL: Error, no free cell number < 1000 for cell {}, nothing is renumbered.'.format(iCellNum))
+                return False
+            for i in tiReject:
+                oAllocCell.Remove(i)
+            dictCellMap[iCellNum] = iCellRep
 
-        return
+        # Re-numbering
+        if len(dictCellMap) > 0 or len(dictSurfMap) > 0:
+            dictOut = tk.RenumMap(dictElem, dictCellMap, dictSurfMap)
+            dictElemOut = tk.LectElem(dictOut["fich"])
 
+            # The "mcnp" category is not read by LectElem
+            if "mcnp" in dictElem.keys():
+                dictElemOut["mcnp"] = dictElem["mcnp"]
+            self._dictElem = dictElemOut
 
+        return True
 
     def Translat(self, trans, comment=''):
         """
@@ -1370,6 +2033,217 @@ class go:
 
 
 
+    def Select(self, cells=None, mat=None, dens=None, imp=None, univ=None, group=None, comment=None, surf=None, bbox=None):
+        """
+        Select(cells=None, mat=None, dens=None, imp=None, univ=None, group=None, comment=None, surf=None, bbox=None):
+
+        Returns the sorted list of the numbers of the cells matching all the
+        given criteria:
+            cells   : cells among which to select
+            mat     : material number or list (0 for void)
+            dens    : density range (min, max) as written in the cell cards
+                      (negative for g/cm3)
+            imp     : importance, {particle: value} or a value for any particle
+            univ    : universe number or list (0 for the cells outside universes)
+            group   : name or list of names of groups
+            comment : regular expression searched in the comments of the cells
+            surf    : surface number or list, cells whose geometry uses it
+            bbox    : box [xmin,xmax,ymin,ymax,zmin,zmax], cells whose bounding
+                      box intersects it (the boxes are conservative, a cell may
+                      be selected without being in the box)
+
+        The indexes of the cells are built at the first call after a
+        modification of the object, the results can be combined as sets.
+
+        Example:
+        obj.Select(mat=13)
+        obj.Select(mat=[13,14], dens=(-3,-2))
+        obj.Select(imp={'n': 0})
+        obj.Select(comment='lead|steel', univ=0)
+        obj.SwapCellMat(obj.Select(group='ccd', mat=6), mat=0)
+        set(obj.Select(surf=4)) - set(obj.Select(bbox=[-10,10,-10,10,-10,10]))
+        """
+
+        dictIndex = self._GetCellIndex()
+        npNum = dictIndex["num"]
+        bSel = np.ones(len(npNum), dtype=bool)
+
+        def _List(value):
+            if isinstance(value, (int, np.integer, str)):
+                return [value]
+            return list(value)
+
+        def _Pos(dictBy, value):
+            bRes = np.zeros(len(npNum), dtype=bool)
+            for iKey in _List(value):
+                bRes[dictBy.get(iKey, np.array([],dtype=int))] = True
+            return bRes
+
+        if cells is not None:
+            bSel = bSel & np.isin(npNum, _List(cells))
+        if mat is not None:
+            bSel = bSel & _Pos(dictIndex["bymat"], mat)
+        if univ is not None:
+            bSel = bSel & _Pos(dictIndex["byuniv"], univ)
+        if surf is not None:
+            bSel = bSel & _Pos(dictIndex["bysurf"], surf)
+        if dens is not None:
+            bSel = bSel & (dictIndex["dens"] >= min(dens)) & (dictIndex["dens"] <= max(dens))
+        if imp is not None:
+            if isinstance(imp, dict):
+                for sPart,dValue in imp.items():
+                    if sPart.lower() not in dictIndex["imp"]:
+                        return []
+                    bSel = bSel & (dictIndex["imp"][sPart.lower()] == dValue)
+            else:
+                bImp = np.zeros(len(npNum), dtype=bool)
+                for npImp in dictIndex["imp"].values():
+                    bImp = bImp | (npImp == imp)
+                bSel = bSel & bImp
+        if group is not None:
+            tiCell = list()
+            for sGroup in _List(group):
+                dictGroup = self._dictElem["groups"].get(sGroup, dict())
+                if isinstance(dictGroup, dict):
+                    tiCell.extend(dictGroup.get("cell", []))
+            bSel = bSel & np.isin(npNum, tiCell)
+        if comment is not None:
+            oRegex = re.compile(comment)
+            bSel = bSel & np.array([oRegex.search(s) is not None for s in dictIndex["com"]], dtype=bool)
+        if bbox is not None:
+            if "bbox" not in dictIndex:
+                dictIndex["bbox"] = tk.CellBBoxes(self._dictElem)
+            npBox = dictIndex["bbox"]
+            for i in range(3):
+                bSel = bSel & (npBox[:,2*i] <= bbox[2*i+1]) & (npBox[:,2*i+1] >= bbox[2*i])
+
+        return sorted(npNum[bSel].tolist())
+
+    def _GetCellIndex(self):
+        """
+        Index of the cells (see mctk.BuildCellIndex), rebuilt if the object
+        was modified.
+        """
+
+        oCache = getattr(self, '_CellIndex', None)
+        if oCache is None or oCache[0] is not self._dictElem:
+            self._CellIndex = (self._dictElem, tk.BuildCellIndex(self._dictElem))
+
+        return self._CellIndex[1]
+
+    def EstimateVolumes(self, cells=None, n=100000, workers=1, tol=0.01, seed=0, write=False):
+        """
+        EstimateVolumes(cells=None, n=100000, workers=1, tol=0.01, seed=0, write=False):
+
+        Monte Carlo estimation of the volumes of the cells (cm3), for the cells
+        too complex for the volume calculation of MCNP.
+        For each cell, points are sampled uniformly in its bounding box (the
+        box of all the cells if it is not bounded) and classified with the
+        geometry of the cell, by chunks of points, until the relative standard
+        deviation is below tol or n points are reached.
+        The results only depend on seed, whatever the number of processes
+        (workers). With workers > 1, a script calling EstimateVolumes must be
+        protected by if __name__ == '__main__': (processes started with spawn,
+        ex: Windows, macOS).
+        By default all the cells outside universes except the graveyard.
+        The cells in universes, the facets of macrobodies and some surfaces
+        (ell, rec, rhp, wed, arb, planes by points) are not treated.
+
+        Returns {cell: (volume, standard deviation)}, the volume being NaN if
+        the cell is not treated.
+        If write is True, the volumes are written in the cells (vol=), use
+        WriteMCNPFile(..., data=['vol']) to get a VOL card.
+
+        Example:
+        dictVol = obj.EstimateVolumes()
+        dictVol = obj.EstimateVolumes(cells=[3,4], n=10**6, tol=0.001, workers=4)
+        obj.EstimateVolumes(write=True)
+        obj.WriteMCNPFile('myfile', data=['vol'])
+        """
+
+        dictElem = self._dictElem
+        lsCard = dictElem["fich"]
+        oIndex = self._GetCellIndex()
+        tiNum = oIndex["num"].tolist()
+
+        # Cells
+        if cells is None:
+            tiCell = [iNum for iNum,iUniv in zip(tiNum[:-1], oIndex["univ"][:-1]) if iUniv == 0]
+        else:
+            tiCell = list(cells)
+            for iCell in tiCell:
+                if iCell not in tiNum:
+                    print(f"EstimateVolumes: Error, unknown cell ({iCell} ?).")
+                    sys.exit()
+
+        # Boxes of the cells, box of all the cells if not bounded
+        npBox = tk.CellBBoxes(dictElem)
+        dictPos = {iNum: i for i,iNum in enumerate(tiNum)}
+        bFinite = np.all(np.isfinite(npBox), axis=1) & (oIndex["univ"] == 0)
+        npAll = np.full(6, np.nan)
+        if np.any(bFinite):
+            npAll[0::2] = npBox[bFinite][:,0::2].min(axis=0)
+            npAll[1::2] = npBox[bFinite][:,1::2].max(axis=0)
+
+        lsTask = list()
+        tiSkip = list()
+        for iCell in tiCell:
+            npCellBox = npBox[dictPos[iCell]]
+            if not np.all(np.isfinite(npCellBox)):
+                npCellBox = npAll
+            if oIndex["univ"][dictPos[iCell]] != 0 or not np.all(np.isfinite(npCellBox)):
+                tiSkip.append(iCell)
+            elif np.any(npCellBox[0::2] >= npCellBox[1::2]):
+                lsTask.append((iCell, None))
+            else:
+                lsTask.append((iCell, npCellBox))
+
+        # Estimation, the cells are shared between the processes
+        dictCSG = tk.BuildCSG(dictElem)
+        lsRun = [(iCell, npCellBox) for iCell,npCellBox in lsTask if npCellBox is not None]
+        dictRes = dict()
+        if workers == 1 or len(lsRun) <= 1:
+            dictRes.update(tk.SampleVolumes(dictCSG, lsRun, n, tol, seed))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                lsFut = [pool.submit(tk.SampleVolumes, dictCSG, lsRun[i::workers], n, tol, seed) for i in range(workers)]
+                for oFut in lsFut:
+                    dictRes.update(oFut.result())
+
+        res = dict()
+        for iCell,npCellBox in lsTask:
+            if npCellBox is None:
+                # Empty box
+                res[iCell] = (0., 0.)
+            else:
+                res[iCell] = dictRes[iCell][0:2]
+                if np.isnan(res[iCell][0]):
+                    tiSkip.append(iCell)
+        for iCell in tiSkip:
+            res[iCell] = (np.nan, np.nan)
+        if len(tiSkip) > 0:
+            print(f"EstimateVolumes: Warning, volume not estimated for the cells {sorted(tiSkip)}.")
+
+        # Writing of the volumes in the cells
+        if write is True:
+            lsFich = deepcopy(lsCard)
+            for iCell,(dVol,dStd) in res.items():
+                if np.isnan(dVol):
+                    continue
+                lsLine = lsFich[dictElem["cell"][dictPos[iCell]]]
+                for j,sLine in enumerate(lsLine):
+                    if not tk.IsComment(sLine):
+                        iComm = sLine.find('$') if '$' in sLine else len(sLine)
+                        lsLine[j] = re.sub(r"(?:^|\s)vol\s*=\s*\S+", '', sLine[:iComm], flags=re.IGNORECASE) + sLine[iComm:]
+                tk.AddCellKeyWord(lsLine, f"vol={dVol:.4e}")
+
+            dictElemNew = tk.LectElem(lsFich)
+            if "mcnp" in dictElem.keys():
+                dictElemNew["mcnp"] = dictElem["mcnp"]
+            self._dictElem = dictElemNew
+
+        return {iCell: res[iCell] for iCell in tiCell}
+
     def SwapCellMat(self, num_cell, mat=0, dens=0):
         """
         SwapCellMat(num_cell, mat=0, dens=0):
@@ -1379,72 +2253,80 @@ class go:
 
         If mat = -1, then only the density is changed while keeping the same material.
 
+        num_cell can also be a dictionary {cell: (mat, dens)}, each cell
+        getting its own material. All the cells are modified in one pass.
+
         Example:
             obj.SwapCellMat(95) # the cell 95 will be made of void
             obj.SwapCellMat([100,135,300])
             obj.SwapCellMat([100,135,300],mat=0) # cells replaced by void
             obj.SwapCellMat([100,135,300],mat=-1,dens=2.5) # changing the densities to 2.5g/cm3
+            obj.SwapCellMat({100: (13,2.7), 135: (0,0), 300: (-1,7.8)})
+            obj.SwapCellMat(obj.Select(mat=13), mat=26, dens=7.9)
 
         Remark:
-            Does not work on cells of type "like ... but"
+            For cells of type "like ... but", the mat= and rho= keywords are rewritten.
         """
 
         # Verification
-        if type(num_cell) is int:
-            num_cell = [num_cell]
-        elif type(num_cell) is range:
-            num_cell = list(num_cell)
-
-        # If materiau vide
-        if mat == 0 or dens == 0:
-            mat = 0
-            dens = 0
-        elif mat > 0 :
-            # On commence par rassembler la liste des cartes materiaux de l'objet
-            liMat = list()
-            for i in self._dictElem["mat"]:
-                liMat.append(tk.GetLineNum(self._dictElem["fich"][i][0]))
+        dictMap = self._MatMapping(num_cell, mat, dens, 'SwapCellMat')
+        if dictMap is None:
+            return
 
-            # Verification
-            if mat not in liMat:
-                print("SwapCellMat: Error, material card does not belong to the object: " + self.geom)
-                return
+        # Position of the cells
+        dictPos = self._GetCellPos()
+        liFound = [iCell for iCell in dictMap.keys() if iCell in dictPos]
+        if len(liFound) == 0:
+            print("SwapCellMat: Error, none of the cells are part of the object: " + self.geom)
+            return
 
-        # On cherche la cellule en question
-        iOK = 0
-        for i in self._dictElem["cell"]:
-            # Ligne courante
-            sLigne = self._dictElem["fich"][i][0]
+        # Modification of the cards
+        lsFich = self._dictElem["fich"]
+        for iCell in liFound:
+            i = dictPos[iCell]
+            lsFich[i] = tk.SwapCardMat(lsFich[i], *dictMap[iCell])
 
-            # Numero de la cellule
-            iCell = tk.GetCellNum(sLigne)
-            if iCell in num_cell:
-                iOK = 1
+        # The cells were modified in place
+        self._CellIndex = None
 
-                # Information sur la cellule
-                dictCell = tk.GetCellGeo(sLigne)
+        return
 
-                # Si dictCell["mat"][0] == -1 alors la cellule est un like ... but
-                if dictCell["mat"][0] >= 0:
+    def _MatMapping(self, num_cell, mat, dens, sCaller):
+        """
+        _MatMapping(num_cell, mat, dens, sCaller):
 
-                    # Si vide
-                    if mat == 0:
-                        sMat = ' 0 '
-                    elif mat == -1:
-                        sMat = ' ' + str(dictCell["mat"][0]) + ' -' + str(abs(dens)) + ' '
-                    else:
-                        sMat = ' ' + str(mat) + ' -' + str(abs(dens)) + ' '
+        Returns the dictionary {cell: (mat, dens)} of a SwapCellMat input,
+        None if a material does not belong to the object.
+        """
 
-                    # Reconstruction en changeant le materiau
-                    self._dictElem["fich"][i][0] = str(dictCell["num"]) + sMat \
-                     + dictCell["strgeo"] + ' ' + dictCell["strfin"] + ' ' + dictCell["strcom"]
+        dictMap = tk.MatMapping(num_cell, mat, dens)
 
+        # Verification of the material cards
+        setMat = set([iMat for iMat,dDens in dictMap.values() if iMat > 0])
+        if len(setMat) > 0:
+            setMat = setMat - set([tk.GetLineNum(self._dictElem["fich"][i][0]) for i in self._dictElem["mat"]])
+            if len(setMat) > 0:
+                print(f"{sCaller}: Error, material card {min(setMat)} does not belong to the object: " + self.geom)
+                return None
 
-        if iOK == 0:
-            print("SwapCellMat: Error, none of the cells are part of the object: " + self.geom)
-            return
+        return dictMap
 
-        return
+    def _GetCellPos(self):
+        """
+        _GetCellPos():
+
+        Returns the dictionary {cell number: index of the card}, cached until
+        the cells of the object are replaced.
+        """
+
+        oCache = getattr(self, '_CellPos', None)
+        if oCache is None or oCache[0] is not self._dictElem:
+            dictPos = dict()
+            for i in self._dictElem["cell"]:
+                dictPos[tk.GetCellNum(self._dictElem["fich"][i][0])] = i
+            self._CellPos = (self._dictElem, dictPos)
+
+        return self._CellPos[1]
 
 
     def _CheckMCNPTallyNumber(self,ntal,tallytype,warning = 'on'):
@@ -1492,9 +2374,7 @@ class go:
             elif ntal in self._tiNumTally[tallytype]:
                 if warning == 'on':
                     print("Error, ntal=" + str(ntal) + " is already in use. We pick an other.")
-                ntal = ntal + 10
-                while ntal in self._tiNumTally[tallytype]:
-                    ntal = ntal + 10
+                ntal = self.GetNumAlloc(tallytype).Next(ntal + 10)
                 self._tiNumTally[tallytype].append(ntal)
                 if warning == 'on':
                     print("We choose ntal=" + str(ntal))
@@ -1839,3 +2719,472 @@ class go:
             self._dictElem["mcnp"].extend(lsFile)
 
         return
+
+
+class Assembly:
+    """
+    Class for managing a tree of geometry objects.
+
+    Each node holds a go object, its children are placed with transforms
+    relative to the node and inserted with one of the insertion modes of go.
+    The flat object is computed only when needed (Flatten, WriteMCNPFile) and
+    kept in cache, a modification of a node only invalidates its ancestors.
+    """
+
+    def __init__(self, obj, name=''):
+        # Object of the node
+        self.obj = obj
+        self.name = name
+        if len(self.name) == 0:
+            self.name = obj.geom
+
+        # Children: dicts with keys "node", "transforms", "mode", "options"
+        self._Children = list()
+        self._Parent = None
+
+        # Flat object in cache, None if it has to be computed
+        self._Flat = None
+
+        # Number of flattenings of the node
+        self._iFlatten = 0
+
+    def __str__(self):
+        """
+        Display the tree of the assembly.
+        """
+
+        lsOut = [f"{self.name}" + ('' if self._Flat is None else ' (cached)')]
+        for dictChild in self._Children:
+            sMode = dictChild["mode"]
+            if len(dictChild["transforms"]) > 0:
+                sMode = sMode + f" {dictChild['transforms']}"
+            for i,s in enumerate(str(dictChild["node"]).split('\n')):
+                lsOut.append(("  - " if i == 0 else "    ") + s + (f"  [{sMode}]" if i == 0 else ''))
+
+        return '\n'.join(lsOut)
+
+    def Add(self, Elem, transforms=[], mode='Insert', name='', **options):
+        """
+        Add(Elem, transforms=[], mode='Insert', name='', **options):
+
+        Adds a child to the node, Elem being a go object or an Assembly.
+        mode is the insertion method of go: 'Insert', 'InsertCells' or
+        'InsertInstance', options are passed to this method (location, renum...).
+        For 'Insert' and 'InsertCells', transforms are applied to the child
+        before its insertion (see Transform), for 'InsertInstance' they are the
+        transforms of the copies. In all the modes, a transform can also be a
+        dict {method: arguments} of the transform methods of go (see
+        ApplyTransforms), applied to the child with its own children.
+        Returns the node of the child.
+
+        Example:
+        room = Assembly(go("room.mcnp"))
+        bench = room.Add(go("bench.mcnp"), transforms=[['tr',100,0,0]], location='inside')
+        bench.Add(go("detector.mcnp"), mode='InsertCells')
+        room.Add(go("ccd.mcnp"), transforms=[['tr',0,0,0], ['tr',50,0,0]], mode='InsertInstance')
+        room.Add(bench, transforms=[{'TrRotZ': {'angle': 90}}])
+        """
+
+        # Verification
+        if mode not in ('Insert','InsertCells','InsertInstance'):
+            print(f"Add: Error, unknown insertion mode '{mode}'.")
+            sys.exit()
+
+        if isinstance(Elem, Assembly):
+            oNode = Elem
+            if oNode._Parent is not None:
+                print(f"Add: Error, '{oNode.name}' already belongs to an assembly.")
+                sys.exit()
+        else:
+            oNode = Assembly(Elem, name=name)
+        oNode._Parent = self
+
+        self._Children.append({"node": oNode, "transforms": [t for t in transforms],
+                               "mode": mode, "options": options})
+        self.Invalidate()
+
+        return oNode
+
+    @staticmethod
+    def ApplyTransforms(obj, transforms):
+        """
+        ApplyTransforms(obj, transforms):
+
+        Applies to a go object a list of transforms, each one being the input
+        of Transform or a dict {method: arguments} of the transform methods of
+        go (Translat, TrRotX, TrRotY, TrRotZ, TrEuler, TrRotU, Transform), the
+        arguments being a dict or a list.
+        Returns the object.
+
+        Example:
+        Assembly.ApplyTransforms(obj, [['tr',0,0,100], {'TrRotY': {'trans': [0,400,0], 'angle': 1}}, {'Translat': [60,50,0]}])
+        """
+
+        for tr in transforms:
+            if not isinstance(tr, dict):
+                obj.Transform(tr)
+                continue
+            for sTr,args in tr.items():
+                if isinstance(args, dict):
+                    getattr(obj, sTr)(**args)
+                elif sTr == 'Transform' or sTr == 'Translat':
+                    getattr(obj, sTr)(args)
+                else:
+                    getattr(obj, sTr)(*args)
+
+        return obj
+
+    def Remove(self, node):
+        """
+        Remove(node):
+
+        Removes a child of the node.
+
+        Example:
+        room.Remove(bench)
+        """
+
+        for i,dictChild in enumerate(self._Children):
+            if dictChild["node"] is node:
+                del self._Children[i]
+                node._Parent = None
+                self.Invalidate()
+                return
+
+        print(f"Remove: Warning, '{node.name}' is not a child of '{self.name}'.")
+
+    def SetTransforms(self, transforms):
+        """
+        SetTransforms(transforms):
+
+        Replaces the transforms of the node relative to its parent.
+
+        Example:
+        bench.SetTransforms([['tr',120,0,0]])
+        """
+
+        if self._Parent is None:
+            print(f"SetTransforms: Warning, '{self.name}' has no parent, nothing done.")
+            return
+
+        for dictChild in self._Parent._Children:
+            if dictChild["node"] is self:
+                dictChild["transforms"] = [t for t in transforms]
+        self._Parent.Invalidate()
+
+    def SetObject(self, obj):
+        """
+        SetObject(obj):
+
+        Replaces the go object of the node.
+
+        Example:
+        bench.SetObject(go("bench_v2.mcnp"))
+        """
+
+        self.obj = obj
+        self.Invalidate()
+
+    def Apply(self, sMethod, *args, **kwargs):
+        """
+        Apply(sMethod, *args, **kwargs):
+
+        Calls a method of the go object of the node and invalidates the node.
+        The object can also be modified directly, Invalidate() must then be
+        called.
+
+        Example:
+        detector.Apply('SwapCellMat', 1, mat=5, dens=-2.7)
+        detector.Apply('TrRotZ', angle=90)
+        """
+
+        res = getattr(self.obj, sMethod)(*args, **kwargs)
+        self.Invalidate()
+
+        return res
+
+    def Invalidate(self):
+        """
+        Invalidate():
+
+        Removes the flat object of the node and of its ancestors from the cache.
+        """
+
+        oNode = self
+        while oNode is not None:
+            oNode._Flat = None
+            oNode = oNode._Parent
+
+    def _GetFlat(self):
+        """
+        Returns the flat object of the node, from the cache if possible.
+        The object is shared with the cache and must not be modified.
+        """
+
+        if self._Flat is not None:
+            return self._Flat
+
+        oFlat = deepcopy(self.obj)
+        for dictChild in self._Children:
+            oChild = dictChild["node"]._GetFlat()
+            sMode = dictChild["mode"]
+
+            # Calls of the transform methods, applied to the child with its children
+            lsCall = [t for t in dictChild["transforms"] if isinstance(t, dict)]
+            lsTr = [t for t in dictChild["transforms"] if not isinstance(t, dict)]
+            if len(lsCall) > 0:
+                oChild = Assembly.ApplyTransforms(deepcopy(oChild), lsCall)
+
+            if sMode == 'InsertInstance':
+                oFlat.InsertInstance(oChild, transforms=lsTr, **dictChild["options"])
+                continue
+
+            # Transforms of the child in the frame of the node
+            if len(lsTr) > 0:
+                if len(lsCall) == 0:
+                    oChild = deepcopy(oChild)
+                Assembly.ApplyTransforms(oChild, lsTr)
+            getattr(oFlat, sMode)(oChild, **dictChild["options"])
+
+        self._Flat = oFlat
+        self._iFlatten = self._iFlatten + 1
+
+        return self._Flat
+
+    def Flatten(self):
+        """
+        Flatten():
+
+        Returns the go object of the whole assembly (a copy, which can be
+        modified without changing the assembly).
+
+        Example:
+        obj = room.Flatten()
+        """
+
+        return deepcopy(self._GetFlat())
+
+    def WriteMCNPFile(self, fichier, **kwargs):
+        """
+        WriteMCNPFile(filename, **kwargs):
+
+        Writes the flat object of the assembly in MCNP format,
+        the options are those of go.WriteMCNPFile.
+        Returns True if the file was written (content changed).
+
+        Example:
+        room.WriteMCNPFile('myfile', mergetr=True)
+        """
+
+        return self._GetFlat().WriteMCNPFile(fichier, **kwargs)
+
+
+class DeckTemplate:
+    """
+    Class for writing many variants of a formatted MCNP file, built by
+    go.RenderTemplate.
+
+    The file is kept as fixed chunks of text separated by the cards holding
+    the slots. Emit writes the fixed chunks as they are and renders only the
+    slots, so the cost of a variant is mostly the writing of the file.
+    The template is not modified by Emit.
+    """
+
+    def __init__(self, lsFich, dictPos, slots, setMat, geom=''):
+        # Name of the object
+        self.geom = geom
+
+        # Materials of the object, for the verification of the cell slots
+        self._setMat = frozenset(setMat)
+
+        # Cards of the file: the entries of the cells are kept whole, the
+        # other ones are split in single cards (ex: cards added by AddMCNPCard)
+        setCell = set(dictPos.values())
+        lsUnit = list()
+        dictUnit = dict()
+        for i,lsCard in enumerate(lsFich):
+            dictUnit[i] = len(lsUnit)
+            if i in setCell:
+                lsUnit.append(list(lsCard))
+                continue
+            for j,sLine in enumerate(lsCard):
+                if j == 0 or not sLine[:1].isspace() or len(sLine.strip()) == 0:
+                    lsUnit.append([sLine])
+                else:
+                    lsUnit[-1].append(sLine)
+        dictPos = {iCell: dictUnit[i] for iCell,i in dictPos.items()}
+        lsFich = lsUnit
+
+        # Index of the cards by name (first word) and of the transform cards
+        dictCard = dict()
+        for i,lsCard in enumerate(lsFich):
+            lsData = [sLine for sLine in lsCard if not tk.IsComment(sLine) and len(sLine.split()) > 0]
+            if len(lsData) > 0:
+                dictCard.setdefault(lsData[0].split()[0].lower().lstrip('*'), i)
+
+        # Cards with slots: index -> ('cell'|'tr'|'card', name, ...) or ('keys', pieces)
+        dictSlotCard = dict()
+        self.slots = dict()
+
+        def _CheckFree(i, sName, bKeys=False):
+            # Only the keywords of a data card can share a card
+            tCard = dictSlotCard.get(i)
+            if tCard is None or (bKeys and tCard[0] == 'keys'):
+                return
+            sOther = [p[0] for p in tCard[1] if not isinstance(p, str)][0] if tCard[0] == 'keys' else tCard[1]
+            print(f"RenderTemplate: Error, slots {sOther} and {sName} on the same card of the object: " + geom)
+            sys.exit()
+
+        for sName,tSlot in slots.items():
+            sType = tSlot[0].lower()
+            if sType == 'cell':
+                i = dictPos.get(tSlot[1])
+                if i is not None:
+                    _CheckFree(i, sName)
+                    dictSlotCard[i] = ('cell', sName, tuple(lsFich[i]))
+            elif sType in ('tr','*tr'):
+                i = dictCard.get(f"tr{tSlot[1]}")
+                if i is not None:
+                    _CheckFree(i, sName)
+                    dictSlotCard[i] = (sType, sName, tSlot[1], tuple(lsFich[i]))
+            elif sType == 'card' and len(tSlot) == 2:
+                i = dictCard.get(tSlot[1].lower())
+                if i is not None:
+                    _CheckFree(i, sName)
+                    dictSlotCard[i] = ('card', sName, tuple(lsFich[i]))
+            elif sType == 'card':
+                i = dictCard.get(tSlot[1].lower())
+                if i is not None:
+                    _CheckFree(i, sName, bKeys=True)
+                    tPiece = dictSlotCard.get(i, ('keys', ('\n'.join(lsFich[i]) + '\n',)))
+                    if tPiece[0] != 'keys':
+                        i = None
+                    else:
+                        tPiece = self._SplitKey(tPiece, tSlot[2], sName)
+                        if tPiece is None:
+                            i = None
+                        else:
+                            dictSlotCard[i] = tPiece
+            else:
+                i = None
+
+            if i is None:
+                print(f"RenderTemplate: Error, slot {sName} = {tSlot} not found in the object: " + geom)
+                sys.exit()
+            self.slots[sName] = tuple(tSlot)
+
+        # Chunks: fixed text or card with slots
+        lsChunk = list()
+        lsText = list()
+        for i,lsCard in enumerate(lsFich):
+            if i in dictSlotCard:
+                lsChunk.append(''.join(lsText))
+                lsChunk.append(dictSlotCard[i])
+                lsText = list()
+            else:
+                lsText.extend([sLine + '\n' for sLine in lsCard])
+        lsChunk.append(''.join(lsText))
+        self._Chunks = tuple(lsChunk)
+
+    def __str__(self):
+        """
+        Display the slots of the template.
+        """
+
+        lsOut = [f"Template of {self.geom}, {len(self._Chunks)} chunks"]
+        for sName,tSlot in self.slots.items():
+            lsOut.append(f"  {sName}: {tSlot}")
+
+        return '\n'.join(lsOut)
+
+    @staticmethod
+    def _SplitKey(tPiece, sKey, sName):
+        """
+        Splits the text pieces of a card around the value of a keyword.
+        Returns the new ('keys', pieces), None if the keyword is not found.
+        """
+
+        reKey = re.compile(r"(?i)(?<![\w:*])" + re.escape(sKey) + r"\s*=\s*(.*?)(?=\s+[a-z*][\w:,]*\s*=|\s*\$|\s*$)", re.M)
+        lsPiece = list()
+        bFound = False
+        for piece in tPiece[1]:
+            oMatch = reKey.search(piece) if isinstance(piece, str) and not bFound else None
+            if oMatch is None:
+                lsPiece.append(piece)
+                continue
+            bFound = True
+            lsPiece.extend([piece[:oMatch.start(1)], (sName, oMatch.group(1)), piece[oMatch.end(1):]])
+
+        return ('keys', tuple(lsPiece)) if bFound else None
+
+    def _Render(self, tCard, values):
+        """
+        Returns the text of a card with slots for the given values.
+        """
+
+        sType = tCard[0]
+        if sType == 'keys':
+            lsText = list()
+            bChanged = False
+            for piece in tCard[1]:
+                if isinstance(piece, str):
+                    lsText.append(piece)
+                elif piece[0] in values:
+                    value = values[piece[0]]
+                    lsText.append(' '.join([str(v) for v in value]) if isinstance(value, (list, tuple, np.ndarray)) else str(value))
+                    bChanged = True
+                else:
+                    lsText.append(piece[1])
+            sText = ''.join(lsText)
+            if bChanged:
+                # Lines too long after the substitution
+                lsLine = sText.split('\n')[:-1]
+                if any([len(sLine.split('$')[0].rstrip()) >= 80 for sLine in lsLine]):
+                    sText = ''.join([sLine + '\n' for sLine in tk.CutLongLines(lsLine)])
+            return sText
+
+        if tCard[1] not in values:
+            lsCard = tCard[-1]
+        elif sType == 'cell':
+            lsCard = tk.FormatCellCard(tk.SwapCardMat(list(tCard[2]), *values[tCard[1]]))
+        elif sType in ('tr','*tr'):
+            sTr = f"{sType}{tCard[2]} " + ' '.join([str(v) for v in values[tCard[1]]])
+            lsCard = tk.FormatTrCard(tCard[2], tk.CanonicalTr(tk.ReadTrCard([sTr])))
+        else:
+            value = values[tCard[1]]
+            lsCard = [value] if isinstance(value, str) else list(value)
+
+        return ''.join([sLine + '\n' for sLine in lsCard])
+
+    def Emit(self, fichier, **values):
+        """
+        Emit(filename, **values):
+
+        Writes a variant of the template, values giving the values of the
+        slots by name (see go.RenderTemplate), the other slots keeping the
+        text of the object.
+        As with WriteMCNPFile, the file is only written if its content changed.
+        Returns True if the file was written.
+
+        Example:
+        tpl.Emit('run1.i', pos=[0,0,10], erg=14.1)
+        for i,z in enumerate(range(0,100,5)):
+            tpl.Emit(f'run_{i}.i', pos=[0,0,z])
+        """
+
+        # Verification, void cells as in SwapCellMat
+        values = dict(values)
+        for sName,value in values.items():
+            if sName not in self.slots:
+                print(f"Emit: Error, unknown slot {sName} for the template of: " + self.geom)
+                return
+            if self.slots[sName][0].lower() != 'cell':
+                continue
+            values[sName] = tk.MatMapping(0, *value)[0]
+            if values[sName][0] > 0 and values[sName][0] not in self._setMat:
+                print(f"Emit: Error, material card {values[sName][0]} does not belong to the object: " + self.geom)
+                return
+
+        lsText = [chunk if isinstance(chunk, str) else self._Render(chunk, values) for chunk in self._Chunks]
+
+        return tk.WriteIfChanged(fichier, lsText)
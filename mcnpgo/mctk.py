@@ -4,16 +4,21 @@
 
 # @author Alexandre Friou
 
-import sys,math
+import sys,math,os
 from copy import deepcopy
 import numpy as np
 import json
 import re
+import struct
+import hashlib
 
 # Keywords for cell cards
 tsGCellKeyWords = ('trcl','*trcl','imp:e','imp:p','imp:n','imp','imp:n,p,e','u','fill','*fill','vol',\
     'wwn','pd','elpt','bflcl','unc','lat','nonu','tmp','cosy','pd','dxc','pwt','ext','fcl','$','&')
 
+# Precompiled search of the keywords, the leftmost match is the first keyword of the line
+reGCellKeyWords = re.compile('|'.join([re.escape(s) for s in tsGCellKeyWords]))
+
 # Allowed particles for MX cards
 tsGMxPart = ('n','h','p','t','s','a','d')
 
@@ -22,6 +27,10 @@ tsGMxPart = ('n','h','p','t','s','a','d')
 FORMAT_TR = ".15e"
 ROUND_TR = 14
 
+# Binary format of the saved objects (SaveElem/LoadElem)
+SAVE_MAGIC = b'MCNPGO\x00'
+SAVE_VERSION = 1
+
 def LectElem(lsLignesInput):
     """
     Function to store the file in a dictionary for processing.
@@ -67,6 +76,7 @@ def LectElem(lsLignesInput):
     dictRes["mmcell"] = list()
     dictRes["mmsurf"] = list()
     dictRes["mmtrans"] = list()
+    dictRes["mmuniv"] = list()
     dictRes["groups"] = dict()
 
     # List that contains the output file
@@ -319,6 +329,14 @@ def LectElem(lsLignesInput):
         tiTransMinMax.append(0)
         tiTransMinMax.append(0)
 
+    # First and last universe number, [0, 0] if no universe
+    tiUniv = [GetCellUniv(strFichOut[i]) for i in tiCell]
+    tiUniv = [i for i in tiUniv if i > 0]
+    if len(tiUniv) > 0:
+        tiUnivMinMax = [min(tiUniv), max(tiUniv)]
+    else:
+        tiUnivMinMax = [0, 0]
+
     # Result
     dictRes["fich"] = strFichOut
     dictRes["surf"] = tiSurf
@@ -333,23 +351,36 @@ def LectElem(lsLignesInput):
     dictRes["mmcell"] = tiCellMinMax
     dictRes["mmsurf"] = tiSurfMinMax
     dictRes["mmtrans"] = tiTransMinMax
+    dictRes["mmuniv"] = tiUnivMinMax
     dictRes["groups"] = dictGroupes
     dictRes["ind_groups"] = iGroups
 
     return dictRes
 
-def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf, iStartTrans):
+def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf, iStartTrans, iStartUniv=-1):
     """
     Function to renumber the cells, surfaces and transformations of an input MCNP file.
+    If iStartUniv > 0, all the universes are renumbered from iStartUniv (u=, fill= and groups).
     Does not modify dictElem.
     """
 
+    # Universes
+    # Like the transfos, all the universes are renumbered, in order of appearance
+    if iStartUniv > 0:
+        tiUniv = list()
+        for iIndCell in dictElem["cell"]:
+            iUniv = GetCellUniv(dictElem["fich"][iIndCell])
+            if iUniv > 0 and iUniv not in tiUniv:
+                tiUniv.append(iUniv)
+        dictUnivMap = dict(zip(tiUniv, range(iStartUniv, iStartUniv + len(tiUniv))))
+        dictElem = RenumUniv(dictElem, dictUnivMap)
+
     # Assignment
     strFichOut = deepcopy(dictElem["fich"])
     tiSurf = deepcopy(dictElem["surf"])
     tiCell = deepcopy(dictElem["cell"])
     tiTrans = deepcopy(dictElem["trans"])
-    dictGroupes = deepcopy(dictElem["groups"])
+    oGroups = GroupIndex(dictElem["groups"])
     iGroupes = dictElem["ind_groups"]
 
     # We now work on what we have read
@@ -400,23 +431,7 @@ def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf,
                 strFichOut[iIndSurf][0] = SwapTrSurf(sLine,iNumTrRep)
 
         # We report the change to the groups
-        if len(dictGroupes) > 0:
-            for sKey in dictGroupes.keys():
-                dictTemp = dictGroupes[sKey]
-
-                # If the group has a category transfo
-                if "trans" in dictTemp.keys():
-                    tiTrNew = list()
-                    for iNumTr in dictTemp["trans"]:
-
-                        # We look for the correspondence
-                        iNumTrRep = tiNumTrRep[tiNumTr.index(iNumTr)]
-
-                        # New number
-                        tiTrNew.append(iNumTrRep)
-
-                    # We replace in the group
-                    dictGroupes[sKey]["trans"] = tiTrNew
+        oGroups.Map('trans', dict(zip(tiNumTr,tiNumTrRep)))
 
     # Cells
     if len(tiListeInputCell) > 0:
@@ -436,17 +451,7 @@ def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf,
                 iNumCellRep = iNumCellRep + 1
 
                 # We report the change to the groups
-                if len(dictGroupes) > 0:
-                    for sKey in dictGroupes.keys():
-
-                        # If the group has a cell category
-                        if "cell" in dictGroupes[sKey].keys():
-                            for iCellGroup in range(len(dictGroupes[sKey]["cell"])):
-                                iNumCellGroup = dictGroupes[sKey]["cell"][iCellGroup]
-                                if iNumCellGroup == iNumCell:
-                                    dictGroupes[sKey]["cell"][iCellGroup] = iNumCellRep
-                                elif iNumCellGroup == iNumCellRep:
-                                    dictGroupes[sKey]["cell"][iCellGroup] = iNumCell
+                oGroups.Swap('cell', iNumCell, iNumCellRep)
 
                 # We change the number of the cell
                 sLine = strFichOut[iIndCell][0]
@@ -524,17 +529,7 @@ def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf,
                 iNumSurfRep = iNumSurfRep + 1
 
                 # We report the change to the groups
-                if len(dictGroupes) > 0:
-                    for sKey in dictGroupes.keys():
-
-                        # If the group has a category surf
-                        if "surf" in dictGroupes[sKey].keys():
-                            for iSurfGroup in range(len(dictGroupes[sKey]["surf"])):
-                                iNumSurfGroup = dictGroupes[sKey]["surf"][iSurfGroup]
-                                if iNumSurfGroup == iNumSurf:
-                                    dictGroupes[sKey]["surf"][iSurfGroup] = iNumSurfRep
-                                elif iNumSurfGroup == iNumSurfRep:
-                                    dictGroupes[sKey]["surf"][iSurfGroup] = iNumSurf
+                oGroups.Swap('surf', iNumSurf, iNumSurfRep)
 
                 # Line in progress
                 sLine = strFichOut[iIndSurf][0]
@@ -567,9 +562,10 @@ def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf,
                     sTemp = strFichOut[iIndSurf_Rep][0].lower().split('$')
 
                     if sTemp[0].count('like') == 0:
+                        lsInfoLine = GetCellLinesGeo(strFichOut[iIndSurf_Rep])
                         for jSubLine in range(len(strFichOut[iIndSurf_Rep])):
                             # Recovery of the infos of the line
-                            dictInfoLine = GetCellGeo(strFichOut[iIndSurf_Rep][jSubLine])
+                            dictInfoLine = lsInfoLine[jSubLine]
 
                             # We check if we have to renumber the surfaces
                             if len(dictInfoLine["surf"]) > 0:
@@ -621,41 +617,1679 @@ def Renum(dictElem, tiListeInputCell, iStartCell, tiListeInputSurf, iStartSurf,
                                                 # C'est la bonne surface, on remplace
                                                 sLineCentre = sLineCentre[:i] + sTemp + sLineCentre[i+len(sTempRep):]
 
-                                                # We count the number of replacements made
-                                                iNbReplace = iNbReplace + 1
+                                                # We count the number of replacements made
+                                                iNbReplace = iNbReplace + 1
+
+                                        # Increment
+                                        i = i + 1
+                                # Reconstruction of the line
+                                if iNbReplace > 0:
+                                    ## Formatting to align the line endings
+                                    #sTemp = dictInfoLine["strdeb"] + '  ' + sLineCentre.strip()
+                                    sLineFin = dictInfoLine["strfin"]
+                                    sLineCom = dictInfoLine["strcom"]
+                                    # We complete until we reach column 80
+                                    #sLineFin = sLineFin.rjust(79-len(sTemp)) + '  ' + sLineCom
+                                    #strFichOut[iIndSurf_Rep][jSubLine] = dictInfoLine["strdeb"] + ' ' + sLineCentre.strip() + ' ' + sLineFin
+
+                                    strFichOut[iIndSurf_Rep][jSubLine] = dictInfoLine["strdeb"] + ' ' + sLineCentre.strip() + ' ' + sLineFin.strip() + ' ' + sLineCom.strip()
+
+                            # We note if the line contains keywords
+                            # If yes, the rest of the cell does not contain surfaces
+                            if len(dictInfoLine['strfin']) > 0:
+                                break
+
+    # It should be placed in the reconstruction of the line here, outside the renumbering
+    # The simplest thing is to redo GetCellGeo and update the line one last time with a formatting function
+    # It would be better to pass the strFichOut list as input and the function would handle the rest
+
+    # For the groups, serialized once
+    if len(oGroups) > 0:
+        strFichOut[iGroupes] = oGroups.Dumps()
+
+    # The position of the cells, surfaces and tr remain the same
+    dictOut = deepcopy(dictElem)
+    dictOut["fich"] = deepcopy(strFichOut)
+
+    return dictOut
+
+def RenumGeo(sGeo, dictCellMap, dictSurfMap):
+    """
+    Renumbers the cells (#N) and surfaces of the geometric part of a cell
+    line (see GetCellGeo) with the correspondences {old: new}.
+    Facets of macrobodies (ex: 6.1) are taken into account.
+    """
+
+    def _Repl(oMatch):
+        iNum = int(oMatch.group(2))
+        if oMatch.group(1) == '#':
+            return '#' + str(dictCellMap.get(iNum,iNum))
+        return str(dictSurfMap.get(iNum,iNum))
+
+    return re.sub(r"(?<![\d.#])(#?)(\d+)", _Repl, sGeo)
+
+
+def RenumMap(dictElem, dictCellMap=dict(), dictSurfMap=dict(), dictTransMap=dict(), dictUnivMap=dict()):
+    """
+    Function to renumber the cells, surfaces, transformations and universes
+    of an MCNP object from correspondences {old number: new number}.
+    Numbers that are not in the dictionaries are left unchanged: the new
+    numbers must not collide with them (no interchange is made, unlike Renum).
+    Each card is read only once.
+    Does not modify dictElem.
+    """
+
+    # Universes
+    if len(dictUnivMap) > 0:
+        dictElem = RenumUniv(dictElem, dictUnivMap)
+
+    # Assignment
+    strFichOut = deepcopy(dictElem["fich"])
+    dictGroupes = deepcopy(dictElem["groups"])
+    iGroupes = dictElem["ind_groups"]
+
+    # Transfo
+    if len(dictTransMap) > 0:
+        tiNumTr = GetObjetInfoTr(dictElem)["numtr"]
+        tiNumTrRep = [dictTransMap.get(i,i) for i in tiNumTr]
+
+        # Renumbering of the cards
+        for iIndTr in dictElem["trans"]:
+            sLine = strFichOut[iIndTr][0]
+            iNumTr = GetCardNumber(sLine)
+            if iNumTr in dictTransMap:
+                strFichOut[iIndTr][0] = SwapTrCard(sLine,dictTransMap[iNumTr])
+
+        # We report the change to the cells
+        for iIndCell in dictElem["cell"]:
+            UpdateCellTransform(strFichOut[iIndCell],'fill','num2num',tiNumTrRep,tiNumTr)
+            UpdateCellTransform(strFichOut[iIndCell],'trcl','num2num',tiNumTrRep,tiNumTr)
+
+    # Surfaces
+    for iIndSurf in dictElem["surf"]:
+        sLine = strFichOut[iIndSurf][0]
+        dictInfoSurf = GetSurfGeo(sLine)
+
+        # Transfo of the surface
+        if dictInfoSurf["trans"] in dictTransMap and dictInfoSurf["trans"] > 0:
+            sLine = SwapTrSurf(sLine,dictTransMap[dictInfoSurf["trans"]])
+
+        # Number of the surface, we recopy * or + ...
+        if dictInfoSurf["num"] in dictSurfMap:
+            sSurfBoundary = ''
+            for s in sLine.split()[0]:
+                if s.isdigit() == False:
+                    sSurfBoundary = sSurfBoundary + s
+            sLine = sSurfBoundary + str(dictSurfMap[dictInfoSurf["num"]]) + sLine[sLine.find(' '):]
+
+        strFichOut[iIndSurf][0] = sLine
+
+    # Cells
+    if len(dictCellMap) > 0 or len(dictSurfMap) > 0:
+        for iIndCell in dictElem["cell"]:
+            lsLine = strFichOut[iIndCell]
+
+            # Number of the cell
+            sLine = lsLine[0]
+            iNumCell = GetCellNum(sLine)
+            if iNumCell in dictCellMap:
+                lsLine[0] = str(dictCellMap[iNumCell]) + sLine[sLine.find(' '):]
+
+            # Like ... but
+            iNumLike = GetLikeBut(lsLine[0])
+            if iNumLike is not None:
+                if iNumLike in dictCellMap:
+                    sLine = lsLine[0] + ' '
+                    lsLine[0] = sLine[:sLine.lower().find('like')+4] + ' ' + str(dictCellMap[iNumLike]) + ' ' + sLine[sLine.lower().find('but'):].rstrip()
+                continue
+
+            # Geometric part of the lines
+            for jSubLine in range(len(lsLine)):
+                dictInfoLine = GetCellGeo(lsLine[jSubLine])
+                sGeo = RenumGeo(dictInfoLine["strgeo"], dictCellMap, dictSurfMap)
+                if sGeo != dictInfoLine["strgeo"]:
+                    lsLine[jSubLine] = dictInfoLine["strdeb"] + ' ' + sGeo.strip() + ' ' + dictInfoLine["strfin"].strip() + ' ' + dictInfoLine["strcom"].strip()
+
+                # If the line contains keywords, the rest of the cell does not contain surfaces
+                if len(dictInfoLine['strfin']) > 0:
+                    break
+
+    # For the groups
+    if len(dictGroupes) > 0:
+        for sKey in dictGroupes.keys():
+            for sType, dictMap in [("cell",dictCellMap),("surf",dictSurfMap),("trans",dictTransMap)]:
+                if isinstance(dictGroupes[sKey], dict) and sType in dictGroupes[sKey].keys() and len(dictMap) > 0:
+                    dictGroupes[sKey][sType] = [dictMap.get(i,i) for i in dictGroupes[sKey][sType]]
+        strFichOut[iGroupes] = json.dumps(dictGroupes)
+
+    # The position of the cells, surfaces and tr remain the same
+    dictOut = deepcopy(dictElem)
+    dictOut["fich"] = strFichOut
+
+    return dictOut
+
+def RenumUniv(dictElem, dictUnivMap):
+    """
+    Function to renumber the universes of an MCNP object from correspondences
+    {old number: new number}: u= of the cells, fill= and lattice arrays, groups "univ".
+    The new numbers must not collide with the numbers left unchanged.
+    Does not modify dictElem.
+    """
+
+    # Correspondences sorted for a vectorized search
+    tiOld = sorted(dictUnivMap.keys())
+    npUnivOld = np.array(tiOld, dtype=int)
+    npUnivNew = np.array([dictUnivMap[i] for i in tiOld], dtype=int)
+
+    # Assignment
+    dictOut = deepcopy(dictElem)
+    strFichOut = dictOut["fich"]
+    dictGroupes = dictOut["groups"]
+
+    def _Repl(oMatch):
+        iUniv = int(oMatch.group(3))
+        return oMatch.group(1) + oMatch.group(2) + str(dictUnivMap.get(iUniv,iUniv))
+
+    for iIndCell in dictOut["cell"]:
+        lsLine = strFichOut[iIndCell]
+
+        # u= of the cell
+        for j,sLine in enumerate(lsLine):
+            iComm = sLine.find('$')
+            if iComm < 0:
+                iComm = len(sLine)
+            lsLine[j] = re.sub(r"((?:^|\s)[uU]\s*=\s*)(-?)(\d+)", _Repl, sLine[:iComm]) + sLine[iComm:]
+
+        # fill= and lattice arrays
+        dictLoc = GetCellFillStr(lsLine)
+        if dictLoc is None:
+            continue
+        dictFill = ReadFillArray(dictLoc["data"])
+        if dictFill is not None and len(dictFill["bounds"]) > 0:
+            # Lattice array, renumbered as an array and written with repeats
+            dictFill["univ"] = MapUniv(dictFill["univ"],npUnivOld,npUnivNew)
+            strFichOut[iIndCell] = SetCellFillStr(lsLine,dictLoc,FormatFillArray(dictFill))
+        else:
+            UpdateCellTransform(lsLine,'fill','univ',npUnivOld,npUnivNew)
+
+    # For the groups
+    if len(dictGroupes) > 0:
+        for sKey in dictGroupes.keys():
+            if isinstance(dictGroupes[sKey], dict) and "univ" in dictGroupes[sKey].keys():
+                dictGroupes[sKey]["univ"] = [dictUnivMap.get(i,i) for i in dictGroupes[sKey]["univ"]]
+        strFichOut[dictOut["ind_groups"]] = json.dumps(dictGroupes)
+
+    return dictOut
+
+
+def RenumFillUniv(sData, npUnivOld, npUnivNew):
+    """
+    Renumbers the universes of the data of a fill card (single universe or
+    lattice array), npUnivOld being sorted. The bounds of the arrays (i:j),
+    the repeats (nR) and the transformations in parentheses are left unchanged.
+    """
+
+    # Tokens with their separators, the parentheses are kept as a whole
+    lsTok = re.split(r"(\([^)]*\)|\s+)", sData)
+    tiInd = [i for i,s in enumerate(lsTok) if re.fullmatch(r"[+-]?\d+", s)]
+    if len(tiInd) == 0 or len(npUnivOld) == 0:
+        return sData
+
+    # Vectorized search of the correspondences
+    npUniv = np.array([int(lsTok[i]) for i in tiInd])
+    npRes = MapUniv(npUniv, npUnivOld, npUnivNew)
+
+    for i,iInd in enumerate(tiInd):
+        if npRes[i] != npUniv[i]:
+            lsTok[iInd] = str(npRes[i])
+
+    return ''.join(lsTok)
+
+
+def MapUniv(npUniv, npUnivOld, npUnivNew):
+    """
+    Vectorized correspondence of an array of universes, npUnivOld being sorted.
+    The universes which are not in npUnivOld are unchanged.
+    """
+
+    if len(npUnivOld) == 0:
+        return npUniv
+    npAbs = np.abs(npUniv)
+    npPos = np.minimum(np.searchsorted(npUnivOld, npAbs), len(npUnivOld) - 1)
+    bMatch = npUnivOld[npPos] == npAbs
+
+    return np.where(bMatch, np.sign(npUniv)*npUnivNew[npPos], npUniv)
+
+
+def GetCellFillStr(lsLine):
+    """
+    Locates the data of the fill card of a cell, which can be on several lines.
+    Returns None if the cell has no fill card, otherwise a dict:
+    res["data"]  = ''  data of the card (universes, bounds, transformations)
+    res["first"] = 0   first and last lines of the card
+    res["last"]  = 0
+    res["start"] = ''  first line up to 'fill='
+    res["fin"]   = ''  last line after the data
+    """
+
+    for iLine,sLine in enumerate(lsLine):
+        if IsComment(sLine):
+            continue
+        sLineKey, sLineStart, sLineFin = GetKeyWordAsStr(sLine,'fill')
+        if len(sLineStart) == 0:
+            continue
+
+        # The data can continue on the next lines
+        res = dict()
+        res["first"] = iLine
+        res["last"] = iLine
+        res["start"] = sLineStart
+        res["fin"] = sLineFin
+        lsData = [sLineKey]
+        if len(sLineFin.split('$')[0].strip()) == 0:
+            for jLine in range(iLine+1,len(lsLine)):
+                if lsLine[jLine].startswith('     ') == False:
+                    break
+                res["last"] = jLine
+                sDeb, sData, sFin, sCom = SplitCellLine(lsLine[jLine])
+                if len(sData) > 0:
+                    lsData.append(sData)
+                res["fin"] = (sFin + ' ' + sCom).strip()
+                if len(sFin) > 0:
+                    break
+        res["data"] = ' '.join(lsData)
+
+        return res
+
+    return None
+
+
+def ReadFillArray(sData):
+    """
+    Reads the data of a fill card, single universe or lattice array.
+    Returns None if the data is not understood, otherwise a dict:
+    res["bounds"] = []   bounds [[i1,i2],[j1,j2],[k1,k2]], empty if no array
+    res["univ"]   = np   array of the universes, repeats (nR) expanded,
+                         in the MCNP order (i varies first)
+    res["tr"]     = {}   transformations in parentheses, by index in res["univ"]
+    """
+
+    # Tokens, the parentheses are kept as a whole
+    lsTok = re.findall(r"\([^)]*\)|[^\s()]+", sData)
+
+    # Bounds of the array
+    res = dict()
+    res["bounds"] = list()
+    res["tr"] = dict()
+    if len(lsTok) >= 3 and all([':' in s for s in lsTok[0:3]]):
+        for s in lsTok[0:3]:
+            res["bounds"].append([int(i) for i in s.split(':')])
+        lsTok = lsTok[3:]
+
+    # Only universes (no repeat, no transformation): vectorized conversion
+    if '(' not in sData and 'r' not in sData.lower():
+        try:
+            res["univ"] = np.array(lsTok, dtype=np.int64).astype(int)
+        except ValueError:
+            return None
+        lsTok = list()
+
+    # Values and number of repetitions, iSize being the number of universes read
+    tiVal = list()
+    tiCount = list()
+    iSize = 0
+    for s in lsTok:
+        if s[0] == '(':
+            if len(tiVal) == 0:
+                return None
+            res["tr"][iSize-1] = s
+        elif s[-1] in 'rR' and s[:-1].isdigit() and len(tiVal) > 0:
+            # Repetition of the universe, the transformation is not repeated
+            if iSize-1 in res["tr"]:
+                tiVal.append(tiVal[-1])
+                tiCount.append(int(s[:-1]))
+            else:
+                tiCount[-1] = tiCount[-1] + int(s[:-1])
+            iSize = iSize + int(s[:-1])
+        elif s.lstrip('+-').isdigit() and len(s) - len(s.lstrip('+-')) <= 1:
+            tiVal.append(int(s))
+            tiCount.append(1)
+            iSize = iSize + 1
+        else:
+            return None
+
+    if "univ" not in res:
+        res["univ"] = np.repeat(np.array(tiVal,dtype=int), np.array(tiCount,dtype=int))
+
+    # Verification of the size of the array
+    if len(res["bounds"]) > 0:
+        iSize = int(np.prod([i2 - i1 + 1 for i1,i2 in res["bounds"]]))
+        if iSize != len(res["univ"]):
+            print(f"ReadFillArray: Warning, {len(res['univ'])} universes for an array of size {iSize}.")
+            return None
+
+    return res
+
+
+def FormatFillArray(dictFill):
+    """
+    Writes the data of a fill card (see ReadFillArray), identical consecutive
+    universes are written with the repeat notation nR.
+    Returns the list of the words of the card.
+    """
+
+    npUniv = dictFill["univ"]
+    lsWords = [f"{i1}:{i2}" for i1,i2 in dictFill["bounds"]]
+    if len(npUniv) == 0:
+        return lsWords
+
+    # Runs of identical universes, cut by the transformations
+    bStart = np.concatenate(([True], npUniv[1:] != npUniv[:-1]))
+    for i in dictFill["tr"].keys():
+        bStart[i] = True
+        if i + 1 < len(npUniv):
+            bStart[i+1] = True
+    npStart = np.flatnonzero(bStart)
+    npCount = np.diff(np.append(npStart,len(npUniv)))
+
+    for iStart,iCount in zip(npStart,npCount):
+        lsWords.append(str(npUniv[iStart]) + dictFill["tr"].get(int(iStart),''))
+        if iCount > 1:
+            lsWords.append(f"{iCount-1}r")
+
+    return lsWords
+
+
+def SetCellFillStr(lsLine, dictLoc, lsWords):
+    """
+    Replaces the data of the fill card of a cell (located by GetCellFillStr)
+    by the words lsWords, written on continuation lines if needed.
+    Returns the new lines of the cell.
+    """
+
+    # The keywords following the card stay on the last line of the data,
+    # written as a single word with the last universe
+    sFin, sSep, sCom = dictLoc["fin"].partition('$')
+    lsWords = list(lsWords)
+    if len(sFin.strip()) > 0:
+        lsWords = lsWords[:-1] + [' '.join(lsWords[-1:] + sFin.split())]
+
+    # First line, up to fill=
+    lsNew = list()
+    sTemp = dictLoc["start"].rstrip()
+    for sWord in lsWords:
+        if len(sTemp) + 1 + len(sWord) > 75:
+            lsNew.append(sTemp)
+            sTemp = ' '*6 + sWord
+        elif sTemp.endswith('='):
+            sTemp = sTemp + sWord
+        else:
+            sTemp = sTemp + ' ' + sWord
+
+    # Comment at the end of the last line
+    if len(sSep) > 0:
+        sTemp = sTemp + ' ' + (sSep + sCom).strip()
+    lsNew.append(sTemp)
+
+    return lsLine[:dictLoc["first"]] + lsNew + lsLine[dictLoc["last"]+1:]
+
+
+def GetCellFillUniv(lsLine):
+    """
+    Returns the array of the universes (unique values) filling a cell,
+    empty if no fill card.
+    """
+
+    dictLoc = GetCellFillStr(lsLine)
+    if dictLoc is None:
+        return np.array([],dtype=int)
+    dictFill = ReadFillArray(dictLoc["data"])
+    if dictFill is None:
+        return np.array([],dtype=int)
+
+    return np.unique(np.abs(dictFill["univ"]))
+
+
+def GetFillDependencies(dictElem, tiCell):
+    """
+    Returns the cells needed by the cells tiCell: cells of the universes
+    filling them (recursively, lattices included) and cells in '#'.
+    The result contains tiCell.
+    """
+
+    # Numbers and universes of all the cells
+    npNum = np.array([GetCellNum(dictElem["fich"][i][0]) for i in dictElem["cell"]],dtype=int)
+    npUniv = np.array([GetCellUniv(dictElem["fich"][i]) for i in dictElem["cell"]],dtype=int)
+    dictInd = dict(zip(npNum.tolist(),dictElem["cell"]))
+
+    # Successive passes until no new cell is found
+    tiRes = [i for i in tiCell]
+    setRes = set(tiRes)
+    tiNew = [i for i in tiCell if i in dictInd]
+    setUniv = set()
+    while len(tiNew) > 0:
+        tiNext = list()
+        npUnivNew = np.array([],dtype=int)
+        for iCell in tiNew:
+            lsLine = dictElem["fich"][dictInd[iCell]]
+            npUnivNew = np.union1d(npUnivNew, GetCellFillUniv(lsLine))
+            tiNext.extend(GatherCellGeo(lsLine)["cell"])
+
+        # Cells of the universes not seen before
+        npUnivNew = np.setdiff1d(npUnivNew, np.array(sorted(setUniv),dtype=int))
+        setUniv.update(npUnivNew.tolist())
+        tiNext.extend(npNum[np.isin(npUniv, npUnivNew)].tolist())
+
+        tiNew = list()
+        for i in tiNext:
+            if i not in setRes and i in dictInd:
+                setRes.add(i)
+                tiRes.append(i)
+                tiNew.append(i)
+
+    return tiRes
+
+
+def ValidateElem(dictElem):
+    """
+    Checks the references of an element in a single pass over its cards:
+    surfaces and cells (#) of the cell geometries, like but, materials,
+    transformations (trcl, fill, surfaces), universes of the fill cards,
+    surfaces of the periodic boundaries, entries of the groups, and
+    numbers defined twice.
+    Returns the list of the diagnostics, dicts:
+    res["level"]   = 'error'
+    res["type"]    = ''  type of the reference (surf, cell, like, mat, trans, univ, group, duplicate)
+    res["line"]    = 0   line of the card in the file (1 for the first card)
+    res["num"]     = ''  card referencing (ex: 'cell 3', 'surf 12', 'group ccd')
+    res["ref"]     = 0   referenced number
+    res["message"] = ''
+    """
+
+    lsDiag = list()
+    lsCard = dictElem["fich"]
+
+    # Line of each card
+    tiLine = (np.cumsum([0] + [len(l) for l in lsCard]) + 1).tolist()
+
+    def _Diag(sType, iCard, sNum, iRef, sMsg):
+        lsDiag.append({"level": 'error', "type": sType, "line": tiLine[iCard],
+                       "num": sNum, "ref": iRef, "message": f"{sNum}: {sMsg}"})
+
+    # Symbol tables, numbers defined twice
+    def _Table(tiCard, fctNum, sType):
+        dictTable = dict()
+        for i in tiCard:
+            iNum = fctNum(lsCard[i][0])
+            if iNum in dictTable:
+                _Diag('duplicate', i, f"{sType} {iNum}", iNum,
+                      f"{sType} {iNum} already defined line {tiLine[dictTable[iNum]]}")
+            else:
+                dictTable[iNum] = i
+        return dictTable
+
+    dictCell = _Table(dictElem["cell"], GetCellNum, 'cell')
+    dictSurf = _Table(dictElem["surf"], GetLineNum, 'surf')
+    dictTrans = _Table(dictElem["trans"], GetCardNumber, 'tr')
+    dictMat = _Table([i for i in dictElem["mat"] if GetCardType(lsCard[i][0])[0].lower() == 'm'], GetCardNumber, 'mat')
+    setUniv = set([GetCellUniv(lsCard[i]) for i in dictElem["cell"]]) - set([0])
+
+    # Cells
+    for i in dictElem["cell"]:
+        lsLine = [l for l in lsCard[i] if IsComment(l) is False]
+        sNum = f"cell {GetCellNum(lsLine[0])}"
+
+        iLike = GetLikeBut(lsLine[0])
+        if iLike is not None:
+            if iLike not in dictCell:
+                _Diag('like', i, sNum, iLike, f"cell {iLike} of like but is not defined")
+        else:
+            # Geometry, up to the first keyword
+            dictGeo = {"surf": [], "cell": []}
+            for sLine in lsLine:
+                dictLine = GetCellGeo(sLine)
+                dictGeo["surf"].extend(dictLine["surf"])
+                dictGeo["cell"].extend(dictLine["cell"])
+                if len(dictLine["strfin"]) > 0:
+                    break
+            iMat = GetCellGeo(lsLine[0])["mat"][0]
+            if iMat != 0 and iMat not in dictMat:
+                _Diag('mat', i, sNum, iMat, f"material {iMat} is not defined")
+            for iSurf in set([int(abs(d)) for d in dictGeo["surf"]]):
+                if iSurf not in dictSurf:
+                    _Diag('surf', i, sNum, iSurf, f"surface {iSurf} is not defined")
+            for iRef in set(dictGeo["cell"]):
+                if iRef not in dictCell:
+                    _Diag('cell', i, sNum, iRef, f"cell {iRef} in # is not defined")
+
+        # Transformations and universes
+        tiTr = list()
+        UpdateCellTransform(list(lsLine), 'trcl', 'read', tiTr)
+        dictLoc = GetCellFillStr(lsLine)
+        if dictLoc is not None:
+            dictFill = ReadFillArray(dictLoc["data"])
+            if dictFill is not None:
+                for sTr in dictFill["tr"].values():
+                    if sTr[1:-1].strip().isdigit():
+                        tiTr.append(int(sTr[1:-1]))
+                iUnivCell = GetCellUniv(lsLine)
+                for iUniv in np.unique(np.abs(dictFill["univ"])).tolist():
+                    if iUniv not in setUniv and iUniv != 0 and (len(dictFill["bounds"]) == 0 or iUniv != iUnivCell):
+                        _Diag('univ', i, sNum, iUniv, f"universe {iUniv} of fill is not defined")
+        for iTr in set(tiTr):
+            if iTr not in dictTrans:
+                _Diag('trans', i, sNum, iTr, f"transformation {iTr} is not defined")
+
+    # Surfaces: transformation, or periodic surface if negative
+    for i in dictElem["surf"]:
+        dictSurfGeo = GetSurfGeo(lsCard[i][0])
+        sNum = f"surf {dictSurfGeo['num']}"
+        if dictSurfGeo["trans"] > 0 and dictSurfGeo["trans"] not in dictTrans:
+            _Diag('trans', i, sNum, dictSurfGeo["trans"], f"transformation {dictSurfGeo['trans']} is not defined")
+        elif dictSurfGeo["trans"] < 0 and -dictSurfGeo["trans"] not in dictSurf:
+            _Diag('surf', i, sNum, -dictSurfGeo["trans"], f"periodic surface {-dictSurfGeo['trans']} is not defined")
+
+    # Groups
+    dictTypeTable = {"cell": dictCell, "surf": dictSurf, "trans": dictTrans}
+    for sGroup,dictGroup in dictElem.get("groups",dict()).items():
+        if not isinstance(dictGroup, dict):
+            continue
+        for sType,dictTable in dictTypeTable.items():
+            for d in dictGroup.get(sType,[]):
+                if int(abs(d)) not in dictTable:
+                    _Diag('group', dictElem["ind_groups"], f"group {sGroup}", int(abs(d)),
+                          f"{sType} {int(abs(d))} is not defined")
+
+    return lsDiag
+
+
+# Tokens of a cell geometry: #( , #N, surface (with facet), ( ) :
+reGGeoToken = re.compile(r"#\(|#\d+|[+-]?\d+(?:\.\d+)?|[():]")
+
+
+def ParseCellGeo(sGeo):
+    """
+    Parses the geometry of a cell (CSG expression).
+    Returns a tree of tuples:
+    ('surf', d)       surface with its sense (ex: -3.0, 1.2 for a facet)
+    ('cell', n)       complement of the cell n (#n)
+    ('not', node)     complement #( ... )
+    ('and', [nodes])  intersection
+    ('or', [nodes])   union (:)
+    Returns None if the expression is not understood.
+    """
+
+    lsTok = reGGeoToken.findall(sGeo)
+    iPos = [0]
+
+    def _Union():
+        lsNode = [_Inter()]
+        while iPos[0] < len(lsTok) and lsTok[iPos[0]] == ':':
+            iPos[0] = iPos[0] + 1
+            lsNode.append(_Inter())
+        return lsNode[0] if len(lsNode) == 1 else ('or', lsNode)
+
+    def _Inter():
+        lsNode = list()
+        while iPos[0] < len(lsTok) and lsTok[iPos[0]] not in (':', ')'):
+            lsNode.append(_Factor())
+        if len(lsNode) == 0:
+            raise ValueError(sGeo)
+        return lsNode[0] if len(lsNode) == 1 else ('and', lsNode)
+
+    def _Factor():
+        sTok = lsTok[iPos[0]]
+        iPos[0] = iPos[0] + 1
+        if sTok in ('(', '#('):
+            oNode = _Union()
+            if iPos[0] >= len(lsTok) or lsTok[iPos[0]] != ')':
+                raise ValueError(sGeo)
+            iPos[0] = iPos[0] + 1
+            return ('not', oNode) if sTok == '#(' else oNode
+        if sTok[0] == '#':
+            return ('cell', int(sTok[1:]))
+        return ('surf', float(sTok))
+
+    try:
+        oTree = _Union()
+    except (ValueError, IndexError):
+        return None
+    if iPos[0] != len(lsTok):
+        return None
+
+    return oTree
+
+
+def SurfBBox(sType, tdCoef, iSense):
+    """
+    Conservative bounding box [xmin,xmax,ymin,ymax,zmin,zmax] of the region
+    of a surface with the sense iSense (-1 or 1), in the frame of the surface.
+    Infinite bounds if the region is not bounded or the type not treated.
+    """
+
+    dInf = np.inf
+    npBox = np.array([-dInf, dInf]*3)
+    npC = np.array(tdCoef, dtype=float)
+
+    def _Points(npP, dMargin=0.):
+        npP = np.reshape(npP, (-1,3))
+        if len(npP) == 1:
+            return np.repeat(npP[0], 2) + np.array([-dMargin, dMargin]*3)
+        return np.array([npP[:,0].min()-dMargin, npP[:,0].max()+dMargin,
+                         npP[:,1].min()-dMargin, npP[:,1].max()+dMargin,
+                         npP[:,2].min()-dMargin, npP[:,2].max()+dMargin])
+
+    # Planes normal to an axis, the only surfaces bounded on both senses
+    dictAxis = {'x': 0, 'y': 1, 'z': 2}
+    if sType in ('px','py','pz') and len(npC) == 1:
+        iAxis, dD, dN = dictAxis[sType[1]], npC[0], 1.
+    elif sType == 'p' and len(npC) == 4 and np.count_nonzero(npC[0:3]) == 1:
+        iAxis = int(np.flatnonzero(npC[0:3])[0])
+        dN, dD = npC[iAxis], npC[3]
+    else:
+        iAxis = -1
+    if iAxis >= 0:
+        dD = dD/dN
+        if iSense*dN < 0:
+            npBox[2*iAxis+1] = dD
+        else:
+            npBox[2*iAxis] = dD
+        return npBox
+
+    # Other surfaces: only the inside is bounded
+    if iSense > 0:
+        return npBox
+
+    try:
+        if sType == 'so':
+            return _Points(np.zeros(3), npC[0])
+        if sType == 's' or sType == 'sph':
+            return _Points(npC[0:3], npC[3])
+        if sType in ('sx','sy','sz'):
+            npP = np.zeros(3)
+            npP[dictAxis[sType[1]]] = npC[0]
+            return _Points(npP, npC[1])
+        if sType in ('cx','cy','cz','c/x','c/y','c/z'):
+            iAxis = dictAxis[sType[-1]]
+            lsOther = [i for i in range(3) if i != iAxis]
+            npCenter = np.zeros(2) if len(sType) == 2 else npC[0:2]
+            dR = npC[-1]
+            for i,iOther in enumerate(lsOther):
+                npBox[2*iOther:2*iOther+2] = [npCenter[i]-dR, npCenter[i]+dR]
+            return npBox
+        if sType in ('tx','ty','tz'):
+            iAxis = dictAxis[sType[1]]
+            dR = abs(npC[3]) + abs(npC[5])
+            for i in range(3):
+                dH = abs(npC[4]) if i == iAxis else dR
+                npBox[2*i:2*i+2] = [npC[i]-dH, npC[i]+dH]
+            return npBox
+        if sType == 'rpp':
+            return npC[0:6].copy()
+        if sType in ('box','wed'):
+            npV, lsA = npC[0:3], [npC[3:6], npC[6:9], npC[9:12]]
+            if sType == 'wed':
+                return _Points([npV, npV+lsA[0], npV+lsA[1], npV+lsA[2], npV+lsA[0]+lsA[2], npV+lsA[1]+lsA[2]])
+            return _Points([npV + i*lsA[0] + j*lsA[1] + k*lsA[2] for i in (0,1) for j in (0,1) for k in (0,1)])
+        if sType == 'rcc':
+            return _Points([npC[0:3], npC[0:3]+npC[3:6]], npC[6])
+        if sType == 'trc':
+            return _Points([npC[0:3], npC[0:3]+npC[3:6]], max(npC[6], npC[7]))
+        if sType == 'rec':
+            dR = np.linalg.norm(npC[6:9]) if len(npC) >= 12 else max(np.linalg.norm(npC[6:9]), npC[9])
+            if len(npC) >= 12:
+                dR = max(dR, np.linalg.norm(npC[9:12]))
+            return _Points([npC[0:3], npC[0:3]+npC[3:6]], dR)
+        if sType in ('rhp','hex'):
+            dR = np.linalg.norm(npC[6:9])
+            if len(npC) >= 15:
+                dR = max(dR, np.linalg.norm(npC[9:12]), np.linalg.norm(npC[12:15]))
+            return _Points([npC[0:3], npC[0:3]+npC[3:6]], 2*dR/np.sqrt(3))
+        if sType == 'ell':
+            if npC[6] > 0:
+                return _Points([npC[0:3], npC[3:6]], npC[6])
+            return _Points(npC[0:3], max(np.linalg.norm(npC[3:6]), abs(npC[6])))
+        if sType == 'arb':
+            return _Points(npC[0:24])
+    except (IndexError, ValueError):
+        pass
+
+    return npBox
+
+
+def TransformBBox(npBox, tdCanon):
+    """
+    Conservative bounding box, in the global frame, of a box given in the
+    frame of the transform tdCanon (see CanonicalTr): x = M^T x' + t.
+    """
+
+    npT = np.array(tdCanon[0:3])
+    npR = np.array(tdCanon[3:12]).reshape(3,3).T
+    npMin, npMax = npBox[0::2], npBox[1::2]
+    if np.any(npMin > npMax):
+        return npBox
+
+    # Center and half extent, the infinite directions are spread over the
+    # axes which depend on them
+    bInf = np.isinf(npMin) | np.isinf(npMax)
+    npCenter = np.where(bInf, 0., (np.where(bInf, 0., npMin) + np.where(bInf, 0., npMax))/2)
+    npHalf = np.where(bInf, 0., (np.where(bInf, 0., npMax) - np.where(bInf, 0., npMin))/2)
+    npCenterNew = npR.dot(npCenter) + npT
+    npHalfNew = np.abs(npR).dot(npHalf)
+    bInfNew = (np.abs(npR)[:, bInf] > 10**-ROUND_TR).any(axis=1)
+
+    npRes = np.empty(6)
+    npRes[0::2] = np.where(bInfNew, -np.inf, npCenterNew - npHalfNew)
+    npRes[1::2] = np.where(bInfNew, np.inf, npCenterNew + npHalfNew)
+
+    # Half spaces keep their finite bound when the direction is unchanged
+    if np.allclose(npR, np.eye(3), rtol=0, atol=10**-ROUND_TR):
+        npRes = np.array(npBox, dtype=float)
+        npRes[0::2] = npRes[0::2] + npT
+        npRes[1::2] = npRes[1::2] + npT
+
+    return npRes
+
+
+def GeoBBox(oTree, fctSurf):
+    """
+    Conservative bounding box of a geometry tree (see ParseCellGeo),
+    fctSurf(d) giving the box of the surface d with its sense.
+    Complements are not bounded. An empty region has min > max.
+    """
+
+    npInf = np.array([-np.inf, np.inf]*3)
+    if oTree is None or oTree[0] in ('cell', 'not'):
+        return npInf
+    if oTree[0] == 'surf':
+        return fctSurf(oTree[1])
+
+    lsBox = [GeoBBox(o, fctSurf) for o in oTree[1]]
+    npBoxes = np.array(lsBox)
+    if oTree[0] == 'and':
+        npRes = np.empty(6)
+        npRes[0::2] = npBoxes[:,0::2].max(axis=0)
+        npRes[1::2] = npBoxes[:,1::2].min(axis=0)
+        return npRes
+
+    # Union of the non empty boxes
+    bEmpty = (npBoxes[:,0::2] > npBoxes[:,1::2]).any(axis=1)
+    if bEmpty.all():
+        return lsBox[0]
+    npBoxes = npBoxes[~bEmpty]
+    npRes = np.empty(6)
+    npRes[0::2] = npBoxes[:,0::2].min(axis=0)
+    npRes[1::2] = npBoxes[:,1::2].max(axis=0)
+
+    return npRes
+
+
+def ReadCanonicalTrs(dictElem):
+    """
+    Transformations of dictElem in canonical form {number: see CanonicalTr},
+    the cards with jumps (j) are ignored.
+    """
+
+    lsCard = dictElem["fich"]
+    dictCanon = dict()
+    for i in dictElem["trans"]:
+        if any(['j' in s.split('$')[0].lower() for s in lsCard[i] if not IsComment(s)]):
+            continue
+        dictTr = ReadTrCard([s for s in lsCard[i] if not IsComment(s)])
+        if dictTr is not None:
+            dictCanon[dictTr["num"]] = CanonicalTr(dictTr)
+
+    return dictCanon
+
+
+def ReadSurfCards(dictElem):
+    """
+    Returns the surfaces of dictElem as a list of (number, transformation,
+    type in lower case, coefficients), the cards whose coefficients are not
+    numbers are ignored.
+    """
+
+    lsCard = dictElem["fich"]
+    lsSurf = list()
+    for i in dictElem["surf"]:
+        lsData = list()
+        for s in lsCard[i]:
+            if not IsComment(s):
+                lsData.extend((s + ' ')[:(s + ' ').find('$')].split())
+        dictSurfGeo = GetSurfGeo(lsCard[i][0])
+        iNum, iTr = dictSurfGeo["num"], dictSurfGeo["trans"]
+        iType = 2 if iTr != 0 else 1
+        try:
+            tdCoef = [float(d) for d in lsData[iType+1:]]
+        except ValueError:
+            continue
+        lsSurf.append((iNum, iTr, lsData[iType].lower(), tdCoef))
+
+    return lsSurf
+
+
+def SurfBBoxes(dictElem):
+    """
+    Conservative bounding boxes of the surfaces in the global frame.
+    Returns (dictCanon, dictSurfBox, dictSurfLocal): the transforms
+    {number: canonical form} (see CanonicalTr), the boxes
+    {number: [box sense -, box sense +]} and, for the surfaces with a
+    transformation, {number: (transformation, boxes in its frame)}.
+    """
+
+    npInf = np.array([-np.inf, np.inf]*3)
+
+    # Transformations
+    dictCanon = ReadCanonicalTrs(dictElem)
+
+    # Surfaces: boxes of both senses
+    dictSurfBox = dict()
+    dictSurfLocal = dict()
+    for iNum,iTr,sType,tdCoef in ReadSurfCards(dictElem):
+        lsBox = [SurfBBox(sType, tdCoef, iSense) for iSense in (-1, 1)]
+        if iTr > 0:
+            dictSurfLocal[iNum] = (iTr, lsBox)
+            if iTr in dictCanon:
+                lsBox = [TransformBBox(npBox, dictCanon[iTr]) for npBox in lsBox]
+            else:
+                lsBox = [npInf, npInf]
+        dictSurfBox[iNum] = lsBox
+
+    return dictCanon, dictSurfBox, dictSurfLocal
+
+
+def CellBBoxes(dictElem):
+    """
+    Conservative bounding boxes of the cells in the global frame,
+    array (number of cells, 6) in the order of dictElem["cell"]:
+    [xmin,xmax,ymin,ymax,zmin,zmax], infinite if not bounded.
+    Surface transformations and trcl (by number) are taken into account.
+    The cells of a universe are bounded by the cells filled with it,
+    like but cells by their model.
+    """
+
+    npInf = np.array([-np.inf, np.inf]*3)
+    lsCard = dictElem["fich"]
+
+    # Transformations and surfaces
+    dictCanon, dictSurfBox, dictSurfLocal = SurfBBoxes(dictElem)
+
+    def _Surf(d):
+        if d != int(d) or abs(int(d)) not in dictSurfBox:
+            # Facets of macrobodies and unknown surfaces are not bounded
+            return npInf
+        return dictSurfBox[abs(int(d))][0 if d < 0 else 1]
+
+    def _SurfLocal(d):
+        if d != int(d) or abs(int(d)) not in dictSurfLocal:
+            return npInf
+        return dictSurfLocal[abs(int(d))][1][0 if d < 0 else 1]
+
+    def _Trcl(npCellBox, sData, lsLine):
+        # Transformation of the cell (trcl by number)
+        if 'trcl' not in sData:
+            return npCellBox
+        tiTr = list()
+        UpdateCellTransform(list(lsLine), 'trcl', 'read', tiTr)
+        if len(tiTr) > 0 and tiTr[0] in dictCanon:
+            return TransformBBox(npCellBox, dictCanon[tiTr[0]])
+        return npInf
+
+    # Own boxes of the cells
+    iNbCell = len(dictElem["cell"])
+    npBox = np.tile(npInf, (iNbCell,1))
+    dictNum = dict()
+    tiUniv = list()
+    dictFill = dict()
+    dictCellFill = dict()
+    lsLike = list()
+    for iCell,i in enumerate(dictElem["cell"]):
+        lsLine = [s for s in lsCard[i] if not IsComment(s)]
+        sData = ' '.join([s.split('$')[0].lower() for s in lsLine])
+        dictNum[GetCellNum(lsLine[0])] = iCell
+        tiUniv.append(GetCellUniv(lsLine) if 'u' in sData else 0)
+        if 'fill' in sData:
+            # In a lattice, the universe of the cell itself is not a filling
+            dictCellFill[iCell] = [iUniv for iUniv in GetCellFillUniv(lsLine).tolist() if iUniv != tiUniv[-1]]
+            for iUniv in dictCellFill[iCell]:
+                dictFill.setdefault(iUniv, []).append(iCell)
+
+        iLike = GetLikeBut(lsLine[0])
+        if iLike is not None:
+            lsLike.append((iCell, iLike, sData, lsLine))
+            continue
+        if 'lat' in sData and re.search(r"(?:^|\s)lat\s*=", sData):
+            # Lattice: the elements are bounded by the filled cells only
+            continue
+
+        lsGeo = list()
+        tiTr = set()
+        for sLine in lsLine:
+            dictLine = GetCellGeo(sLine)
+            lsGeo.append(dictLine["strgeo"])
+            tiTr.update([dictSurfLocal.get(abs(int(d)), (0,))[0] for d in dictLine["surf"]])
+            if len(dictLine["strfin"]) > 0:
+                break
+        oTree = ParseCellGeo(' '.join(lsGeo))
+        npCellBox = GeoBBox(oTree, _Surf)
+        if len(tiTr) == 1 and min(tiTr) in dictCanon:
+            # All the surfaces in the same frame: box in this frame, tighter
+            npLocal = TransformBBox(GeoBBox(oTree, _SurfLocal), dictCanon[min(tiTr)])
+            npCellBox = np.concatenate((np.maximum(npCellBox[0::2], npLocal[0::2])[:,None],
+                                        np.minimum(npCellBox[1::2], npLocal[1::2])[:,None]), axis=1).ravel()
+        npBox[iCell] = _Trcl(npCellBox, sData, lsLine)
+
+    # Like but: box and filling of the model, with the new transformation
+    for iCell,iLike,sData,lsLine in lsLike:
+        if iLike not in dictNum:
+            continue
+        npBox[iCell] = _Trcl(npBox[dictNum[iLike]], sData, lsLine)
+        if 'fill' not in sData:
+            for iUniv in dictCellFill.get(dictNum[iLike], []):
+                dictFill.setdefault(iUniv, []).append(iCell)
+
+    # Cells of universes: union of the boxes of the filled cells (recursively)
+    dictUnivBox = dict()
+    def _Univ(iUniv, setSeen):
+        if iUniv in dictUnivBox:
+            return dictUnivBox[iUniv]
+        lsBox = list()
+        for iCell in dictFill.get(iUniv, []):
+            if tiUniv[iCell] != 0 and tiUniv[iCell] not in setSeen:
+                lsBox.append(_Univ(tiUniv[iCell], setSeen | set([tiUniv[iCell]])))
+            elif tiUniv[iCell] == 0:
+                lsBox.append(npBox[iCell])
+            else:
+                lsBox.append(npInf)
+        if len(lsBox) == 0:
+            res = npInf
+        else:
+            npBoxes = np.array(lsBox)
+            res = np.empty(6)
+            res[0::2] = npBoxes[:,0::2].min(axis=0)
+            res[1::2] = npBoxes[:,1::2].max(axis=0)
+        dictUnivBox[iUniv] = res
+        return res
+
+    for iCell in range(iNbCell):
+        if tiUniv[iCell] != 0:
+            npBox[iCell] = _Univ(tiUniv[iCell], set([tiUniv[iCell]]))
+
+    return npBox
+
+
+def FormatCellGeo(oTree, bNested=False):
+    """
+    Writes a geometry tree (see ParseCellGeo) as an MCNP expression.
+    The intersections and unions are put between parentheses if bNested.
+    """
+
+    if oTree[0] == 'surf':
+        d = oTree[1]
+        return str(int(d)) if d == int(d) else str(d)
+    if oTree[0] == 'cell':
+        return '#' + str(oTree[1])
+    if oTree[0] == 'not':
+        return '#(' + FormatCellGeo(oTree[1]) + ')'
+
+    sSep = ' ' if oTree[0] == 'and' else ':'
+    sGeo = sSep.join([FormatCellGeo(o, True) for o in oTree[1]])
+
+    return '(' + sGeo + ')' if bNested else sGeo
+
+
+def ComplementBBox(oTree, fctSurf, fctCell):
+    """
+    Conservative bounding box of the complement of a geometry tree
+    (see ParseCellGeo), fctSurf(d) giving the box of the surface d with its
+    sense and fctCell(n) the box of the cell n.
+    """
+
+    if oTree[0] == 'surf':
+        return fctSurf(-oTree[1])
+    if oTree[0] == 'cell':
+        return fctCell(oTree[1])
+    if oTree[0] == 'not':
+        return GeoBBox(oTree[1], fctSurf)
+
+    # Complement of an intersection: union of the complements, and conversely
+    npBoxes = np.array([ComplementBBox(o, fctSurf, fctCell) for o in oTree[1]])
+    npRes = np.empty(6)
+    if oTree[0] == 'and':
+        npRes[0::2] = npBoxes[:,0::2].min(axis=0)
+        npRes[1::2] = npBoxes[:,1::2].max(axis=0)
+    else:
+        npRes[0::2] = npBoxes[:,0::2].max(axis=0)
+        npRes[1::2] = npBoxes[:,1::2].min(axis=0)
+
+    return npRes
+
+
+def SplitBoxesBSP(npBoxes, npRoot, iLeaf=8, iDepthMax=32):
+    """
+    Binary space partition of the box npRoot by planes normal to the axes,
+    so that each part intersects at most iLeaf of the boxes npBoxes
+    (array (n,6)), if possible. The planes are put at the median of the
+    centers of the boxes along the longest axis of the part.
+    Returns the list of the parts: (box of the part, [(axis, position, sense)],
+    positions of the boxes intersecting the part), sense -1 below the plane.
+    """
+
+    lsLeaf = list()
+    npCenter = (npBoxes[:,0::2] + npBoxes[:,1::2])/2
+
+    def _Split(npBox, lsPlane, npInd, iDepth):
+        if len(npInd) <= iLeaf or iDepth >= iDepthMax:
+            lsLeaf.append((npBox, lsPlane, npInd))
+            return
+
+        # Longest axis and median of the centers inside the part
+        iAxis = int(np.argmax(npBox[1::2] - npBox[0::2]))
+        dPos = float(np.median(npCenter[npInd, iAxis]))
+        if dPos <= npBox[2*iAxis] or dPos >= npBox[2*iAxis+1]:
+            dPos = (npBox[2*iAxis] + npBox[2*iAxis+1])/2
+
+        npLow = npInd[npBoxes[npInd, 2*iAxis] < dPos]
+        npHigh = npInd[npBoxes[npInd, 2*iAxis+1] > dPos]
+        if max(len(npLow), len(npHigh)) == len(npInd):
+            # No gain, the boxes straddle the plane
+            lsLeaf.append((npBox, lsPlane, npInd))
+            return
+
+        npBoxLow = npBox.copy()
+        npBoxLow[2*iAxis+1] = dPos
+        npBoxHigh = npBox.copy()
+        npBoxHigh[2*iAxis] = dPos
+        _Split(npBoxLow, lsPlane + [(iAxis, dPos, -1)], npLow, iDepth + 1)
+        _Split(npBoxHigh, lsPlane + [(iAxis, dPos, 1)], npHigh, iDepth + 1)
+
+    _Split(np.array(npRoot, dtype=float), [], np.arange(len(npBoxes)), 0)
+
+    return lsLeaf
+
+
+def SurfSense(sType, tdCoef, npP):
+    """
+    Value of the equation of a surface at the points npP (array (n,3)) in the
+    frame of the surface, negative on the side of sense -.
+    The macrobodies give -1 inside and 1 outside.
+    Returns None if the type of surface is not treated.
+    """
+
+    npC = np.array(tdCoef, dtype=float)
+    dictAxis = {'x': 0, 'y': 1, 'z': 2}
+
+    try:
+        if sType in ('px','py','pz'):
+            return npP[:,dictAxis[sType[1]]] - npC[0]
+        if sType == 'p' and len(npC) == 4:
+            return npP.dot(npC[0:3]) - npC[3]
+        if sType == 'so':
+            return (npP**2).sum(axis=1) - npC[0]**2
+        if sType in ('s','sph'):
+            return ((npP - npC[0:3])**2).sum(axis=1) - npC[3]**2
+        if sType in ('sx','sy','sz'):
+            npQ = npP.copy()
+            npQ[:,dictAxis[sType[1]]] -= npC[0]
+            return (npQ**2).sum(axis=1) - npC[1]**2
+        if sType in ('cx','cy','cz','c/x','c/y','c/z'):
+            lsOther = [i for i in range(3) if i != dictAxis[sType[-1]]]
+            npCenter = np.zeros(2) if len(sType) == 2 else npC[0:2]
+            return ((npP[:,lsOther] - npCenter)**2).sum(axis=1) - npC[-1]**2
+        if sType in ('kx','ky','kz','k/x','k/y','k/z'):
+            iAxis = dictAxis[sType[-1]]
+            lsOther = [i for i in range(3) if i != iAxis]
+            if len(sType) == 2:
+                npApex, tdRest = np.zeros(3), npC[1:]
+                npApex[iAxis] = npC[0]
+            else:
+                npApex, tdRest = npC[0:3], npC[3:]
+            npQ = npP - npApex
+            npRes = (npQ[:,lsOther]**2).sum(axis=1) - tdRest[0]*npQ[:,iAxis]**2
+            if len(tdRest) > 1 and tdRest[1] != 0:
+                # One sheet only, the other one is outside
+                npRes = np.where(npQ[:,iAxis]*tdRest[1] >= 0, npRes, np.abs(npRes) + 1.)
+            return npRes
+        if sType == 'sq':
+            npQ = npP - npC[7:10]
+            return (npC[0:3]*npQ**2).sum(axis=1) + 2*npQ.dot(npC[3:6]) + npC[6]
+        if sType == 'gq':
+            x, y, z = npP[:,0], npP[:,1], npP[:,2]
+            return npC[0]*x*x + npC[1]*y*y + npC[2]*z*z + npC[3]*x*y + npC[4]*y*z + npC[5]*z*x \
+                   + npC[6]*x + npC[7]*y + npC[8]*z + npC[9]
+        if sType in ('tx','ty','tz'):
+            iAxis = dictAxis[sType[1]]
+            lsOther = [i for i in range(3) if i != iAxis]
+            npQ = npP - npC[0:3]
+            dRad = np.sqrt((npQ[:,lsOther]**2).sum(axis=1))
+            return npQ[:,iAxis]**2/npC[4]**2 + (dRad - npC[3])**2/npC[5]**2 - 1.
+        if sType == 'rpp':
+            bIn = np.ones(len(npP), dtype=bool)
+            for i in range(3):
+                bIn &= (npP[:,i] > npC[2*i]) & (npP[:,i] < npC[2*i+1])
+            return np.where(bIn, -1., 1.)
+        if sType == 'box' and len(npC) == 12:
+            npQ = npP - npC[0:3]
+            bIn = np.ones(len(npP), dtype=bool)
+            for i in range(3):
+                npA = npC[3+3*i:6+3*i]
+                npProj = npQ.dot(npA)
+                bIn &= (npProj > 0) & (npProj < npA.dot(npA))
+            return np.where(bIn, -1., 1.)
+        if sType in ('rcc','trc'):
+            npQ = npP - npC[0:3]
+            dH = np.linalg.norm(npC[3:6])
+            npAx = npQ.dot(npC[3:6])/dH
+            npRad2 = (npQ**2).sum(axis=1) - npAx**2
+            npR = npC[6] + (npC[7] - npC[6])*npAx/dH if sType == 'trc' else npC[6]
+            bIn = (npAx > 0) & (npAx < dH) & (npRad2 < npR**2)
+            return np.where(bIn, -1., 1.)
+    except (IndexError, ValueError, ZeroDivisionError):
+        pass
+
+    return None
+
+
+def BuildCSG(dictElem):
+    """
+    Geometry of dictElem for the classification of points (see InsideCell):
+    res["surf"] = {number: (type, coefficients, transformation or None)}
+    res["cell"] = {number: (tree, trcl or None)}, trees of ParseCellGeo,
+    the transformations in canonical form (see CanonicalTr).
+    The cells which can not be treated (trcl not given by number, tree not
+    understood) have the tree None. Like but cells take the tree of
+    their model.
+    """
+
+    lsCard = dictElem["fich"]
+    dictCanon = ReadCanonicalTrs(dictElem)
+
+    res = dict()
+    res["surf"] = dict()
+    for iNum,iTr,sType,tdCoef in ReadSurfCards(dictElem):
+        if iTr > 0 and iTr not in dictCanon:
+            continue
+        res["surf"][iNum] = (sType, tdCoef, dictCanon[iTr] if iTr > 0 else None)
+
+    res["cell"] = dict()
+    lsLike = list()
+    for i in dictElem["cell"]:
+        lsLine = [s for s in lsCard[i] if not IsComment(s)]
+        iNum = GetCellNum(lsLine[0])
+        sData = ' '.join([s.split('$')[0].lower() for s in lsLine])
+
+        # Transformation of the cell
+        oCanon = None
+        if 'trcl' in sData:
+            tiTr = list()
+            UpdateCellTransform(list(lsLine), 'trcl', 'read', tiTr)
+            if len(tiTr) == 0 or tiTr[0] not in dictCanon:
+                res["cell"][iNum] = (None, None)
+                continue
+            oCanon = dictCanon[tiTr[0]]
+
+        iLike = GetLikeBut(lsLine[0])
+        if iLike is not None:
+            lsLike.append((iNum, iLike, oCanon, 'trcl' in sData))
+            continue
+
+        lsGeo = list()
+        for sLine in lsLine:
+            dictLine = GetCellGeo(sLine)
+            lsGeo.append(dictLine["strgeo"])
+            if len(dictLine["strfin"]) > 0:
+                break
+        res["cell"][iNum] = (ParseCellGeo(' '.join(lsGeo)), oCanon)
+
+    for iNum,iLike,oCanon,bTrcl in lsLike:
+        oTree, oCanonLike = res["cell"].get(iLike, (None, None))
+        res["cell"][iNum] = (oTree, oCanon if bTrcl else oCanonLike)
+
+    return res
+
+
+def ToLocalFrame(npP, tdCanon):
+    """
+    Coordinates of the points npP (array (n,3)) in the frame of the
+    transformation tdCanon (see CanonicalTr): x' = M (x - t).
+    """
+
+    if tdCanon is None:
+        return npP
+
+    return (npP - np.array(tdCanon[0:3])).dot(np.array(tdCanon[3:12]).reshape(3,3).T)
+
+
+def InsideCell(iCell, npP, dictCSG, dictCache=None):
+    """
+    Classification of the points npP (array (n,3), global frame) with
+    respect to the cell iCell of the geometry dictCSG (see BuildCSG).
+    Returns a boolean array, True inside the cell, or None if the cell
+    uses surfaces, facets or cells which can not be treated.
+    dictCache keeps the values of the surfaces between calls on the same points.
+    """
+
+    if dictCache is None:
+        dictCache = dict()
+    if iCell not in dictCSG["cell"]:
+        return None
+    oTree, oCanon = dictCSG["cell"][iCell]
+    if oTree is None:
+        return None
+    npLocal = ToLocalFrame(npP, oCanon)
+    iFrame = id(oCanon) if oCanon is not None else 0
+
+    def _Surf(iSurf):
+        sKey = (iFrame, iSurf)
+        if sKey not in dictCache:
+            if iSurf not in dictCSG["surf"]:
+                dictCache[sKey] = None
+            else:
+                sType, tdCoef, oCanonSurf = dictCSG["surf"][iSurf]
+                dictCache[sKey] = SurfSense(sType, tdCoef, ToLocalFrame(npLocal, oCanonSurf))
+        return dictCache[sKey]
+
+    def _Eval(oNode):
+        if oNode[0] == 'surf':
+            d = oNode[1]
+            if d != int(d):
+                # Facets of macrobodies
+                return None
+            npVal = _Surf(abs(int(d)))
+            if npVal is None:
+                return None
+            return npVal < 0 if d < 0 else npVal > 0
+        if oNode[0] == 'cell':
+            npIn = InsideCell(oNode[1], npP, dictCSG, dictCache)
+            return None if npIn is None else ~npIn
+        if oNode[0] == 'not':
+            npIn = _Eval(oNode[1])
+            return None if npIn is None else ~npIn
+        lsIn = [_Eval(o) for o in oNode[1]]
+        if any([npIn is None for npIn in lsIn]):
+            return None
+        return np.logical_and.reduce(lsIn) if oNode[0] == 'and' else np.logical_or.reduce(lsIn)
+
+    return _Eval(oTree)
+
+
+def SampleVolumes(dictCSG, lsTask, n=100000, tol=0.01, seed=0, chunk=10000):
+    """
+    Monte Carlo estimation of the volumes of cells: lsTask is a list of
+    (cell, box), the points are sampled uniformly in the box by chunks until
+    the relative standard deviation is below tol or n points are reached.
+    The points of each cell only depend on seed and on the number of the cell.
+    Returns {cell: (volume, standard deviation, number of points)}, the
+    volume being NaN if the cell can not be treated.
+    """
+
+    res = dict()
+    for iCell,npBox in lsTask:
+        npBox = np.array(npBox, dtype=float)
+        npLow, npHigh = npBox[0::2], npBox[1::2]
+        dVolBox = float(np.prod(npHigh - npLow))
+        oRng = np.random.default_rng([seed, abs(iCell)])
+
+        iHit = 0
+        iTot = 0
+        bOk = True
+        while iTot < n:
+            iNb = min(chunk, n - iTot)
+            npP = npLow + (npHigh - npLow)*oRng.random((iNb,3))
+            npIn = InsideCell(iCell, npP, dictCSG)
+            if npIn is None:
+                bOk = False
+                break
+            iHit = iHit + int(np.count_nonzero(npIn))
+            iTot = iTot + iNb
+            if iHit > 0 and np.sqrt((1. - iHit/iTot)/iHit) <= tol:
+                break
+
+        if not bOk:
+            res[iCell] = (np.nan, np.nan, 0)
+            continue
+        dFrac = iHit/iTot
+        res[iCell] = (dVolBox*dFrac, dVolBox*np.sqrt(dFrac*(1. - dFrac)/iTot), iTot)
+
+    return res
+
+
+def ReadDataCardValues(lsWords):
+    """
+    Values of a data card (without its name), the repeats nR are expanded,
+    nJ and the values which are not numbers give NaN.
+    """
+
+    tdVal = list()
+    for sWord in lsWords:
+        sLow = sWord.lower()
+        if sLow[-1] in 'rj' and (len(sLow) == 1 or sLow[:-1].isdigit()):
+            iNb = 1 if len(sLow) == 1 else int(sLow[:-1])
+            dVal = tdVal[-1] if sLow[-1] == 'r' and len(tdVal) > 0 else np.nan
+            tdVal.extend([dVal]*iNb)
+        else:
+            try:
+                tdVal.append(float(sWord))
+            except ValueError:
+                tdVal.append(np.nan)
+
+    return tdVal
+
+
+def BuildCellIndex(dictElem):
+    """
+    Index of the cells for the queries (see go.Select), columns in the order
+    of dictElem["cell"]:
+    res["num"]  = np  numbers of the cells
+    res["mat"]  = np  materials (-1 for like but)
+    res["dens"] = np  densities as written (NaN if void or like but)
+    res["univ"] = np  universes (0 if none)
+    res["imp"]  = {}  importances by particle, np (NaN if not given)
+    res["com"]  = []  comments of the cells
+    and the reverse indexes, number -> np array of positions:
+    res["bymat"], res["byuniv"], res["bysurf"].
+    The bounding boxes (res["bbox"]) are computed on demand.
+    """
+
+    lsCard = dictElem["fich"]
+    iNbCell = len(dictElem["cell"])
+    res = dict()
+    res["num"] = np.zeros(iNbCell, dtype=int)
+    res["mat"] = np.zeros(iNbCell, dtype=int)
+    res["dens"] = np.full(iNbCell, np.nan)
+    res["univ"] = np.zeros(iNbCell, dtype=int)
+    res["imp"] = dict()
+    res["com"] = list()
+    dictMat = dict()
+    dictUniv = dict()
+    dictSurf = dict()
+
+    for iCell,i in enumerate(dictElem["cell"]):
+        lsLine = [s for s in lsCard[i] if not IsComment(s)]
+        res["num"][iCell] = GetCellNum(lsLine[0])
+        res["univ"][iCell] = GetCellUniv(lsLine)
+        dictUniv.setdefault(int(res["univ"][iCell]), []).append(iCell)
+
+        # Geometry up to the keywords, keywords and comments of all the lines
+        lsFin = list()
+        lsCom = list()
+        bGeo = True
+        for j,(sLine,dictLine) in enumerate(zip(lsLine,GetCellLinesGeo(lsLine))):
+            if j == 0:
+                if GetLikeBut(sLine) is not None:
+                    res["mat"][iCell] = -1
+                    bGeo = False
+                else:
+                    res["mat"][iCell] = dictLine["mat"][0]
+                    if dictLine["mat"][0] != 0:
+                        res["dens"][iCell] = dictLine["mat"][1]
+            if bGeo:
+                for d in set([int(abs(d)) for d in dictLine["surf"]]):
+                    dictSurf.setdefault(d, set()).add(iCell)
+            if len(dictLine["strfin"]) > 0:
+                bGeo = False
+            lsFin.append(dictLine["strfin"])
+            lsCom.append(dictLine["strcom"].lstrip('$').strip())
+        dictMat.setdefault(int(res["mat"][iCell]), []).append(iCell)
+        res["com"].append(' '.join([s for s in lsCom if len(s) > 0]))
+
+        # Importances on the cell
+        for oMatch in re.finditer(r"imp:([a-z#|,]+)\s*=\s*(\S+)", ' '.join(lsFin).lower()):
+            for sPart in oMatch.group(1).split(','):
+                if sPart not in res["imp"]:
+                    res["imp"][sPart] = np.full(iNbCell, np.nan)
+                try:
+                    res["imp"][sPart][iCell] = float(oMatch.group(2))
+                except ValueError:
+                    pass
+
+    # Importances in the data block
+    if len(dictElem["saut"]) > 1:
+        for i in range(dictElem["saut"][1]+1, len(lsCard)):
+            if len(lsCard[i]) == 0 or IsComment(lsCard[i][0]) or len(lsCard[i][0].split()) == 0:
+                continue
+            sCard = lsCard[i][0].split()[0].lower()
+            if sCard.startswith('imp:'):
+                lsWords = list()
+                for s in lsCard[i]:
+                    if not IsComment(s):
+                        lsWords.extend(s.split('$')[0].split())
+                tdVal = ReadDataCardValues(lsWords[1:])[:iNbCell]
+                for sPart in sCard[4:].split(','):
+                    res["imp"][sPart] = np.full(iNbCell, np.nan)
+                    res["imp"][sPart][:len(tdVal)] = tdVal
+
+    res["bymat"] = {k: np.array(v, dtype=int) for k,v in dictMat.items()}
+    res["byuniv"] = {k: np.array(v, dtype=int) for k,v in dictUniv.items()}
+    res["bysurf"] = {k: np.array(sorted(v), dtype=int) for k,v in dictSurf.items()}
+
+    return res
+
+
+def _JsonTagNp(obj):
+    """
+    Replaces the numpy values of lists/dicts by tagged dicts, so that they
+    are written in JSON with their type.
+    """
+
+    if isinstance(obj, (np.generic, np.ndarray)):
+        return {"__np__": obj.dtype.str, "value": obj.tolist(), "array": isinstance(obj, np.ndarray)}
+    if isinstance(obj, (list, tuple)):
+        return [_JsonTagNp(o) for o in obj]
+    if isinstance(obj, dict):
+        return {k: _JsonTagNp(o) for k,o in obj.items()}
+    return obj
+
+
+def _JsonUntagNp(dictObj):
+    """
+    Decoding of the numpy values tagged by _JsonTagNp (object_hook of json).
+    """
+
+    if "__np__" in dictObj:
+        npValue = np.array(dictObj["value"], dtype=dictObj["__np__"])
+        return npValue if dictObj["array"] else npValue[()]
+    return dictObj
+
+
+def SaveElem(fid, dictElem, dictMeta=dict()):
+    """
+    Writes an element and its metadata in the binary file fid.
+    Format (little endian):
+    - magic SAVE_MAGIC, version (uint16), size of the header (uint32)
+    - header in JSON: metadata, keys of dictElem which are not lists of
+      integers or lines, names and sizes of the arrays
+    - arrays of int64: the lists of integers of dictElem (indexes of
+      sections, ranges of numbers)
+    - arrays of int32: number of lines of each card, end of each line in
+      the buffer
+    - buffer of the lines (utf-8)
+    """
+
+    dictHead = {"meta": dictMeta, "elem": dict(), "arrays": list(), "keys": list(dictElem.keys())}
+    lbArrays = list()
+    for sKey,value in dictElem.items():
+        if sKey == "fich":
+            continue
+        if isinstance(value, list) and all([type(i) is int for i in value]):
+            npValue = np.array(value, dtype='<i8')
+            dictHead["arrays"].append([sKey, len(npValue)])
+            lbArrays.append(npValue.tobytes())
+        else:
+            dictHead["elem"][sKey] = value
+
+    # Lines of the cards
+    lsLine = [s for lsCard in dictElem["fich"] for s in lsCard]
+    sBuffer = ''.join(lsLine)
+    npCount = np.array([len(lsCard) for lsCard in dictElem["fich"]], dtype='<i4')
+    npEnd = np.cumsum(np.array([len(s) for s in lsLine], dtype='<i8')).astype('<i4')
+    bBuffer = sBuffer.encode('utf-8')
+    dictHead["cards"] = len(npCount)
+    dictHead["lines"] = len(npEnd)
+    dictHead["buffer"] = len(bBuffer)
+
+    bHead = json.dumps(_JsonTagNp(dictHead)).encode('utf-8')
+    fid.write(SAVE_MAGIC + struct.pack('<HI', SAVE_VERSION, len(bHead)) + bHead)
+    for b in lbArrays:
+        fid.write(b)
+    fid.write(npCount.tobytes())
+    fid.write(npEnd.tobytes())
+    fid.write(bBuffer)
+
+
+def LoadElem(fid):
+    """
+    Reads an element written by SaveElem in the binary file fid.
+    Returns (dictElem, dictMeta), None if the file is not valid.
+    """
+
+    bData = fid.read()
+    iPos = len(SAVE_MAGIC) + struct.calcsize('<HI')
+    if bData[:len(SAVE_MAGIC)] != SAVE_MAGIC or len(bData) < iPos:
+        print("LoadElem: Warning, not a mcnpgo file.")
+        return None
+    iVersion, iSize = struct.unpack('<HI', bData[len(SAVE_MAGIC):iPos])
+    if iVersion != SAVE_VERSION:
+        print(f"LoadElem: Warning, version {iVersion} of the file not supported (version {SAVE_VERSION}).")
+        return None
+    dictHead = json.loads(bData[iPos:iPos+iSize].decode('utf-8'), object_hook=_JsonUntagNp)
+    iPos = iPos + iSize
+
+    dictElem = dict()
+    for sKey,iLen in dictHead["arrays"]:
+        dictElem[sKey] = np.frombuffer(bData, dtype='<i8', count=iLen, offset=iPos).tolist()
+        iPos = iPos + 8*iLen
+    npCount = np.frombuffer(bData, dtype='<i4', count=dictHead["cards"], offset=iPos)
+    iPos = iPos + 4*dictHead["cards"]
+    npEnd = np.frombuffer(bData, dtype='<i4', count=dictHead["lines"], offset=iPos)
+    iPos = iPos + 4*dictHead["lines"]
+    sBuffer = bData[iPos:iPos+dictHead["buffer"]].decode('utf-8')
+
+    # Lines, then cards
+    tiEnd = npEnd.tolist()
+    lsLine = [sBuffer[i:j] for i,j in zip([0] + tiEnd[:-1], tiEnd)]
+    tiCardEnd = np.cumsum(npCount).tolist()
+    dictElem["fich"] = [lsLine[i:j] for i,j in zip([0] + tiCardEnd[:-1], tiCardEnd)]
+    dictElem.update(dictHead["elem"])
+    dictElem = {sKey: dictElem[sKey] for sKey in dictHead["keys"]}
+
+    return dictElem, dictHead["meta"]
+
+
+# Cache of the included files: absolute path -> ((mtime, size), text)
+dictGIncludeCache = dict()
+
+# 'read file=' lines
+reGReadFile = re.compile(r"(?i)^\s*read\s(?:.*\s)?file\s*=\s*(\S+)")
+
+def ReadInclude(sFile):
+    """
+    Returns the content of an included file, read only once while the file
+    is not modified.
+    """
+
+    oStat = os.stat(sFile)
+    tKey = (oStat.st_mtime_ns, oStat.st_size)
+    oCache = dictGIncludeCache.get(sFile)
+    if oCache is None or oCache[0] != tKey:
+        with open(sFile,'r',errors='ignore') as fid:
+            oCache = (tKey, fid.read())
+        dictGIncludeCache[sFile] = oCache
+
+    return oCache[1]
+
+
+def ExpandIncludes(sFichier, sDir='', tsStack=()):
+    """
+    Replaces the 'read file=' lines of a file by the content of the included
+    files, recursively. The paths are relative to sDir (directory of the
+    including file), then to the current directory.
+    The lines of files not found or included recursively are left as they
+    are (and commented by _Caveats).
+    """
+
+    if 'read' not in sFichier.lower():
+        return sFichier
+
+    lsOut = list()
+    for sLine in sFichier.splitlines():
+        oMatch = reGReadFile.match(sLine.split('$')[0])
+        if oMatch is None or IsComment(sLine):
+            lsOut.append(sLine)
+            continue
+
+        # Included file
+        sFile = None
+        for sTry in (os.path.join(sDir, oMatch.group(1)), oMatch.group(1)):
+            if os.path.isfile(sTry):
+                sFile = os.path.abspath(sTry)
+                break
+        if sFile is None or sFile in tsStack:
+            lsOut.append(sLine)
+            continue
+
+        sText = ExpandIncludes(ReadInclude(sFile), os.path.dirname(sFile), tsStack + (sFile,))
+        lsOut.extend(sText.splitlines())
+
+    return '\n'.join(lsOut) + '\n'
+
+
+# Statistics of WriteIfChanged: files written, unchanged and bytes not rewritten
+dictGWriteStats = {"written": 0, "unchanged": 0, "saved": 0}
+
+def HashFile(sFile):
+    """
+    Returns the hash of the content of a file.
+    """
+
+    oHash = hashlib.sha256()
+    with open(sFile,'rb') as fid:
+        for bBlock in iter(lambda: fid.read(1 << 20), b''):
+            oHash.update(bBlock)
+
+    return oHash.hexdigest()
 
-                                        # Increment
-                                        i = i + 1
-                                # Reconstruction of the line
-                                if iNbReplace > 0:
-                                    ## Formatting to align the line endings
-                                    #sTemp = dictInfoLine["strdeb"] + '  ' + sLineCentre.strip()
-                                    sLineFin = dictInfoLine["strfin"]
-                                    sLineCom = dictInfoLine["strcom"]
-                                    # We complete until we reach column 80
-                                    #sLineFin = sLineFin.rjust(79-len(sTemp)) + '  ' + sLineCom
-                                    #strFichOut[iIndSurf_Rep][jSubLine] = dictInfoLine["strdeb"] + ' ' + sLineCentre.strip() + ' ' + sLineFin
 
-                                    strFichOut[iIndSurf_Rep][jSubLine] = dictInfoLine["strdeb"] + ' ' + sLineCentre.strip() + ' ' + sLineFin.strip() + ' ' + sLineCom.strip()
+def WriteIfChanged(sFile, lsText):
+    """
+    Writes a file only if its content changed, lsText being a string or a
+    list of strings (ex: the cards). The hash of the new content is computed
+    by blocks and compared with the one of the existing file, which is left
+    untouched (same mtime) if they are equal. Otherwise the file is written
+    in a temporary file then renamed, so that it is never seen half written.
+    The line ends are those of the platform, as for a file opened in text mode.
+    Returns True if the file was written.
+    """
 
-                            # We note if the line contains keywords
-                            # If yes, the rest of the cell does not contain surfaces
-                            if len(dictInfoLine['strfin']) > 0:
-                                break
+    if isinstance(lsText, str):
+        lsText = [lsText]
 
-    # It should be placed in the reconstruction of the line here, outside the renumbering
-    # The simplest thing is to redo GetCellGeo and update the line one last time with a formatting function
-    # It would be better to pass the strFichOut list as input and the function would handle the rest
+    def _Encode(sText):
+        return sText.replace('\n', os.linesep).encode()
 
-    # For the groups
-    if len(dictGroupes) > 0:
-        strFichOut[iGroupes] = json.dumps(dictGroupes)
+    # Hash and size of the new content
+    oHash = hashlib.sha256()
+    iSize = 0
+    for sText in lsText:
+        bText = _Encode(sText)
+        oHash.update(bText)
+        iSize = iSize + len(bText)
 
-    # The position of the cells, surfaces and tr remain the same
-    dictOut = deepcopy(dictElem)
-    dictOut["fich"] = deepcopy(strFichOut)
+    # Comparison with the existing file, the size first
+    if os.path.isfile(sFile) and os.path.getsize(sFile) == iSize and HashFile(sFile) == oHash.hexdigest():
+        dictGWriteStats["unchanged"] = dictGWriteStats["unchanged"] + 1
+        dictGWriteStats["saved"] = dictGWriteStats["saved"] + iSize
+        return False
+
+    sTemp = sFile + f".{os.getpid()}.tmp"
+    with open(sTemp,'wb') as fid:
+        for sText in lsText:
+            fid.write(_Encode(sText))
+    os.replace(sTemp, sFile)
+    dictGWriteStats["written"] = dictGWriteStats["written"] + 1
+
+    return True
 
-    return dictOut
 
 def _Caveats(sFichier,geom):
     """
@@ -794,18 +2428,7 @@ def ApplyTransfo(dictElemIn, lsInputTransfo0, sCommentTransfo):
     dictObjetTr = GetObjetInfoTr(dictElem)
 
     # Attribution d'un numero
-    i = 1
-    iTrMax = 10000
-    while i < iTrMax:
-        if i not in dictObjetTr["numtr"]:
-            iTr = i
-            break
-        i = i + 1
-
-    # Verif
-    if i == iTrMax:
-        print('Transform: Error, problem when attributing a new transform number (>10000)')
-        return
+    iTr = NumAlloc(dictObjetTr["numtr"]).Next()
 
     # On regarde si toutes les surfaces possedent une transfo
     # Si non, on ajoute le numero de transfo
@@ -958,44 +2581,117 @@ def ApplyTransfo(dictElemIn, lsInputTransfo0, sCommentTransfo):
     return dictElemRes
 
 
-def FormatImpOut(dictElemIn, imp='in'):
+def FormatDataCard(sCard, tsValues, iWidth=79):
+    """
+    Write a cell data card (IMP:N, VOL, TMP...) from its values given in the
+    order of the cells. Identical consecutive values use the MCNP repeat
+    notation (nR, nJ for the jumps) and lines are wrapped at iWidth columns.
+    Returns the list of lines.
+    """
+
+    # Start and length of the runs of identical values
+    npValues = np.asarray(tsValues,dtype=object)
+    lsWords = [sCard]
+    if len(npValues) > 0:
+        npStart = np.flatnonzero(np.concatenate(([True], npValues[1:] != npValues[:-1])))
+        npCount = np.diff(np.append(npStart,len(npValues)))
+
+        for iStart,iCount in zip(npStart,npCount):
+            sValue = str(npValues[iStart])
+            if sValue.lower() == 'j':
+                lsWords.append(f"{iCount}j" if iCount > 1 else 'j')
+            else:
+                lsWords.append(sValue)
+                if iCount > 1:
+                    lsWords.append(f"{iCount-1}r")
+
+    # Wrapping, continuation lines start with 5 spaces
+    lsLines = [lsWords[0]]
+    for sWord in lsWords[1:]:
+        if len(lsLines[-1]) + 1 + len(sWord) > iWidth:
+            lsLines.append(' '*5 + sWord)
+        else:
+            lsLines[-1] = lsLines[-1] + ' ' + sWord
+
+    return lsLines
+
+def FormatCellLine(lsNewLine, j, dictLigne, sLineFin):
+    """
+    Fonction ajoutant a lsNewLine la ligne j d'une cellule mise en forme
+    (commentaires a la colonne 80). dictLigne est la sortie de GetCellGeo,
+    sLineFin la fin de la ligne (mots clefs) a ecrire.
+    """
+
+    # On fait le choix de ne pas preserver la mise en forme initiale
+    if j == 0:
+        sLineDeb = dictLigne["strdeb"].strip() + ' ' + ' '.join(dictLigne["strgeo"].split())
+    else:
+        sLineDeb = ' '*6 + ' '.join(dictLigne["strgeo"].split())
+    sLineCom = dictLigne["strcom"].strip()
+
+    # Fusion des bouts
+    sLineDeb = sLineDeb + ' ' + sLineFin
+    if len(sLineCom) > 0:
+        sLineCom = ' '*(79-len(sLineDeb)) + sLineCom
+    sLine = sLineDeb + ' ' + sLineCom
+
+    if len(sLineDeb) == 0 or sLineDeb.isspace() == True:
+        # Si ligne vide, on met un commentaire a la fin de la ligne precedente
+        sLineCom = ' '*(79-len(lsNewLine[-1])) + sLineCom.strip()
+        lsNewLine[-1] = lsNewLine[-1] + sLineCom
+    else:
+        lsNewLine.append(sLine)
+
+
+def FormatCellCard(lsLine):
+    """
+    Fonction mettant en forme les lignes d'une cellule comme a l'ecriture
+    (voir FormatImpOut avec imp='in'), puis coupant les lignes trop longues.
+    Renvoie les nouvelles lignes.
+    """
+
+    lsNewLine = list()
+    for j,dictLigne in enumerate(GetCellLinesGeo(lsLine)):
+        FormatCellLine(lsNewLine, j, dictLigne, dictLigne["strfin"].strip())
+
+    return CutLongLines(lsNewLine)
+
+
+def FormatImpOut(dictElemIn, imp='in', data=()):
     """
     Fonction pour formatter correctement le fichier.
     Si "imp='out'", enleve les cartes "imp" et les mets dans le bloc des cartes.
+    Les autres mots clefs des cellules donnes dans data (ex: ['vol','tmp','pwt','wwn'])
+    sont aussi mis dans le bloc des cartes, 'j' pour les cellules sans valeur.
     """
 
     # Recopie
     dictElem = deepcopy(dictElemIn)
 
-    # Init dict des importances
+    # Init dict des importances et des autres cartes, une valeur par cellule
+    iNbCell = len(dictElem["cell"])
     dictImp = dict()
+    dictData = dict()
+    tsData = [sData.lower() for sData in data]
 
     # Mise en forme des cellules
     iFlagImpLine = False # Flag for imp cards
-    for i in dictElem["cell"]:
+    for iCell,i in enumerate(dictElem["cell"]):
         lsNewLine = list()
 
-        for j,sLigne in enumerate(dictElem["fich"][i]):
+        for j,dictLigne in enumerate(GetCellLinesGeo(dictElem["fich"][i])):
 
             # Info sur la ligne
-            dictLigne = GetCellGeo(sLigne)
-
-            # On fait le choix de ne pas preserver la mise en forme initiale
-            if j == 0:
-                sLineDeb = dictLigne["strdeb"].strip() + ' ' + ' '.join(dictLigne["strgeo"].split())
-            else:
-                sLineDeb = ' '*6 + ' '.join(dictLigne["strgeo"].split())
             sLineFin = dictLigne["strfin"].strip()
-            sLineCom = dictLigne["strcom"].strip()
 
-            # Gestion des importances
-            if imp != 'in':
+            # Gestion des importances et des autres cartes
+            if imp != 'in' or len(tsData) > 0:
                 # On enleve les cartes imp
                 lsLineFinNew = list()
                 for word in sLineFin.split():
-                    if 'imp' not in word.lower():
-                        lsLineFinNew.append(word)
-                    else:
+                    sKey = word.split('=')[0].lower()
+                    sName = sKey.split(':')[0]
+                    if imp != 'in' and 'imp' in word.lower():
                         # Imp cards were seen
                         iFlagImpLine = True
 
@@ -1006,25 +2702,24 @@ def FormatImpOut(dictElemIn, imp='in'):
                         # On rempli le dictionnaire par type de particules
                         for s in sImpPartType.split(','):
                             if s not in dictImp.keys():
-                                dictImp[s] = list()
-                            dictImp[s].append(sImpValue)
+                                dictImp[s] = np.full(iNbCell,'',dtype=object)
+                            dictImp[s][iCell] = sImpValue
                             # To be used later
 
-                sLineFin = ' '.join(lsLineFinNew)
+                    elif '=' in word and any([re.fullmatch(sData + r'\d*',sName) for sData in tsData]):
+                        # Lecture de la carte, ex: vol=1.0, pwt:n=-1, wwn1:n=0.5
+                        sCard = sName.upper() + sKey[len(sName):]
+                        if sCard not in dictData.keys():
+                            dictData[sCard] = np.full(iNbCell,'j',dtype=object)
+                        dictData[sCard][iCell] = word.split('=')[1].strip()
+
+                    else:
+                        lsLineFinNew.append(word)
 
+                sLineFin = ' '.join(lsLineFinNew)
 
             # Fusion des bouts
-            sLineDeb = sLineDeb + ' ' + sLineFin
-            if len(sLineCom) > 0:
-                sLineCom = ' '*(79-len(sLineDeb)) + sLineCom
-            sLine = sLineDeb + ' ' + sLineCom
-
-            if len(sLineDeb) == 0 or sLineDeb.isspace() == True:
-                # Si ligne vide, on met un commentaire a la fin de la ligne precedente
-                sLineCom = ' '*(79-len(lsNewLine[-1])) + sLineCom.strip()
-                lsNewLine[-1] = lsNewLine[-1] + sLineCom
-            else:
-                lsNewLine.append(sLine)
+            FormatCellLine(lsNewLine, j, dictLigne, sLineFin)
 
 
         # Mise a jour
@@ -1056,9 +2751,10 @@ def FormatImpOut(dictElemIn, imp='in'):
     # A partir d'ici on supprime potentiellement des elements de dictElem["fich"],
     # donc les numerotations des lignes ne sont plus bonnes
 
-    if imp != 'in':
+    if imp != 'in' or len(dictData) > 0:
 
         # On commence par supprimer les anciennes cartes imp si presentes
+        # ainsi que les cartes de donnees reprises des cellules
         lsListeIndexImp = list()
         for i in range(len(dictElem["fich"])):
             ligne = dictElem["fich"][i]
@@ -1067,67 +2763,41 @@ def FormatImpOut(dictElemIn, imp='in'):
                 # A priori la carte imp est sur une ligne unique
                 lsTemp = ligne[0].strip().split()
                 s = lsTemp[0]
-                if 'imp' in s.lower():
+                if imp != 'in' and 'imp' in s.lower():
                     # On enregistre l'index
                     lsListeIndexImp.append(i)
-
-
-
+                elif i > dictElem["saut"][1] and s.lower() in [sCard.lower() for sCard in dictData.keys()]:
+                    lsListeIndexImp.append(i)
 
         # On supprime les lignes
         for i in lsListeIndexImp.__reversed__():
             dictElem["fich"].pop(i)
 
         # Ajout des nouvelles cartes imp
-        # Nombre de cellules
-        iNbCell = len(dictElem["cell"])
         lsImpCard = list()
         #lsImpCard.append('c ' + '='*78)
         #lsImpCard.append('c ' + 'IMPORTANCES'.center(78))
         lsImpCard.append('c ' + '='*78)
 
         # If no cards were seen
-        if iFlagImpLine == False:
+        if imp != 'in' and iFlagImpLine == False:
             print("Warning: no cell imp cards were seen, assuming (n,p,e) importances of 1.")
             for sImpPartType in ['n','p','e']:
-                dictImp[sImpPartType] = ['1']*(iNbCell-1) + ['0']
-
+                dictImp[sImpPartType] = np.array(['1']*(iNbCell-1) + ['0'],dtype=object)
 
         for sImpPartType in dictImp.keys():
             # Verification
-            if len(dictImp[sImpPartType]) != iNbCell:
+            if np.count_nonzero(dictImp[sImpPartType] == '') > 0:
                 print(f"Warning: numbers of imp:{sImpPartType} cards not equal to number of cells (={iNbCell})")
                 print("Building IMP card is not possible.")
                 continue
 
-            # Debut
-            lsCurrentImpCard = list()
-            lsCurrentImpCard.append(f'IMP:{sImpPartType}')
-
-            # Boucle sur le reste
-            iCountSame = 0
-            for i,sImp in enumerate(dictImp[sImpPartType]):
-                if i == 0:
-                    sImpOld = sImp
-                    lsCurrentImpCard.append(sImp)
-                else:
-                    if sImp == sImpOld:
-                        # Same card as before
-                        iCountSame = iCountSame + 1
-                    else:
-                        # Different importance
-                        if iCountSame > 0:
-                            lsCurrentImpCard.append(f"{iCountSame}r")
-
-                        # Reset counter and add new value
-                        iCountSame = 0
-                        lsCurrentImpCard.append(sImp)
-
-                    # Update value
-                    sImpOld = sImp
-
             # Mise a jour
-            lsImpCard.append(' '.join(lsCurrentImpCard))
+            lsImpCard.extend(FormatDataCard(f'IMP:{sImpPartType}',dictImp[sImpPartType]))
+
+        # Autres cartes
+        for sCard in dictData.keys():
+            lsImpCard.extend(FormatDataCard(sCard,dictData[sCard]))
 
         # Insertion des cartes
         iIndInsert = dictElem["saut"][1] + 1
@@ -1142,55 +2812,65 @@ def FormatImpOut(dictElemIn, imp='in'):
 
     # Traitement des lignes trop longues
     for i in range(len(dictElem["fich"])):
-        lsNewLine = list()
-        for j in range(len(dictElem["fich"][i])):
+        dictElem["fich"][i] = CutLongLines(dictElem["fich"][i], i < iLigneLim)
 
-            # Ligne courante
-            sLine = dictElem["fich"][i][j]
+    # Mise a jour si besoin
+    dictElem = LectElem(dictElem["fich"])
 
-            # Si ligne trop longue
-            lsLongLine = list()
-            sTemp = sLine
-            if len(sLine) > 0 and sLine.isspace() == False \
-            and sLine.lower().startswith(('c','c ')) == False: # carte cut ?
-                # Si pas un commentaire, on traite
+    return dictElem
 
-                sTempCheck = sTemp[:sTemp.find('$')].rstrip()
-                while len(sTempCheck) >= 80:
-                    iIndCut = sTemp[:75].rfind(' ')
-
-                    # On coupe la ligne
-                    sSep = ''
-                    if '(' in sTemp[:iIndCut] and i < iLigneLim:
-                        # En cas de parentheses, on utilise les &
-                        sSep = ' &'
-                    lsLongLine.append(sTemp[:iIndCut] + sSep)
-
-                    # Mise a jour pour le prochain passage
-                    if i < iLigneLim:
-                        sTemp = '      ' + sTemp[iIndCut:].strip()
-                    else:
-                        sTemp = sTemp[iIndCut:].strip() # Pas d'espace en debut de ligne pour les groupes
-                    sTempCheck = sTemp[:sTemp.find('$')].rstrip()
 
-            # Fin de ligne
-            lsLongLine.append(sTemp)
-            lsNewLine.extend(lsLongLine)
+def CutLongLines(lsLine, bCard=True):
+    """
+    Fonction coupant les lignes de plus de 80 caracteres d'une carte.
+    Si bCard, les lignes suivantes sont indentees (suite de carte) et
+    les coupures entre parentheses utilisent des &, sinon (groupes) non.
+    Renvoie les nouvelles lignes.
+    """
 
-        # Mise a jour
-        dictElem["fich"][i] = lsNewLine
+    lsNewLine = list()
+    for sLine in lsLine:
+
+        # Si ligne trop longue
+        lsLongLine = list()
+        sTemp = sLine
+        if len(sLine) > 0 and sLine.isspace() == False \
+        and sLine.lower().startswith(('c','c ')) == False: # carte cut ?
+            # Si pas un commentaire, on traite
+
+            sTempCheck = sTemp[:sTemp.find('$')].rstrip()
+            while len(sTempCheck) >= 80:
+                iIndCut = sTemp[:75].rfind(' ')
+
+                # On coupe la ligne
+                sSep = ''
+                if '(' in sTemp[:iIndCut] and bCard:
+                    # En cas de parentheses, on utilise les &
+                    sSep = ' &'
+                lsLongLine.append(sTemp[:iIndCut] + sSep)
+
+                # Mise a jour pour le prochain passage
+                if bCard:
+                    sTemp = '      ' + sTemp[iIndCut:].strip()
+                else:
+                    sTemp = sTemp[iIndCut:].strip() # Pas d'espace en debut de ligne pour les groupes
+                sTempCheck = sTemp[:sTemp.find('$')].rstrip()
 
-    # Mise a jour si besoin
-    dictElem = LectElem(dictElem["fich"])
+        # Fin de ligne
+        lsLongLine.append(sTemp)
+        lsNewLine.extend(lsLongLine)
 
-    return dictElem
+    return lsNewLine
 
 
-def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
+def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict(), dictCellBox = dict(), sBound = 'rpp', dMargin = 1.):
     """
     Fonction pour extraire une liste de cellule d'un element.
-    Par defaut, une cellule englobante de rayon 20m est ajoute pour visualiser
-    le fichier avec mcnp.
+    Une cellule englobante est ajoutee pour visualiser le fichier avec mcnp :
+    RPP ou SPH (sBound 'rpp' ou 'sph') englobant les boites des cellules
+    extraites (dictCellBox, {numero: boite}, voir CellBBoxes) avec une marge
+    dMargin, ou sphere de rayon radius si sBound = 'radius' ou si une cellule
+    n'est pas bornee.
     Cette fonction peut etre utilise pour ensuite faire une insertion par cellule,
     l'insertion par surface englobante ne fonctionnant pas dans le cas general.
     """
@@ -1211,6 +2891,7 @@ def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
     tiNewCell = list()
     strCellules = list()
     tiNumCellFinal = list()
+    tiNumCellComp = list() # Cellules hors univers, pour le monde interieur
     iFlagCartes = 0
     tiListeSurface = list()
     strSurfaces = list()
@@ -1379,6 +3060,8 @@ def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
 
                         # Ajout de la cellule a la liste des numeros
                         tiNumCellFinal.append(iNumCell)
+                        if GetCellUniv([sLigne]) == 0:
+                            tiNumCellComp.append(iNumCell)
 
                         # Ajout des cellules, surfaces, materiaux
                         tiMat.extend(dictCell["mat"])
@@ -1441,49 +3124,17 @@ def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
         print("Extract: Error, provided cells are not found in file. Extract function will generate an empty object.")
         sys.exit()
 
-    # Gestion des groupes
+    # Gestion des groupes, par l'index inverse des numeros
     dictGroupesExtract = dict()
     if len(dictGroupes) > 0:
-        for sKey in dictGroupes.keys():
-            d = dictGroupes[sKey]
-            if "cell" in d.keys():
-                tiGroupeExtract = list()
-                for iGroup in d["cell"]:
-                    # On recupere les numeros qui sont encore dans le nouvel objet
-                    if iGroup in tiNumCellFinal:
-                        tiGroupeExtract.append(iGroup)
-
-                # Remplissage
-                if len(tiGroupeExtract) > 0:
-                    if sKey not in dictGroupesExtract:
-                        dictGroupesExtract[sKey] = dict()
-                    dictGroupesExtract[sKey]["cell"] = tiGroupeExtract
-
-            if "surf" in d.keys():
-                tiGroupeExtract = list()
-                for iGroup in d["surf"]:
-                    # On recupere les numeros qui sont encore dans le nouvel objet
-                    if iGroup in tiNumSurfFinal:
-                        tiGroupeExtract.append(iGroup)
-
-                # Remplissage
-                if len(tiGroupeExtract) > 0:
-                    if sKey not in dictGroupesExtract:
-                        dictGroupesExtract[sKey] = dict()
-                    dictGroupesExtract[sKey]["surf"] = tiGroupeExtract
-
-            if "trans" in d.keys():
-                tiGroupeExtract = list()
-                for iGroup in d["trans"]:
-                    # On recupere les numeros qui sont encore dans le nouvel objet
-                    if iGroup in tiTrans:
-                        tiGroupeExtract.append(iGroup)
-
-                # Remplissage
-                if len(tiGroupeExtract) > 0:
-                    if sKey not in dictGroupesExtract:
-                        dictGroupesExtract[sKey] = dict()
-                    dictGroupesExtract[sKey]["trans"] = tiGroupeExtract
+        oGroups = GroupIndex(dictGroupes, tsFields=('cell','surf','trans'))
+        dictKept = {"cell": oGroups.Filter('cell', tiNumCellFinal),
+                    "surf": oGroups.Filter('surf', tiNumSurfFinal),
+                    "trans": oGroups.Filter('trans', tiTrans)}
+        for sKey,d in dictGroupes.items():
+            for sField in ("cell","surf","trans"):
+                if sKey in dictKept[sField]:
+                    dictGroupesExtract.setdefault(sKey, dict())[sField] = dictKept[sField][sKey]
 
             if "comment" in d.keys():
                 if sKey in dictGroupesExtract:
@@ -1507,7 +3158,7 @@ def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
     # Construction du monde interieur
     # peut etre fait plus simplement avec un ' #'.join() ?
     sTemp = str(iMaxCell+1) + ' 0 '
-    for iCell in tiNumCellFinal:
+    for iCell in tiNumCellComp:
         sTemp = sTemp + '#' + str(iCell) + ' '
         if len(sTemp) + 10 > 80:
             lsFichierOut.append(sTemp)
@@ -1532,7 +3183,7 @@ def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
     # Surface du monde exterieur
     # A voir avec un mode d'extraction par cellules pour insertion par cellule
     # On peut aussi ignorer les deux dernieres cellules pour l'insertion par cellule
-    lsFichierOut.append(str(iMaxSurf+1) + ' SO ' + str(radius))
+    lsFichierOut.append(str(iMaxSurf+1) + ' ' + BoundingCard([dictCellBox.get(i) for i in tiNumCellComp], radius, sBound, dMargin))
 
     # Ligne vide
     lsFichierOut.append(' ')
@@ -1555,6 +3206,34 @@ def Extract(lsLignesInput, tiListeInputCell, radius, dictGroupes = dict()):
 
     return dictOut
 
+def BoundingCard(lsBox, radius, sBound = 'rpp', dMargin = 1.):
+    """
+    Fonction renvoyant la surface englobante (sans numero) des boites lsBox
+    (voir CellBBoxes) : RPP ou SPH (sBound 'rpp' ou 'sph') avec une marge
+    dMargin, arrondie vers l'exterieur au cm. Renvoie la sphere 'SO radius'
+    si sBound = 'radius' ou si une boite est inconnue (None) ou infinie.
+    """
+
+    if sBound == 'radius' or len(lsBox) == 0 or any([npBox is None for npBox in lsBox]):
+        return 'SO ' + str(radius)
+    npBoxes = np.array(lsBox)
+    if not np.all(np.isfinite(npBoxes)):
+        return 'SO ' + str(radius)
+
+    # Boite englobante, les boites vides sont ignorees
+    npBoxes = npBoxes[(npBoxes[:,0::2] <= npBoxes[:,1::2]).all(axis=1)]
+    if len(npBoxes) == 0:
+        return 'SO ' + str(radius)
+    npMin = np.floor(npBoxes[:,0::2].min(axis=0) - dMargin)
+    npMax = np.ceil(npBoxes[:,1::2].max(axis=0) + dMargin)
+
+    if sBound == 'sph':
+        npCenter = (npMin + npMax)/2
+        dRadius = np.ceil(np.linalg.norm(npMax - npCenter))
+        return 'SPH ' + ' '.join([f"{d:.10g}" for d in npCenter]) + f" {dRadius:.10g}"
+
+    return 'RPP ' + ' '.join([f"{d:.10g}" for d in np.ravel(np.column_stack((npMin, npMax)))])
+
 def IsComment(sLine):
     """
     Fonction pour identifier si une ligne est un commentaire.
@@ -1602,11 +3281,8 @@ def GetKeyWordAsStr(sLine,sKey):
     iEgal = sLine.find('=',iKey)
 
     # On identifie ou est la fin
-    iFinMin = len(sLine)
-    for s in tsGCellKeyWords:
-        iFin = sLine.find(s,iEgal)
-        if iFin < iFinMin and iFin >= 0:
-            iFinMin = iFin
+    oMatch = reGCellKeyWords.search(sLine,iEgal if iEgal >= 0 else len(sLine)-1)
+    iFinMin = oMatch.start() if oMatch else len(sLine)
 
     # Resultat
     sLineKey = sLine0[iEgal+1:iFinMin]
@@ -1616,6 +3292,22 @@ def GetKeyWordAsStr(sLine,sKey):
     return sLineKey, sLineStart, sLineFin
 
 
+def SplitCellLine(sLine):
+    """
+    Splits a continuation line of a cell card without interpreting its data
+    (surfaces or universes of a fill card, repeats nR included).
+    Returns the leading spaces, the data before the first keyword, the
+    keywords and the comment.
+    """
+
+    sPart, sSep, sCom = sLine.partition('$')
+    oMatch = reGCellKeyWords.search(sPart.lower())
+    iFinMin = oMatch.start() if oMatch else len(sPart)
+    sDeb = sPart[:len(sPart) - len(sPart.lstrip())]
+
+    return sDeb, sPart[len(sDeb):iFinMin].strip(), sPart[iFinMin:].strip(), (sSep + sCom).strip()
+
+
 def GetLikeBut(sLine):
     """
     Renvoie la cellule entre like et but sous forme d'un entier.
@@ -1642,6 +3334,86 @@ def GetCellMat(sLine):
 
     return res
 
+def MatMapping(num_cell, mat=0, dens=0):
+    """
+    Returns the dictionary {cell: (mat, dens)} of a SwapCellMat input (cell
+    numbers with a material, or a dictionary {cell: (mat, dens)}), the void
+    cells (mat or dens equal to 0) being (0, 0).
+    """
+
+    if isinstance(num_cell, dict):
+        dictMap = {int(iCell): tuple(value) for iCell,value in num_cell.items()}
+    else:
+        if isinstance(num_cell, (int, np.integer)):
+            num_cell = [num_cell]
+        dictMap = {int(iCell): (mat, dens) for iCell in num_cell}
+
+    # If materiau vide
+    for iCell,(iMat,dDens) in dictMap.items():
+        if iMat == 0 or dDens == 0:
+            dictMap[iCell] = (0, 0)
+
+    return dictMap
+
+
+reGLikeMat = re.compile(r"(?i)(?<!\S)mat\s*=\s*\S+")
+reGLikeRho = re.compile(r"(?i)(?<!\S)rho\s*=\s*\S+")
+
+def SwapCardMat(lsLine, iMat, dDens):
+    """
+    Fonction remplacant le materiau et la densite d'une cellule.
+    Prend en entree toutes les lignes de la cellule, renvoie les nouvelles
+    lignes (lsLine n'est pas modifie).
+    iMat = 0 pour du vide, iMat = -1 pour ne changer que la densite,
+    dDens est une masse volumique (g/cm3), ecrite en negatif.
+    Pour les cellules like ... but, les mots clefs mat= et rho= sont reecrits.
+    """
+
+    lsOut = list(lsLine)
+    dictCell = GetCellGeo(lsOut[0])
+
+    # Cellule classique: reconstruction de la premiere ligne
+    if GetLikeBut(lsOut[0]) is None:
+        if iMat == 0:
+            sMat = ' 0 '
+        elif iMat == -1:
+            if dictCell["mat"][0] == 0:
+                return lsOut
+            sMat = ' ' + str(dictCell["mat"][0]) + ' -' + str(abs(dDens)) + ' '
+        else:
+            sMat = ' ' + str(iMat) + ' -' + str(abs(dDens)) + ' '
+        lsOut[0] = str(dictCell["num"]) + sMat \
+         + dictCell["strgeo"] + ' ' + dictCell["strfin"] + ' ' + dictCell["strcom"]
+        return lsOut
+
+    # Like but: on enleve les anciens mots clefs
+    lsNew = list()
+    for j,sLine in enumerate(lsOut):
+        if IsComment(sLine):
+            lsNew.append(sLine)
+            continue
+        iCom = sLine.find('$')
+        sData, sCom = (sLine[:iCom], sLine[iCom:]) if iCom >= 0 else (sLine, '')
+        if iMat != -1:
+            sData = reGLikeMat.sub('', sData)
+        sData = reGLikeRho.sub('', sData)
+        if j > 0 and sData.isspace() and len(sCom) == 0:
+            # Ligne de suite vide: elle terminerait le bloc
+            continue
+        lsNew.append(sData + sCom)
+
+    # Puis on ajoute les nouveaux apres le but
+    lsKey = list()
+    if iMat != -1:
+        lsKey.append(f"mat={iMat}")
+    if iMat != 0:
+        lsKey.append(f"rho=-{abs(dDens)}")
+    oMatch = re.search(r"(?i)\bbut\b", lsNew[0])
+    lsNew[0] = lsNew[0][:oMatch.end()] + ' ' + ' '.join(lsKey) + lsNew[0][oMatch.end():]
+
+    return lsNew
+
+
 def SwapMatNumber(dictInput,iMatNumberNew,iMatNumber):
     """
     Echange un numero de carte materiau en le repercutant dans les cellules.
@@ -1700,8 +3472,7 @@ def GatherCellGeo(lsLine):
     Gres["cell"] = []
     Gres["surf"] = []
     iFlagFin = False
-    for l in lsLine:
-        res = GetCellGeo(l)
+    for res in GetCellLinesGeo(lsLine):
 
         # Cette partie n'a de sens que si la fin n'a pas encore ete atteinte
         if iFlagFin is False:
@@ -1721,6 +3492,28 @@ def GatherCellGeo(lsLine):
 
     return Gres
 
+def GetCellLinesGeo(lsLine):
+    """
+    GetCellGeo pour chaque ligne d'une cellule. Les lignes qui suivent le
+    debut des mots clefs ne sont pas interpretees comme de la geometrie
+    (ex: suite d'un tableau fill avec des repetitions 2r), res["surf"] et
+    res["cell"] sont vides pour ces lignes.
+    """
+
+    lsRes = list()
+    bFin = False
+    for sLine in lsLine:
+        if bFin and not IsComment(sLine):
+            sDeb, sData, sFin, sCom = SplitCellLine(sLine)
+            res = {"num": 0, "mat": [], "strdeb": sDeb, "strgeo": sData, "strfin": sFin,
+                   "strcom": sCom, "cell": [], "surf": []}
+        else:
+            res = GetCellGeo(sLine)
+            bFin = bFin or len(res["strfin"]) > 0
+        lsRes.append(res)
+
+    return lsRes
+
 def GetCellGeo(sLine):
     """
     Recupere les elements geometriques de la cellule.
@@ -1787,11 +3580,8 @@ def GetCellGeo(sLine):
             iStart = 3
 
     # On recupere la fin
-    iFinMin = len(sLine)
-    for i in tsGCellKeyWords:
-        iFin = sLine.find(i)
-        if iFin < iFinMin and iFin >= 0:
-            iFinMin = iFin
+    oMatch = reGCellKeyWords.search(sLine)
+    iFinMin = oMatch.start() if oMatch else len(sLine)
     iComm = sLine.find('$')
     if iComm > 0:
         res["strfin"] = sLine0[iFinMin:iComm].strip()
@@ -2006,6 +3796,227 @@ def GetObjetInfoTr(dictFich):
     return res
 
 
+class NumAlloc:
+    """
+    Allocator of free numbers (cells, surfaces, transforms, materials,
+    universes or tallies).
+    The numbers in use are stored in a set and the next free number is found
+    with a cursor that only moves forward, each allocation is thus O(1)
+    amortized, whatever the number of cards.
+
+    Example:
+    oAlloc = NumAlloc([1,2,5])
+    oAlloc.Next()      # 3
+    oAlloc.Next()      # 4
+    oAlloc.Next()      # 6
+    oAlloc.Next(100)   # 100, first free number from 100
+    """
+
+    def __init__(self, tiUsed=(), start=1, step=1):
+        self._setUsed = set(tiUsed)
+        self._iStart = start
+        self._iStep = step
+        self._iCursor = start
+
+    def __contains__(self, iNum):
+        return iNum in self._setUsed
+
+    def __len__(self):
+        return len(self._setUsed)
+
+    def __iter__(self):
+        return iter(self._setUsed)
+
+    def Add(self, iNum):
+        """
+        Marks a number as used.
+        """
+        self._setUsed.add(iNum)
+
+    def Remove(self, iNum):
+        """
+        Marks a number as free.
+        """
+        self._setUsed.discard(iNum)
+        if iNum >= self._iStart and iNum < self._iCursor and (iNum - self._iStart)%self._iStep == 0:
+            self._iCursor = iNum
+
+    def Next(self, iFrom=None):
+        """
+        Returns a free number and marks it as used.
+        If iFrom is given, returns the first free number from iFrom (with the
+        same step), otherwise the lowest free number.
+        """
+
+        if iFrom is None:
+            while self._iCursor in self._setUsed:
+                self._iCursor = self._iCursor + self._iStep
+            iNum = self._iCursor
+            self._iCursor = self._iCursor + self._iStep
+        else:
+            iNum = iFrom
+            while iNum in self._setUsed:
+                iNum = iNum + self._iStep
+
+        self._setUsed.add(iNum)
+
+        return iNum
+
+
+class GroupIndex:
+    """
+    Groups with a reverse index of their numbers:
+    index[field][number] = [(group, position), ...] for the fields
+    cell, surf, trans and univ.
+    A renumbering or a filter only touches the entries of the numbers
+    concerned, and the groups are serialized once at the end (Dumps).
+
+    Example:
+    oGroups = GroupIndex(dictElem["groups"])
+    oGroups.Swap('cell', 3, 10)             # cells 3 and 10 interchanged
+    oGroups.Map('trans', {1: 5, 2: 6})
+    dictKept = oGroups.Filter('surf', [1,2,3])
+    sJson = oGroups.Dumps()
+    """
+
+    def __init__(self, dictGroups, tsFields=('cell','surf','trans','univ')):
+        self.groups = deepcopy(dictGroups)
+        self.index = {sField: dict() for sField in tsFields}
+        for sKey,dictGroup in self.groups.items():
+            if not isinstance(dictGroup, dict):
+                continue
+            for sField in tsFields:
+                for iPos,iNum in enumerate(dictGroup.get(sField,[])):
+                    self.index[sField].setdefault(iNum, []).append((sKey, iPos))
+
+    def __len__(self):
+        return len(self.groups)
+
+    def Swap(self, sField, iNum, iNumRep):
+        """
+        Interchanges the numbers iNum and iNumRep in the field of the groups.
+        """
+
+        dictIndex = self.index[sField]
+        lsEntry = dictIndex.pop(iNum, [])
+        lsEntryRep = dictIndex.pop(iNumRep, [])
+        for sKey,iPos in lsEntry:
+            self.groups[sKey][sField][iPos] = iNumRep
+        for sKey,iPos in lsEntryRep:
+            self.groups[sKey][sField][iPos] = iNum
+        if len(lsEntry) > 0:
+            dictIndex[iNumRep] = lsEntry
+        if len(lsEntryRep) > 0:
+            dictIndex[iNum] = lsEntryRep
+
+    def Map(self, sField, dictMap):
+        """
+        Replaces the numbers of the field by their correspondence
+        {old number: new number}, all at once.
+        """
+
+        dictIndex = self.index[sField]
+        dictMoved = {iNum: dictIndex.pop(iNum) for iNum in dictMap.keys() if iNum in dictIndex}
+        for iNum,lsEntry in dictMoved.items():
+            for sKey,iPos in lsEntry:
+                self.groups[sKey][sField][iPos] = dictMap[iNum]
+            dictIndex.setdefault(dictMap[iNum], []).extend(lsEntry)
+
+    def Filter(self, sField, tiKeep):
+        """
+        Returns the numbers of the field which are in tiKeep, by group
+        {group: [numbers]} in the order of the groups (groups without any
+        number kept are not returned).
+        """
+
+        dictPos = dict()
+        for iNum in set(tiKeep):
+            for sKey,iPos in self.index[sField].get(iNum, []):
+                dictPos.setdefault(sKey, []).append(iPos)
+
+        dictRes = dict()
+        for sKey in self.groups.keys():
+            if sKey in dictPos:
+                dictRes[sKey] = [self.groups[sKey][sField][i] for i in sorted(dictPos[sKey])]
+
+        return dictRes
+
+    def Dumps(self):
+        """
+        Returns the groups in JSON.
+        """
+
+        return json.dumps(self.groups)
+
+
+def GetCellUniv(lsLine):
+    """
+    Fonction recuperant le numero d'univers (u=) d'une cellule.
+    Prend en entree toutes les lignes de la cellule, renvoie 0 si pas d'univers.
+    """
+
+    for sLine in lsLine:
+        oMatch = re.search(r"(?:^|\s)u\s*=\s*(-?\d+)", sLine.split('$')[0].lower())
+        if oMatch is not None:
+            return abs(int(oMatch.group(1)))
+
+    return 0
+
+
+def AddCellKeyWord(lsLine, sKeyWord):
+    """
+    Fonction ajoutant un mot clef (ex: 'u=2') a la fin d'une cellule, avant
+    les commentaires de la derniere ligne.
+    Prend en entree toutes les lignes de la cellule, modifie lsLine.
+    """
+
+    # Derniere ligne qui n'est pas un commentaire
+    iLine = len(lsLine) - 1
+    while iLine > 0 and IsComment(lsLine[iLine]):
+        iLine = iLine - 1
+
+    sLine = lsLine[iLine]
+    iComm = sLine.find('$')
+    if iComm >= 0:
+        lsLine[iLine] = sLine[:iComm].rstrip() + ' ' + sKeyWord + ' ' + sLine[iComm:]
+    else:
+        lsLine[iLine] = sLine.rstrip() + ' ' + sKeyWord
+
+    return lsLine
+
+
+def BuildNumAlloc(dictElem, sType):
+    """
+    Returns a NumAlloc containing the numbers in use in dictElem (output of
+    LectElem) for sType in "cell", "surf", "trans", "mat" or "univ".
+    """
+
+    # Init
+    tiUsed = list()
+
+    if sType == "cell":
+        for i in dictElem["cell"]:
+            tiUsed.append(GetCellNum(dictElem["fich"][i][0]))
+    elif sType == "surf":
+        for i in dictElem["surf"]:
+            tiUsed.append(GetLineNum(dictElem["fich"][i][0]))
+    elif sType == "trans":
+        tiUsed = GetObjetInfoTr(dictElem)["numtr"]
+    elif sType == "mat":
+        for i in dictElem["matall"]:
+            tiUsed.append(GetCardNumber(dictElem["fich"][i][0]))
+    elif sType == "univ":
+        for i in dictElem["cell"]:
+            iUniv = GetCellUniv(dictElem["fich"][i])
+            if iUniv > 0:
+                tiUsed.append(iUniv)
+    else:
+        print(f"BuildNumAlloc: Error, unknown type ({sType} ?).")
+        sys.exit()
+
+    return NumAlloc(tiUsed)
+
+
 def AddTrSurf(sLine,iTr):
     """
     Fonction pout ajouter un numero de transfo a une carte surface
@@ -2119,11 +4130,7 @@ def UpdateTrclCstTrStr(sStart,sTemp,iFlagStar,listArgs):
 
     elif listArgs[0] == 'cst2num':
         dictElem = listArgs[1]
-        liAddTr = listArgs[2]
-
-        # Info sur les transfo
-        dictObjetTr = GetObjetInfoTr(dictElem)
-        liAddTr.extend(dictObjetTr["numtr"])
+        oAllocTr = listArgs[2]
 
     elif listArgs[0] == 'num2num':
         tiNumTrRep = listArgs[1]
@@ -2159,7 +4166,7 @@ def UpdateTrclCstTrStr(sStart,sTemp,iFlagStar,listArgs):
             iFlagConv = True
 
             # Remplacement
-            sTemp = CstTr2NumTr(sData,dictElem,liAddTr,iFlagStar)
+            sTemp = CstTr2NumTr(sData,dictElem,oAllocTr,iFlagStar)
 
         elif len(sData.split()) > 1 and iFlagStar == True and listArgs[0] == 'conv':
             # C'est une transfo
@@ -2222,11 +4229,7 @@ def UpdateFillCstTrStr(sStart,sTemp,iFlagStar,listArgs):
 
     elif listArgs[0] == 'cst2num':
         dictElem = listArgs[1]
-        liAddTr = listArgs[2]
-
-        # Info sur les transfo
-        dictObjetTr = GetObjetInfoTr(dictElem)
-        liAddTr.extend(dictObjetTr["numtr"])
+        oAllocTr = listArgs[2]
 
     elif listArgs[0] == 'num2num':
         tiNumTrRep = listArgs[1]
@@ -2235,6 +4238,10 @@ def UpdateFillCstTrStr(sStart,sTemp,iFlagStar,listArgs):
     elif listArgs[0] == 'read':
         tiNumTrRead = listArgs[1]
 
+    elif listArgs[0] == 'univ':
+        # Universes renumbering, see RenumFillUniv
+        return sStart + RenumFillUniv(sTemp,listArgs[1],listArgs[2])
+
     elif listArgs[0] == 'conv':
         # Convert to cosinuses
         pass
@@ -2272,7 +4279,7 @@ def UpdateFillCstTrStr(sStart,sTemp,iFlagStar,listArgs):
                 iFlagConv = True
 
                 # Remplacement
-                sTemp = sTemp[:iPar1+1] + CstTr2NumTr(sData,dictElem,liAddTr,iFlagStar) + sTemp[iPar2:]
+                sTemp = sTemp[:iPar1+1] + CstTr2NumTr(sData,dictElem,oAllocTr,iFlagStar) + sTemp[iPar2:]
 
             elif len(sData.split()) == 1 and listArgs[0] == 'num2num':
                 # C'est un numero de transfo
@@ -2368,10 +4375,11 @@ def NumTr2CstTr(sData,ldictTrList,liNumList):
 
     return sTrCard
 
-def CstTr2NumTr(sData,dictElem,liAddTr,iFlagStar):
+def CstTr2NumTr(sData,dictElem,oAllocTr,iFlagStar):
     """
     Fonction pour remplacer une tr cst par un numero et ajouter une carte de
-    transformée
+    transformée.
+    oAllocTr is the NumAlloc of the transform numbers of dictElem.
     """
 
     # Unit of the card
@@ -2379,20 +4387,8 @@ def CstTr2NumTr(sData,dictElem,liAddTr,iFlagStar):
     if iFlagStar == True:
         sUnit = '*'
 
-    # Max tr number
-    iTrMax = 10000
-
     # Attribution d'un numero de tr
-    j = 1
-    while j < iTrMax:
-        if j not in liAddTr:
-            iTr = j
-            break
-        j = j + 1
-
-    # Verif
-    if j == iTrMax:
-        print('Warning, transform number > 10000')
+    iTr = oAllocTr.Next()
 
     # Transfo cst lue
     lTrans = [float(ss) for ss in sData.split()]
@@ -2411,7 +4407,7 @@ def CstTr2NumTr(sData,dictElem,liAddTr,iFlagStar):
     #lsLineTr = [f'{sUnit}tr{iTr} ' + sData]
 
     # Insertion de la carte a la suite des autres
-    if len(liAddTr) == 0:
+    if len(dictElem["trans"]) == 0:
         # Si pas de carte tr, insertion au debut du bloc carte
         dictElem["trans"].append(dictElem["saut"][1] + 1)
         dictElem["fich"].insert(dictElem["trans"][0], lsLineTr)
@@ -2419,9 +4415,6 @@ def CstTr2NumTr(sData,dictElem,liAddTr,iFlagStar):
         dictElem["fich"].insert(dictElem["trans"][-1] + 1, lsLineTr)
         dictElem["trans"].append(dictElem["trans"][-1] + 1) # ATTENTION, si d'autres categorie de carte alors a mettre a jour aussi
 
-    # Ajout a la liste pour ne pas mettre deux fois le meme sur une meme ligne
-    liAddTr.append(iTr)
-
     return str(iTr)
 
 
@@ -2481,12 +4474,8 @@ def UpdateCellTransform(lsLine,sKey,*wargs):
                 #     iKey = sLineStart.lower().find('*' + sKey)
                 #     sLineStart = sLineStart[:iKey] + ' ' + sKey + sLineStart[iKey+5:]
         else:
-            if iFlagFill == True:
-                # Detournement de GetCellGeo pour les sKey sur plusieurs lignes
-                # Bricolage
-                dLineFill = GetCellGeo(sLine)
-                if len(dLineFill['strgeo']) > 0:
-                    sLineKey = dLineFill['strgeo']
+            # Suite de sKey sur une ligne de continuation
+            sLineDeb, sLineKey, sLineKeyFin, sLineCom = SplitCellLine(sLine)
 
         # Mot clef present
         if len(sLineKey) > 0:
@@ -2495,19 +4484,20 @@ def UpdateCellTransform(lsLine,sKey,*wargs):
                 # Substitution
                 sLine = fctUpdate(sLineStart,sLineKey,iFlagStar,wargs) + sLineFin
             else:
-                sLine = fctUpdate(dLineFill['strdeb'],sLineKey,iFlagStar,wargs) \
-                    + ' ' + dLineFill['strfin'] \
-                    + ' ' + dLineFill['strcom']
+                sLine = fctUpdate(sLineDeb,sLineKey,iFlagStar,wargs) \
+                    + ' ' + sLineKeyFin \
+                    + ' ' + sLineCom
 
             # Mise a jour ligne
             lsLine[iLine] = sLine
 
-            # Fin de la carte
-            if iFlagFill == True and len(dLineFill['strfin']) > 0:
+        # Fin de la carte
+        if iFlagFill == True:
+            if len(sLineKeyFin) > 0:
                 iFlagFill = False
-            else:
-                # Au cas où sKey continue sur plusieurs lignes
-                iFlagFill = True
+        elif len(sLineKey) > 0 and len(sLineFin.split('$')[0].strip()) == 0:
+            # Au cas où sKey continue sur plusieurs lignes
+            iFlagFill = True
 
     return lsLine
 
@@ -2567,16 +4557,22 @@ def SwapCstTrclByNum(dictElemIn, addtr=list()):
     """
     Fonction pour remplacer les transformées de trcl et fill constante par un
     numéro de transformée. On ajoute une transformée au fichier.
+    addtr : transform numbers that must not be used.
     """
 
     # Init
     dictElem = deepcopy(dictElemIn)
 
+    # Allocator of transform numbers, shared by all the cells
+    oAllocTr = BuildNumAlloc(dictElem,"trans")
+    for iTr in addtr:
+        oAllocTr.Add(iTr)
+
     # On parcourt les cellules pour les cartes fill et trcl
     for sKey in ['trcl','fill']:
         for iCell in dictElem["cell"]:
             # Modifie dictElem
-            UpdateCellTransform(dictElem["fich"][iCell],sKey,'cst2num',dictElem,addtr)
+            UpdateCellTransform(dictElem["fich"][iCell],sKey,'cst2num',dictElem,oAllocTr)
 
         # Mise a jour
         dictElem = LectElem(dictElem["fich"])
@@ -2584,6 +4580,417 @@ def SwapCstTrclByNum(dictElemIn, addtr=list()):
     return dictElem
 
 
+def CanonicalTr(dictTr0):
+    """
+    Returns the canonical form of a transform (output of ReadTrCard):
+    cosinuses, forward transform and values rounded to ROUND_TR.
+    The result is a tuple of 12 floats (translation + rotation matrix)
+    that can be used as a hash key.
+    """
+
+    # Conversion to cosinuses
+    dictTr = ConvertDictTr(dictTr0)
+
+    # Vector and matrix of the card
+    npTrans = np.array(dictTr["translat"])
+    npMat = np.array(dictTr["rot"]).reshape(3,3)
+
+    # Dealing with reverse transforms
+    if dictTr["sens"] == -1:
+        npTrans = -npMat.T.dot(npTrans)
+
+    # Rounding, + 0.0 to avoid distinct keys for 0.0 and -0.0
+    tdCanon = tuple(round(d,ROUND_TR) + 0.0 for d in list(npTrans) + list(npMat.reshape(9)))
+
+    return tdCanon
+
+
+def FormatTrCard(iTr, tdCanon, sCom=''):
+    """
+    Writes a transform card from its canonical form (see CanonicalTr).
+    Returns a list of lines.
+    """
+
+    lsLineTr = list()
+    sTemp = 'tr' + str(iTr) + '  '
+    for d in tdCanon[0:3]:
+        sTemp = sTemp + round(d,ROUND_TR).__format__(FORMAT_TR) + ' '
+    if len(sCom) > 0:
+        sTemp = sTemp + ' ' + sCom
+    lsLineTr.append(sTemp)
+    for j in range(3):
+        sTemp = '      '
+        for d in tdCanon[3+j*3:6+j*3]:
+            sTemp = sTemp + round(d,ROUND_TR).__format__(FORMAT_TR) + ' '
+        lsLineTr.append(sTemp)
+
+    return lsLineTr
+
+
+def MergeTrCards(dictElemIn):
+    """
+    Function to merge identical transform cards.
+    All the cards are converted to their canonical form (cosinuses, forward
+    transform, values rounded to ROUND_TR), duplicates are removed and the
+    references of surfaces, trcl/fill cards and groups are updated to the
+    remaining card.
+    Does not modify dictElemIn.
+    """
+
+    # Init
+    dictElem = deepcopy(dictElemIn)
+    dictGroupes = dictElem.get("groups",dict())
+    dictCanon = dict()
+    tiNumTr = list()
+    tiNumTrRep = list()
+    dictNumTrRep = dict()
+    tiIndRemove = list()
+
+    # Canonical form of the cards
+    for iLine in dictElem["trans"]:
+        lsCard = dictElem["fich"][iLine]
+        iNumTr = GetCardNumber(lsCard[0])
+
+        # Cards with jumps are left untouched
+        bJump = False
+        for s in lsCard:
+            if 'j' in s.split('$')[0].lower():
+                bJump = True
+        dictTr = None
+        if bJump is False:
+            dictTr = ReadTrCard(lsCard)
+        if dictTr is None:
+            tiNumTr.append(iNumTr)
+            tiNumTrRep.append(iNumTr)
+            dictNumTrRep[iNumTr] = iNumTr
+            continue
+
+        # Hash of the card
+        tdCanon = CanonicalTr(dictTr)
+        if tdCanon in dictCanon:
+            # Duplicate, the card is removed with its comments
+            iNumTrRep = dictCanon[tdCanon]
+            tiIndRemove.append(iLine)
+            for i in range(len(GatherTopComments(dictElem["fich"],iLine))):
+                tiIndRemove.append(iLine-1-i)
+        else:
+            # New card, written in canonical form
+            iNumTrRep = iNumTr
+            dictCanon[tdCanon] = iNumTr
+            sCom = ''
+            if '$' in lsCard[0]:
+                sCom = lsCard[0][lsCard[0].find('$'):].strip()
+            dictElem["fich"][iLine] = FormatTrCard(iNumTr, tdCanon, sCom)
+
+        tiNumTr.append(iNumTr)
+        tiNumTrRep.append(iNumTrRep)
+        dictNumTrRep[iNumTr] = iNumTrRep
+
+    # Nothing to merge
+    if len(tiIndRemove) == 0:
+        return LectElem(dictElem["fich"])
+
+    # We report the change to the surfaces
+    for iIndSurf in dictElem["surf"]:
+        sLine = dictElem["fich"][iIndSurf][0]
+        iNumTr = GetSurfGeo(sLine)["trans"]
+        if iNumTr > 0 and iNumTr in dictNumTrRep and dictNumTrRep[iNumTr] != iNumTr:
+            dictElem["fich"][iIndSurf][0] = SwapTrSurf(sLine,dictNumTrRep[iNumTr])
+
+    # We report the change to the cells
+    for iIndCell in dictElem["cell"]:
+        UpdateCellTransform(dictElem["fich"][iIndCell],'fill','num2num',tiNumTrRep,tiNumTr)
+        UpdateCellTransform(dictElem["fich"][iIndCell],'trcl','num2num',tiNumTrRep,tiNumTr)
+
+    # We report the change to the groups
+    if len(dictGroupes) > 0:
+        for sKey in dictGroupes.keys():
+            if isinstance(dictGroupes[sKey], dict) and "trans" in dictGroupes[sKey].keys():
+                lsTemp = list()
+                for iNumTr in dictGroupes[sKey]["trans"]:
+                    lsTemp.append(dictNumTrRep.get(iNumTr,iNumTr))
+                dictGroupes[sKey]["trans"] = lsTemp
+        dictElem["fich"][dictElem["ind_groups"]] = json.dumps(dictGroupes)
+
+    # Removal of the duplicates, starting from the end
+    for i in sorted(set(tiIndRemove), reverse=True):
+        dictElem["fich"].pop(i)
+
+    # Mise a jour
+    dictElemRes = LectElem(dictElem["fich"])
+
+    return dictElemRes
+
+
+# Macrobodies for which the coefficients are points (p), vectors (v) or scalars (s)
+dictGMacroBody = {'box':'pvvv', 'sph':'ps', 'rcc':'pvs', 'trc':'pvss', 'wed':'pvvv',
+                  'rhp':'pvvvvv', 'hex':'pvvvvv', 'rec':'pvvv',
+                  'arb':'pppppppp' + 's'*6}
+
+def BakeSurf(sType, tdCoef, tdCanon):
+    """
+    Computes the coefficients of a surface in the global frame, the surface
+    being defined in the frame of the transform tdCanon (see CanonicalTr).
+    Only the surface types for which the result is exact are treated: planes,
+    spheres, cylinders, cones and quadrics (written as GQ when rotated),
+    macrobodies (RPP written as BOX when rotated).
+    Returns the new type and coefficients, or None if the surface is not treated.
+    """
+
+    # Transform: x = M^T x' + t
+    npT = np.array(tdCanon[0:3])
+    npM = np.array(tdCanon[3:12]).reshape(3,3)
+    bRot = not np.allclose(npM,np.eye(3),rtol=0,atol=10**-ROUND_TR)
+    npC = np.array(tdCoef,dtype=float)
+    iNb = len(npC)
+
+    def _Point(npP):
+        return list(npM.T.dot(npP) + npT)
+
+    def _Vect(npV):
+        return list(npM.T.dot(npV))
+
+    # Planes, n'.x' = D
+    if sType in ('px','py','pz') and iNb == 1:
+        iAxis = 'xyz'.index(sType[1])
+        npN = np.eye(3)[iAxis]
+        npNG = npM.T.dot(npN)
+        dD = npC[0] + npNG.dot(npT)
+        if bRot is False:
+            return sType, [dD]
+        return 'p', list(npNG) + [dD]
+    if sType == 'p' and iNb == 4:
+        npNG = npM.T.dot(npC[0:3])
+        return 'p', list(npNG) + [npC[3] + npNG.dot(npT)]
+    if sType == 'p' and iNb == 9:
+        return 'p', _Point(npC[0:3]) + _Point(npC[3:6]) + _Point(npC[6:9])
+
+    # Spheres
+    if sType == 'so' and iNb == 1:
+        return 's', _Point(np.zeros(3)) + [npC[0]]
+    if sType == 's' and iNb == 4:
+        return 's', _Point(npC[0:3]) + [npC[3]]
+    if sType in ('sx','sy','sz') and iNb == 2:
+        npP = np.zeros(3)
+        npP['xyz'.index(sType[1])] = npC[0]
+        return 's', _Point(npP) + [npC[1]]
+
+    # Macrobodies
+    if sType == 'rpp' and iNb == 6:
+        npMin = npC[0::2]
+        npMax = npC[1::2]
+        if bRot is False:
+            return 'rpp', [d for i in range(3) for d in (npMin[i] + npT[i], npMax[i] + npT[i])]
+        # The facets of RPP and BOX are in the same order
+        lsCoef = _Point(npMin)
+        for i in range(3):
+            lsCoef.extend(_Vect(np.eye(3)[i]*(npMax[i] - npMin[i])))
+        return 'box', lsCoef
+    if sType == 'ell' and iNb == 7:
+        if npC[6] > 0:
+            return 'ell', _Point(npC[0:3]) + _Point(npC[3:6]) + [npC[6]]
+        return 'ell', _Point(npC[0:3]) + _Vect(npC[3:6]) + [npC[6]]
+    if sType in dictGMacroBody:
+        sSpec = dictGMacroBody[sType]
+        if sType in ('rhp','hex') and iNb == 9:
+            sSpec = 'pvv'
+        if sType == 'rec' and iNb == 10:
+            sSpec = 'pvvs'
+        if sum([3 if c in 'pv' else 1 for c in sSpec]) != iNb:
+            return None
+        lsCoef = list()
+        i = 0
+        for c in sSpec:
+            if c == 'p':
+                lsCoef.extend(_Point(npC[i:i+3]))
+                i = i + 3
+            elif c == 'v':
+                lsCoef.extend(_Vect(npC[i:i+3]))
+                i = i + 3
+            else:
+                lsCoef.append(npC[i])
+                i = i + 1
+        return sType, lsCoef
+
+    # Quadrics: (x'-c)^T Q (x'-c) + g.(x'-c) + K = 0
+    npQ = None
+    npG = np.zeros(3)
+    dK = 0.
+    npCenter = np.zeros(3)
+    if sType in ('cx','cy','cz') and iNb == 1:
+        npQ = np.diag([1.,1.,1.])
+        npQ['xyz'.index(sType[1]),'xyz'.index(sType[1])] = 0.
+        dK = -npC[0]**2
+        if bRot is False:
+            lsCenter = [npT[i] for i in range(3) if i != 'xyz'.index(sType[1])]
+            return 'c/' + sType[1], lsCenter + [npC[0]]
+    elif sType in ('c/x','c/y','c/z') and iNb == 3:
+        iAxis = 'xyz'.index(sType[2])
+        npQ = np.diag([1.,1.,1.])
+        npQ[iAxis,iAxis] = 0.
+        npCenter[[i for i in range(3) if i != iAxis]] = npC[0:2]
+        dK = -npC[2]**2
+        if bRot is False:
+            lsCenter = [npCenter[i] + npT[i] for i in range(3) if i != iAxis]
+            return sType, lsCenter + [npC[2]]
+    elif sType in ('kx','ky','kz') and iNb in (2,3):
+        iAxis = 'xyz'.index(sType[1])
+        if bRot is False:
+            npP = np.zeros(3)
+            npP[iAxis] = npC[0]
+            return 'k/' + sType[1], list(npP + npT) + list(npC[1:])
+        if iNb == 3:
+            # Only one sheet, not possible with GQ
+            return None
+        npQ = np.diag([1.,1.,1.])
+        npQ[iAxis,iAxis] = -npC[1]
+        npCenter[iAxis] = npC[0]
+    elif sType in ('k/x','k/y','k/z') and iNb in (4,5):
+        iAxis = 'xyz'.index(sType[2])
+        if bRot is False:
+            return sType, list(npC[0:3] + npT) + list(npC[3:])
+        if iNb == 5:
+            # Only one sheet, not possible with GQ
+            return None
+        npQ = np.diag([1.,1.,1.])
+        npQ[iAxis,iAxis] = -npC[3]
+        npCenter = npC[0:3]
+    elif sType == 'sq' and iNb == 10:
+        if bRot is False:
+            return 'sq', list(npC[0:7]) + list(npC[7:10] + npT)
+        npQ = np.diag(npC[0:3])
+        npG = 2*npC[3:6]
+        dK = npC[6]
+        npCenter = npC[7:10]
+    elif sType == 'gq' and iNb == 10:
+        dA, dB, dC, dD, dE, dF = npC[0:6]
+        npQ = np.array([[dA, dD/2, dF/2], [dD/2, dB, dE/2], [dF/2, dE/2, dC]])
+        npG = npC[6:9]
+        dK = npC[9]
+
+    if npQ is None:
+        return None
+
+    # x' - c = M (x - t2)
+    npT2 = npT + npM.T.dot(npCenter)
+    npQG = npM.T.dot(npQ).dot(npM)
+    npGL = npM.T.dot(npG)
+    npGG = npGL - 2*npQG.dot(npT2)
+    dKG = npT2.dot(npQG).dot(npT2) - npGL.dot(npT2) + dK
+    lsCoef = [npQG[0,0], npQG[1,1], npQG[2,2], 2*npQG[0,1], 2*npQG[1,2], 2*npQG[0,2]] + list(npGG) + [dKG]
+
+    # Cylinder parallel to an axis after rotation
+    npRound = np.round(npQG,ROUND_TR)
+    npDiag = np.diag(npRound)
+    if np.count_nonzero(npRound - np.diag(npDiag)) == 0 and np.count_nonzero(npDiag) == 2:
+        iAxis = int(np.flatnonzero(npDiag == 0)[0])
+        tiOther = [i for i in range(3) if i != iAxis]
+        dA = npDiag[tiOther[0]]
+        if npDiag[tiOther[1]] == dA and round(npGG[iAxis],ROUND_TR) == 0:
+            npCenter = -npGG/(2*dA)
+            dR2 = npCenter[tiOther].dot(npCenter[tiOther]) - dKG/dA
+            if dR2 > 0:
+                return 'c/' + 'xyz'[iAxis], list(npCenter[tiOther]) + [math.sqrt(dR2)]
+
+    return 'gq', lsCoef
+
+
+def BakeSurfTr(dictElemIn, keeptr=()):
+    """
+    Function to write the surfaces with a transform directly in the global
+    frame (see BakeSurf), the transform number is removed from the surface.
+    The transform cards that are no longer used (surfaces, trcl/fill, groups,
+    keeptr) are removed.
+    Does not modify dictElemIn.
+    """
+
+    # Init
+    dictElem = deepcopy(dictElemIn)
+    dictCanon = dict()
+    tiTrBaked = set()
+    tiTrUsed = set(keeptr)
+
+    # Canonical form of the cards
+    for iLine in dictElem["trans"]:
+        lsCard = dictElem["fich"][iLine]
+        bJump = False
+        for s in lsCard:
+            if 'j' in s.split('$')[0].lower():
+                bJump = True
+        if bJump is False:
+            dictTr = ReadTrCard(lsCard)
+            if dictTr is not None:
+                dictCanon[dictTr["num"]] = CanonicalTr(dictTr)
+
+    # Surfaces
+    for iIndSurf in dictElem["surf"]:
+        lsCard = dictElem["fich"][iIndSurf]
+        iNumTr = GetSurfGeo(lsCard[0])["trans"]
+        if iNumTr <= 0:
+            continue
+        if iNumTr not in dictCanon:
+            tiTrUsed.add(iNumTr)
+            continue
+
+        # Reading of the card, comment lines are kept
+        lsData = list()
+        lsComment = list()
+        for s in lsCard:
+            if IsComment(s):
+                lsComment.append(s)
+            else:
+                lsData.extend((s + ' ')[:(s + ' ').find('$')].split())
+        sCom = ''
+        if '$' in lsCard[0]:
+            sCom = lsCard[0][lsCard[0].find('$'):].strip()
+
+        # Baking
+        res = None
+        try:
+            res = BakeSurf(lsData[2].lower(), [float(d) for d in lsData[3:]], dictCanon[iNumTr])
+        except ValueError:
+            pass
+        if res is None:
+            tiTrUsed.add(iNumTr)
+            continue
+        sType, lsCoef = res
+        if lsData[2].isupper():
+            sType = sType.upper()
+
+        # New card
+        sLine = lsData[0] + ' ' + sType + ' ' + ' '.join([(round(d,ROUND_TR) + 0.0).__format__('.15g') for d in lsCoef])
+        if len(sCom) > 0:
+            sLine = sLine + ' ' + sCom
+        dictElem["fich"][iIndSurf] = [sLine] + lsComment
+        tiTrBaked.add(iNumTr)
+
+    # Transforms still used by the cells and the groups
+    tiTrCell = list()
+    for iIndCell in dictElem["cell"]:
+        UpdateCellTransform(deepcopy(dictElem["fich"][iIndCell]),'fill','read',tiTrCell)
+        UpdateCellTransform(deepcopy(dictElem["fich"][iIndCell]),'trcl','read',tiTrCell)
+    tiTrUsed.update(tiTrCell)
+    for sKey in dictElem["groups"].keys():
+        if isinstance(dictElem["groups"][sKey], dict) and "trans" in dictElem["groups"][sKey].keys():
+            tiTrUsed.update(dictElem["groups"][sKey]["trans"])
+
+    # Removal of the cards no longer used, with their comments
+    tiIndRemove = list()
+    for iLine in dictElem["trans"]:
+        iNumTr = GetCardNumber(dictElem["fich"][iLine][0])
+        if iNumTr in tiTrBaked and iNumTr not in tiTrUsed:
+            tiIndRemove.append(iLine)
+            for i in range(len(GatherTopComments(dictElem["fich"],iLine))):
+                tiIndRemove.append(iLine-1-i)
+    for i in sorted(set(tiIndRemove), reverse=True):
+        dictElem["fich"].pop(i)
+
+    # Mise a jour
+    dictElemRes = LectElem(dictElem["fich"])
+
+    return dictElemRes
+
+
 def SwapTrSurf(sLine,iTr):
     """
     Fonction pour remplacer le numero d'une transfo d'une carte de surface
@@ -2728,6 +5135,70 @@ def GatherTopComments(lsLine,i0):
     # Liste des commentaires
     return lsRes
 
+def FormatProvenance(lsNode):
+    """
+    Returns the lines describing the history of the inserted objects, tree of
+    nodes {"geom", "trans", "fct", "ops", "children"} (see go._ProvenanceNode).
+    The strings (history of objects of older versions) are kept as they are.
+    """
+
+    lsOut = list()
+    for dictNode in lsNode:
+        if isinstance(dictNode, str):
+            lsOut.append(dictNode)
+            continue
+
+        lsOut.append(dictNode["geom"])
+
+        # Transformations applied to the inserted object
+        if len(dictNode["fct"]) > 0:
+            npMat = np.reshape(np.array(dictNode["trans"][4:4+9]),(3,3))
+            dAngEulerA, dAngEulerB, dAngEulerG = AnglesEulerZXZ(npMat)
+            lsOut.append(" "*5 + f"Applied translation: {[np.asarray(x).tolist() for x in dictNode['trans'][1:4]]}")
+            lsOut.append(" "*5 + f"Applied Euler angles: a={np.rad2deg(dAngEulerA)}, b={np.rad2deg(dAngEulerB)}, g={np.rad2deg(dAngEulerG)} " )
+            lsOut.append(" "*5 + "Rotation matrix:")
+            for i in range(3):
+                lsOut.append(" "*10 + f"{npMat[i]}")
+            lsOut.append(" "*5 + "List of applied transforms:")
+            for sFct in dictNode["fct"]:
+                lsOut.append(" "*10 + sFct)
+        else:
+            lsOut.append(" "*5 + "No transforms was applied")
+
+        # Files contained in the inserted object
+        if len(dictNode["children"]) > 0:
+            lsOut.append(" "*5 + ' - Files contained in ' + dictNode["geom"] + ' :')
+            for s in FormatProvenance(dictNode["children"]):
+                lsOut.append(" "*6 + s)
+
+        for sOp in dictNode["ops"]:
+            lsOut.append(" "*5 + sOp)
+
+    return lsOut
+
+
+def SummaryProvenance(lsNode):
+    """
+    Returns the lines of a summary of the history of the inserted objects:
+    number of insertions of each file in the whole tree.
+    """
+
+    dictCount = dict()
+    lsStack = list(lsNode)
+    while len(lsStack) > 0:
+        dictNode = lsStack.pop()
+        if isinstance(dictNode, str):
+            continue
+        dictCount[dictNode["geom"]] = dictCount.get(dictNode["geom"], 0) + 1
+        lsStack.extend(dictNode["children"])
+
+    lsOut = [" "*5 + f"{sum(dictCount.values())} insertions of {len(dictCount)} files"]
+    for sGeom in sorted(dictCount):
+        lsOut.append(" "*10 + f"{sGeom} x{dictCount[sGeom]}")
+
+    return lsOut
+
+
 def EulerZXZ(a=0,b=0,g=0,unit='deg',output=''):
     """
     Fonction retournant la matrice de passage composé d'une rotation selon l'axe
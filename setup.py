@@ -3,4 +3,5 @@ from setuptools import setup
 setup(name='mcnpgo',
       version='0.1',
       packages=['mcnpgo'],
-      package_dir={'mcnpgo': './mcnpgo'})
+      package_dir={'mcnpgo': './mcnpgo'},
+      entry_points={'console_scripts': ['mcnpgo=mcnpgo.cli:main']})
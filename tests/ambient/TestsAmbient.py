@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the partition of the ambient cell.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# TEST 1
+
+# 12 detectors inserted in the room, the ambient cell is cut in parts
+# intersecting at most 3 objects (detectors or lead bricks)
+room = go("./room.mcnp")
+for i in range(4):
+    for j in range(3):
+        det = go("./detector.mcnp")
+        det.Translat([-75 + 50*i, -50 + 50*j, 0])
+        room.Insert(det, location = 'inside')
+room.WriteMCNPFile("./results/Test1_ref.mcnp")
+room.OptimizeAmbient(leaf = 3)
+room.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Not enough objects: nothing is done
+room = go("./room.mcnp")
+room.Insert(go("./detector.mcnp"), location = 'inside')
+room.OptimizeAmbient()
+room.WriteMCNPFile("./results/Test2.mcnp")
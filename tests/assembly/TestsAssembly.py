@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the assembly tree, flattened only at write time.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# Loading files
+room = Assembly(go("./room.mcnp"))
+
+# TEST 1
+
+# ccd in the detector, detector in the room
+detector = room.Add(go("./detector.mcnp"), transforms=[['tr',0,400,0]], location = 'inside')
+ccd = detector.Add(go("./ccd.mcnp"), transforms=[['tr',60,50,0]], location = 'inside')
+print(room)
+
+# Save file
+room.WriteMCNPFile("./results/Test1.mcnp")
+
+# Same geometry built directly
+obj_ccd = go("./ccd.mcnp")
+obj_ccd.Transform(['tr',60,50,0])
+obj_detector = go("./detector.mcnp")
+obj_detector.Insert(obj_ccd, location = 'inside')
+obj_detector.Transform(['tr',0,400,0])
+obj_room = go("./room.mcnp")
+obj_room.Insert(obj_detector, location = 'inside')
+obj_room.WriteMCNPFile("./results/Test1_direct.mcnp")
+
+# TEST 2
+
+# Two copies of the ccd in the room, the ccd in the detector is moved
+room.Add(go("./ccd.mcnp"), transforms=[['tr',-200,0,0], ['*tr',-200,100,0, 90,0,90, 180,90,90, 90,90,0]],
+         mode = 'InsertInstance', name = 'ccd copies')
+ccd.SetTransforms([['tr',60,20,0]])
+room.WriteMCNPFile("./results/Test2.mcnp")
+
+# Only the modified node and its ancestors are flattened again
+print(f"Flattenings: room {room._iFlatten}, detector {detector._iFlatten}, ccd {ccd._iFlatten}")
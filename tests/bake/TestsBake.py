@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+"""
+Test script for writing the transformed surfaces in the global frame.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# Loading files
+detector = go("./detector.mcnp")
+ccd1 = go("./ccd.mcnp")
+ccd2 = go("./ccd.mcnp")
+
+# TEST 1
+
+# Rotated object, CX written as GQ, RCC in the global frame
+ccd1.TrRotZ(trans=[60,50,0], angle=30)
+ccd1.Transform(['tr',0,0,10], bake=True)
+ccd1.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Baking at insertion, the tr card of the detector mirror is kept
+ccd2.TrRotZ(trans=[60,50,0], angle=90)
+detector.Insert(ccd2, location = 'inside', bake = True)
+detector.WriteMCNPFile("./results/Test2.mcnp")
+
+# TEST 3
+
+# Old file whose groups also hold an entry which is not a group, the
+# transforms of the groups are kept
+legacy = go("./legacy.mcnp")
+legacy.Transform(['tr',0,0,10], bake=True)
+legacy.WriteMCNPFile("./results/Test3.mcnp")
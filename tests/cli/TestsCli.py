@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the assembly from a manifest (command line interface).
+"""
+
+# Import mcnpgo
+from mcnpgo.cli import main, ReadManifest, StateKeys
+import os, json, shutil, tempfile
+
+if __name__ == '__main__':
+
+    # TEST 1
+
+    # Example "MakeGeomLat.py" without the lattice, JSON manifest
+    main(["./manifest.json"])
+
+    # TEST 2
+
+    # Copies of the ccd, TOML manifest, sequential loading
+    main(["./manifest.toml", "-j", "1"])
+
+    # TEST 3
+
+    # Incremental build: the second build with the cache only reads the
+    # final state, the result is the one of TEST 1
+    sCache = tempfile.mkdtemp()
+    main(["./manifest.json", "-o", "./results/Test3.mcnp", "--cache", sCache])
+    main(["./manifest.json", "-o", "./results/Test3.mcnp", "--cache", sCache])
+    print("Test3 == Test1:", open("./results/Test3.mcnp").read() == open("./results/Test1.mcnp").read())
+    shutil.rmtree(sCache)
+
+    # TEST 4
+
+    # The modification of an included file (read file=) invalidates the
+    # states of the component
+    sDir = tempfile.mkdtemp()
+    sCache = os.path.join(sDir, "cache")
+    shutil.copy("./detector_read.mcnp", sDir)
+    shutil.copytree("./lib", os.path.join(sDir, "lib"))
+    with open(os.path.join(sDir, "manifest.json"),'w') as fid:
+        json.dump({"output": "out.mcnp", "components": {"detector": {"file": "detector_read.mcnp"}}}, fid)
+    main([os.path.join(sDir, "manifest.json"), "--cache", sCache])
+    sMat = os.path.join(sDir, "lib", "materials.mcnp")
+    with open(sMat) as fid:
+        sText = fid.read()
+    with open(sMat,'w') as fid:
+        fid.write(sText.replace("m13 13027 1", "m13 13027 0.99 12024 0.01"))
+    main([os.path.join(sDir, "manifest.json"), "--cache", sCache])
+    print("Include updated:", "12024 0.01" in open(os.path.join(sDir, "out.mcnp")).read())
+    shutil.rmtree(sDir)
+
+    # TEST 5
+
+    # Loaded states present in the cache but unreadable (truncated files),
+    # the other states removed: the components are loaded again
+    sCache = tempfile.mkdtemp()
+    main(["./manifest.json", "-o", "./results/Test5.mcnp", "--cache", sCache])
+    dictKeys = StateKeys(ReadManifest("./manifest.json"), ".")
+    lsBase = [dictKeys[sName]["base"][0][0] + '.mgo' for sName in dictKeys.keys()]
+    for sFile in os.listdir(sCache):
+        if sFile in lsBase:
+            with open(os.path.join(sCache, sFile),'r+b') as fid:
+                fid.truncate(4)
+        else:
+            os.remove(os.path.join(sCache, sFile))
+    main(["./manifest.json", "-o", "./results/Test5.mcnp", "--cache", sCache])
+    print("Test5 == Test1:", open("./results/Test5.mcnp").read() == open("./results/Test1.mcnp").read())
+    shutil.rmtree(sCache)
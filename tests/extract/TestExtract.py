@@ -29,3 +29,17 @@ room_30_but_lat = room_30.Extract(range(1,12), mode='subtract', radius=10e2)
 
 # Save file
 room_30_but_lat.WriteMCNPFile("./results/room_30_but_lat.mcnp")
+
+
+# Extract detector bench, bounding sphere around the cells
+detector = room_30.Extract(range(12,22), bound='sph', margin=5.)
+
+# Save file
+detector.WriteMCNPFile("./results/detector_sph.mcnp")
+
+
+# Extract detector bench, fixed bounding sphere
+detector = room_30.Extract(range(12,22), bound='radius', radius=10e2)
+
+# Save file
+detector.WriteMCNPFile("./results/detector_radius.mcnp")
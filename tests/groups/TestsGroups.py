@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the update of the groups (reverse index GroupIndex) by
+Renum and Extract, several groups sharing cell, surface and
+transformation numbers.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import mcnpgo.mctk as tk
+from copy import deepcopy
+
+# Reference: groups updated entry by entry, without index
+def MapGroups(dictGroups, sField, dictMap):
+    dictRes = deepcopy(dictGroups)
+    for dictGroup in dictRes.values():
+        if sField in dictGroup:
+            dictGroup[sField] = [dictMap.get(i,i) for i in dictGroup[sField]]
+    return dictRes
+
+def FilterGroups(dictGroups, dictKeep):
+    dictRes = dict()
+    for sKey,dictGroup in dictGroups.items():
+        for sField,tiKeep in dictKeep.items():
+            tiNum = [i for i in dictGroup.get(sField,[]) if i in tiKeep]
+            if len(tiNum) > 0:
+                dictRes.setdefault(sKey, dict())[sField] = tiNum
+        if "comment" in dictGroup and sKey in dictRes:
+            dictRes[sKey]["comment"] = dictGroup["comment"]
+    return dictRes
+
+def Numbers(dictElem):
+    return {"cell": [tk.GetCellNum(dictElem["fich"][i][0]) for i in dictElem["cell"]],
+            "surf": [tk.GetLineNum(dictElem["fich"][i][0]) for i in dictElem["surf"]],
+            "trans": [tk.GetCardNumber(dictElem["fich"][i][0]) for i in dictElem["trans"]]}
+
+# Loading files
+groups = go("./groups.mcnp")
+
+# TEST 1
+
+# Renum: the new numbers collide with numbers still used (cell 1 -> 2 while
+# cell 2 exists, interchanged), and the transformations form a chain 1 -> 2 -> 3
+groups1 = deepcopy(groups)
+dictOld = Numbers(groups1._dictElem)
+groups1.Renum(cell = 2, surf = 3, trans = 2)
+dictNew = Numbers(groups1._dictElem)
+
+dictRef = groups._dictElem["groups"]
+for sField in ("cell","surf","trans"):
+    dictRef = MapGroups(dictRef, sField, dict(zip(dictOld[sField], dictNew[sField])))
+print("Renum:", groups1._dictElem["groups"] == dictRef)
+groups1.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Extract: the numbers of the groups which are not extracted are removed
+groups2 = groups.Extract([2,3,6])
+dictRef = FilterGroups(groups._dictElem["groups"], Numbers(groups2._dictElem))
+print("Extract:", groups2._dictElem["groups"] == dictRef)
+groups2.WriteMCNPFile("./results/Test2.mcnp")
+
+# TEST 3
+
+# Direct use of the index: interchange of two numbers used by several
+# groups, interchange with an unused number, circular map
+oGroups = tk.GroupIndex(groups._dictElem["groups"])
+oGroups.Swap('cell', 2, 3)
+oGroups.Swap('cell', 4, 7)
+oGroups.Map('surf', {3: 4, 4: 5, 5: 3})
+oGroups.Map('trans', {1: 2, 2: 1})
+
+dictRef = MapGroups(groups._dictElem["groups"], 'cell', {2: 3, 3: 2, 4: 7, 7: 4})
+dictRef = MapGroups(dictRef, 'surf', {3: 4, 4: 5, 5: 3})
+dictRef = MapGroups(dictRef, 'trans', {1: 2, 2: 1})
+print("GroupIndex:", oGroups.groups == dictRef,
+      oGroups.Filter('cell', [2,7]) == {sKey: d["cell"] for sKey,d in FilterGroups(dictRef, {"cell": [2,7]}).items()})
+
+# The index follows the numbers: a second map of the moved numbers
+oGroups.Map('cell', {3: 30, 7: 70})
+dictRef = MapGroups(dictRef, 'cell', {3: 30, 7: 70})
+print("GroupIndex chain:", oGroups.groups == dictRef)
+with open("./results/Test3.json",'w') as fid:
+    fid.write(oGroups.Dumps())
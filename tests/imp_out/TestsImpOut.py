@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+"""
+Test script for relegating the imp and other cell cards to the card block.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# Loading files
+detector = go("./detector.mcnp")
+
+# TEST 1
+
+# Many ccd to get long IMP cards with repeats
+for i in range(30):
+    ccd = go("./ccd.mcnp")
+    ccd.Translat([0, 0, 40*(i+1)])
+    detector.Insert(ccd, location = 'inside')
+
+# Save file
+detector.WriteMCNPFile("./results/Test1.mcnp", imp='out')
+
+# TEST 2
+
+# Volumes of some cells, 'j' for the others
+detector = go("./detector_vol.mcnp")
+detector.WriteMCNPFile("./results/Test2.mcnp", imp='out', data=['vol'])
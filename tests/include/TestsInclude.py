@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the included files (read file=).
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import os
+
+# TEST 1
+
+# Materials read from a library
+detector = go("./detector.mcnp")
+detector.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Split writing of an assembly
+room = go("./room.mcnp")
+ccd = go("./ccd.mcnp")
+detector.Translat([0,50,0])
+room.Insert(detector)
+ccd.Translat([100,0,0])
+room.Insert(ccd)
+room.WriteMCNPFile("./results/Test2.mcnp", split=True)
+
+# The unchanged included files are not written again
+iTime = os.stat("./results/Test2_1_detector.cell").st_mtime_ns
+room.WriteMCNPFile("./results/Test2.mcnp", split=True)
+print(os.stat("./results/Test2_1_detector.cell").st_mtime_ns == iTime)
+
+# Reading of the master file
+room2 = go("./results/Test2.mcnp")
+room2.WriteMCNPFile("./results/Test2_read.mcnp")
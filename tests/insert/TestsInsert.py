@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the renumbering of the colliding numbers on insertion.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import mcnpgo.mctk as tk
+
+# TEST 1
+
+# The cell 2 and the surfaces 1 and 2 of the room are also used by the
+# detector: only those are renumbered, the cells 1, 10, 11 and the surface 10
+# keep their numbers
+room = go("./room.mcnp")
+det = go("./detector.mcnp")
+room.Insert(det, location = 'inside')
+room.WriteMCNPFile("./results/Test1.mcnp")
+
+dictElem = room._dictElem
+print("Cells:", [tk.GetCellNum(dictElem["fich"][i][0]) for i in dictElem["cell"]])
+print("Surfaces:", [tk.GetLineNum(dictElem["fich"][i][0]) for i in dictElem["surf"]])
+
+# TEST 2
+
+# Without any number in common, nothing is renumbered
+room = go("./room.mcnp")
+det = go("./detector.mcnp")
+det.Renum(cell = 20, surf = 20)
+room.Insert(det, location = 'inside')
+room.WriteMCNPFile("./results/Test2.mcnp")
+
+# TEST 3
+
+# Reserved blocks: each detector is renumbered into its own block (cells and
+# surfaces 1000..., 2000..., materials 100...), the room is never renumbered
+room = go("./room.mcnp")
+room.ReserveRanges(cells = 1000, surfaces = 1000, materials = 100)
+for i in range(2):
+    det = go("./detector.mcnp")
+    det.Translat([0, 50*i, 0])
+    room.Insert(det, location = 'inside')
+room.WriteMCNPFile("./results/Test3.mcnp")
+
+dictElem = room._dictElem
+print("Cells:", [tk.GetCellNum(dictElem["fich"][i][0]) for i in dictElem["cell"]])
+print("Surfaces:", [tk.GetLineNum(dictElem["fich"][i][0]) for i in dictElem["surf"]])
+
+# The transformations are not reserved: the first detector keeps tr1, the
+# second one is moved to tr2
+print("Transformations:", list(tk.GetObjetInfoTr(dictElem)["numtr"]))
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the insertion of copies of an object as a universe.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# Loading files
+detector = go("./detector.mcnp")
+ccd = go("./ccd.mcnp")
+
+# TEST 1
+
+# Three copies of the ccd inside the detector
+detector.InsertInstance(ccd, transforms=[['tr',60,50,-25],
+                                         ['tr',60,50,25],
+                                         ['*tr',25,13,0, 90,0,90, 180,90,90, 90,90,0]],
+                        location = 'inside')
+
+# Save file
+detector.WriteMCNPFile("./results/Test1.mcnp")
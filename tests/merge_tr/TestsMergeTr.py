@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+
+"""
+Test script for merging identical transform cards.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# Loading files
+detector = go("./detector.mcnp")
+ccd1 = go("./ccd.mcnp")
+ccd2 = go("./ccd.mcnp")
+
+# TEST 1
+
+# Same position for both ccd, tr cards are identical
+ccd1.TrRotZ(trans=[60,50,0], angle=90)
+ccd2.TrRotZ(trans=[60,50,0], angle=90)
+detector.Insert(ccd1, location = 'inside')
+detector.Insert(ccd2, location = 'inside')
+
+# Save file
+detector.WriteMCNPFile("./results/Test1.mcnp", mergetr=True)
+
+# TEST 2
+
+# Old file whose groups also hold an entry which is not a group, tr3 is
+# merged with tr2 in the groups
+legacy = go("./legacy.mcnp")
+legacy.WriteMCNPFile("./results/Test2.mcnp", mergetr=True)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the history of the inserted objects.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+from copy import deepcopy
+
+# Loading files
+room = go("./room.mcnp")
+detector = go("./detector.mcnp")
+ccd = go("./ccd.mcnp")
+
+# Tree: room <- 2 detectors <- ccd
+ccd.Translat([60,50,0])
+detector.Insert(ccd, location = 'inside')
+for i in range(2):
+    detector_i = deepcopy(detector)
+    detector_i.TrRotY(trans=[200*i,400,0], angle=1)
+    room.Insert(detector_i)
+
+# TEST 1
+
+# Whole history in the header
+room.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Summary
+room.WriteMCNPFile("./results/Test2.mcnp", provenance='summary')
+
+# TEST 3
+
+# Summary and JSON file
+room.WriteMCNPFile("./results/Test3.mcnp", provenance='json')
@@ -5,7 +5,7 @@ Test script for ResolveTRCL on lattices.
 """
 
 # Import mcnpgo
-import os
+import os, shutil, tempfile
 from mcnpgo.mcnpgo import *
 
 # Listing test files
@@ -28,3 +28,30 @@ for file in files:
     lat.WriteMCNPFile("./results/Test_" + file)
 
 
+
+# Not enough free numbers below 1000: nothing is renumbered
+sDir = tempfile.mkdtemp()
+for sName,iCells,iSurfs in (("surf.mcnp", 2, 999), ("cell.mcnp", 999, 2)):
+    lsLine = ['c']*4
+    lsLine.append('1000 0 -1000 trcl=(1 0 0) imp:n=1' if iCells == 2 else '1000 0 -1 trcl=(1 0 0) imp:n=1')
+    lsLine.extend([f'{i} 0 {i+1} -{i+2} imp:n=1' for i in range(1,iCells-1)])
+    lsLine.extend([f'{iCells-1} 0 -{iSurfs+1} #1000 imp:n=1', f'{iCells} 0 {iSurfs+1} imp:n=0', ''])
+    lsLine.extend([f'{i} PX {i}' for i in range(1,iSurfs+1)] + [f'{iSurfs+1} SO 2000'])
+    if iCells == 2:
+        lsLine.append('1000 PX 0.5')
+    lsLine.extend(['', 'mode n'])
+    with open(os.path.join(sDir, sName),'w') as fid:
+        fid.write('\n'.join(lsLine) + '\n')
+    test = go(os.path.join(sDir, sName))
+    dictElem = test._dictElem
+    print(sName, test.ResolveTRCL(), test._dictElem is dictElem)
+
+# Groups of an old file with an entry which is not a group
+lsLine = ['c']*4 + ['1000 0 -1000 trcl=(1 0 0) imp:n=1', '1 0 -2 #1000 imp:n=1', '2 0 2 imp:n=0', '',
+                    '1000 PX 0.5', '2 SO 2000', '', 'mode n', '',
+                    '{"version":1,"trcl":{"cell":[1000],"surf":[1000]}}']
+with open(os.path.join(sDir, "groups.mcnp"),'w') as fid:
+    fid.write('\n'.join(lsLine) + '\n')
+test = go(os.path.join(sDir, "groups.mcnp"))
+print("groups.mcnp", test.ResolveTRCL(), test._dictElem["groups"])
+shutil.rmtree(sDir)
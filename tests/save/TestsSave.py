@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the binary save/load of objects.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+
+# Loading files
+detector = go("./detector.mcnp")
+ccd = go("./ccd.mcnp")
+
+# TEST 1
+
+# Object saved after an insertion, then loaded
+ccd.Translat([60,50,0])
+detector.Insert(ccd, location = 'inside')
+detector.TrRotZ(angle=90)
+detector.AddMCNPTally(group="ScintillatorCell", tally="F4:P")
+detector.Save("./results/Test1.mgo")
+
+detector2 = go.Load("./results/Test1.mgo")
+
+# The loaded object is written as the original one
+detector.WriteMCNPFile("./results/Test1_ref.mcnp")
+detector2.WriteMCNPFile("./results/Test1.mcnp")
+print(open("./results/Test1_ref.mcnp").read() == open("./results/Test1.mcnp").read())
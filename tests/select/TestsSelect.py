@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the selection of cells.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import json
+
+dictRes = dict()
+
+# TEST 1
+
+# Selection by material, density, importance, comment and surface
+detector = go("./detector.mcnp")
+dictRes["mat13"] = detector.Select(mat=13)
+dictRes["mat13_83"] = detector.Select(mat=[13,83])
+dictRes["void"] = detector.Select(mat=0)
+dictRes["dens"] = detector.Select(dens=(-3,-2))
+dictRes["imp0"] = detector.Select(imp={'n': 0})
+dictRes["comment"] = detector.Select(comment='scintillator')
+dictRes["surf3"] = detector.Select(surf=3)
+dictRes["bbox"] = detector.Select(bbox=[-1,1,-1,1,-1,1])
+dictRes["combined"] = sorted(set(detector.Select(surf=3)) - set(detector.Select(mat=0)))
+
+# TEST 2
+
+# The index is rebuilt after a modification
+detector.SwapCellMat(detector.Select(mat=13), mat=26, dens=-7.9)
+dictRes["mat26"] = detector.Select(mat=26)
+
+# TEST 3
+
+# Universes and lattices
+lat = go("./lat_ex1.mcnp")
+dictRes["univ1"] = lat.Select(univ=1)
+dictRes["univ0"] = lat.Select(univ=0)
+dictRes["lat_bbox"] = lat.Select(bbox=[8,9,8,9,0,1])
+
+with open("./results/Test1.json",'w') as fid:
+    json.dump(dictRes, fid, indent=1)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the bulk replacement of materials and the writing of variants.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+from copy import deepcopy
+
+# Loading files
+shield = go("./shield.mcnp")
+detector = go("./detector.mcnp")
+
+# TEST 1
+
+# Mapping {cell: (mat, dens)}, like but cells included
+shield1 = deepcopy(shield)
+shield1.SwapCellMat({1: (82,11.35), 2: (-1,2.6), 3: (0,0)})
+shield1.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Selection plus value
+detector2 = deepcopy(detector)
+detector2.SwapCellMat(detector2.Select(mat=13), mat=26, dens=7.9)
+detector2.WriteMCNPFile("./results/Test2.mcnp")
+
+# TEST 3
+
+# Variants written from a single formatting, the object is not modified
+shield.WriteMCNPVariants({f"./results/Test3_{d}.mcnp": {2: (-1,d), 3: (-1,d)} for d in (2.6,2.7,2.8)})
+shield.WriteMCNPVariants({"./results/Test3_lead.mcnp": {3: (82,11.35)}})
+shield.WriteMCNPFile("./results/Test3.mcnp")
+
+# The unchanged variants are not written again
+print(shield.WriteMCNPVariants({"./results/Test3_lead.mcnp": {3: (82,11.35)},
+                                "./results/Test3_2.6.mcnp": {2: (-1,2.65), 3: (-1,2.6)}}))
+shield.WriteMCNPVariants({"./results/Test3_2.6.mcnp": {2: (-1,2.6), 3: (-1,2.6)}})
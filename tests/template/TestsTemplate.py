@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the templates of MCNP files.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+from copy import deepcopy
+import os, time
+
+# Loading files
+shield = go("./shield.mcnp")
+shield.AddMCNPCard(["sdef pos=0 0 -20 erg=14 par=1", "nps 1000"])
+
+# TEST 1
+
+# Slots on a transform, a cell, keywords of a card and a whole card
+tpl = shield.RenderTemplate({"slab3": ("tr", 2), "slab1": ("cell", 1),
+                             "erg": ("card", "sdef", "erg"), "pos": ("card", "sdef", "pos"),
+                             "nps": ("card", "nps")})
+print(tpl)
+
+# Without values, the file of WriteMCNPFile
+tpl.Emit("./results/Test1_default.mcnp")
+shield.WriteMCNPFile("./results/Test1.mcnp")
+
+tpl.Emit("./results/Test1_variant.mcnp", slab3=[0,0,12.5], slab1=(82,11.35), erg=2.5, pos=[0,0,-30],
+         nps="nps 1e6")
+
+# Same result as the modification of the object
+shield1 = deepcopy(shield)
+shield1.SwapCellMat(1, mat=82, dens=11.35)
+shield1.WriteMCNPFile("./results/Test1_swap.mcnp")
+
+# TEST 2
+
+# Many variants
+t0 = time.time()
+for i in range(100):
+    tpl.Emit(f"./results/Test2.mcnp", slab3=[0,0,10+i*0.1], erg=1+i*0.1)
+print(f"{100/(time.time()-t0):.0f} variants/s")
+
+# TEST 3
+
+# Void cell: a material or a density equal to 0 gives a void cell, as in SwapCellMat
+tpl.Emit("./results/Test3.mcnp", slab1=(82,0))
+shield3 = deepcopy(shield)
+shield3.SwapCellMat(1, mat=82, dens=0)
+shield3.WriteMCNPFile("./results/Test3_swap.mcnp")
+print(open("./results/Test3.mcnp").read() == open("./results/Test3_swap.mcnp").read())
+
+# Two slots on the same card are rejected
+try:
+    shield.RenderTemplate({"b": ("tr", 2), "c": ("tr", 2)})
+except SystemExit:
+    print("Slots on the same card rejected")
+
+# The same variant again: the file is not written again (same date)
+iTime = os.stat("./results/Test1_variant.mcnp").st_mtime_ns
+bWritten = tpl.Emit("./results/Test1_variant.mcnp", slab3=[0,0,12.5], slab1=(82,11.35), erg=2.5, pos=[0,0,-30],
+                    nps="nps 1e6")
+print(bWritten, os.stat("./results/Test1_variant.mcnp").st_mtime_ns == iTime)
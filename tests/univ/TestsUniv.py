@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the renumbering of universes.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import mcnpgo.mctk as tk
+import os, shutil, tempfile
+
+# TEST 1
+
+# Both files use universe 1, the one of lat_ex1 is moved to a free number
+lat1 = go("./lat_ex1.mcnp")
+lat5 = go("./lat_ex5.mcnp")
+lat5.Translat([0, 0, 500])
+lat1.Insert(lat5, location = 'outside')
+lat1.WriteMCNPFile("./results/Test1.mcnp")
+
+# TEST 2
+
+# Renumbering of the universes, including lattice arrays
+lat5 = go("./lat_ex5.mcnp")
+lat5.Renum(univ = 20)
+lat5.WriteMCNPFile("./results/Test2.mcnp")
+
+# TEST 3
+
+# Renumbering back and forth of a lattice array followed by keywords,
+# the array keeps its size and the keywords stay after the array
+def LatUniv(dictElem):
+    lsLine = dictElem["fich"][dictElem["cell"][1]]
+    return tk.ReadFillArray(tk.GetCellFillStr(lsLine)["data"])["univ"]
+
+latkw = go("./lat_kw.mcnp")
+npUniv = LatUniv(latkw._dictElem)
+dictOut = tk.RenumUniv(latkw._dictElem, {1: 11, 2: 12, 3: 13})
+dictOut = tk.RenumUniv(dictOut, {11: 1, 12: 2, 13: 3})
+print("RenumUniv round trip:", list(LatUniv(dictOut)) == list(npUniv))
+
+latkw.Renum(univ = 10)
+latkw.Renum(univ = 1)
+print("Renum size:", len(LatUniv(latkw._dictElem)) == len(npUniv))
+print("Keywords:", latkw._dictElem["fich"][latkw._dictElem["cell"][1]][-1].split('$')[0].split()[-1])
+latkw.WriteMCNPFile("./results/Test3.mcnp")
+
+# TEST 4
+
+# Same lattice inserted in itself, the universes of the guest collide and
+# are moved with RenumUniv
+latkw = go("./lat_kw.mcnp")
+latkw2 = go("./lat_kw.mcnp")
+latkw2.Translat([0, 20, 0])
+latkw.Insert(latkw2)
+latkw.WriteMCNPFile("./results/Test4.mcnp")
+
+# TEST 5
+
+# Groups of an old file with an entry which is not a group
+sDir = tempfile.mkdtemp()
+with open(os.path.join(sDir, "lat_groups.mcnp"),'w') as fid:
+    fid.write(open("./lat_kw.mcnp").read() + '\n{"version":1,"lattice":{"univ":[1,2]}}\n')
+latgr = go(os.path.join(sDir, "lat_groups.mcnp"))
+latgr.Renum(univ = 10)
+print("Groups:", latgr._dictElem["groups"])
+shutil.rmtree(sDir)
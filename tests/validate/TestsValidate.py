@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the validation of the references.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import json
+
+# TEST 1
+
+# File with undefined surface, cells, material, transformations and group entry
+broken = go("./broken.mcnp")
+lsDiag = broken.Validate()
+with open("./results/Test1.json",'w') as fid:
+    json.dump(lsDiag, fid, indent=1)
+
+# TEST 2
+
+# Debug mode: validation after each operation, no error expected
+go.debug = True
+detector = go("./detector.mcnp")
+ccd = go("./ccd.mcnp")
+ccd.Translat([60,50,0])
+detector.Insert(ccd, location = 'inside')
+detector.Renum(cell = 100, surf = 100, trans = 10)
+ccd2 = detector.Extract([101,102])
+print(len(detector.Validate()), len(ccd2.Validate()))
+
+# Debug mode with copies inserted as a universe
+detector3 = go("./detector.mcnp")
+detector3.InsertInstance(go("./ccd.mcnp"), transforms=[['tr',60,50,-25], ['tr',60,50,25]])
+print(len(detector3.Validate()))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""
+Test script for the Monte Carlo estimation of the volumes of the cells.
+"""
+
+# Import mcnpgo
+from mcnpgo.mcnpgo import *
+import numpy as np
+
+# The processes of EstimateVolumes(workers > 1) import this script
+if __name__ == '__main__':
+
+    # Room with a detector rotated by 30 degrees
+    room = go("./room.mcnp")
+    det = go("./detector.mcnp")
+    det.TrRotZ([0, 100, 0], 30)
+    room.Insert(det, location = 'inside')
+
+    # TEST 1
+
+    # Volumes of all the cells, compared with the exact values
+    dictExact = {1: 8000., 6: 8000.,
+                 2: np.pi*(5**2*10 - 4.5**2*9),
+                 3: np.pi*4.5**2*9,
+                 4: 4/3*np.pi*20**3 - np.pi*5**2*10,
+                 10: 4/3*np.pi*(200**3 - 20**3) - 16000.}
+    dictVol = room.EstimateVolumes(n = 10**6, tol = 0.005, seed = 1)
+    with open("./results/Test1.txt", 'w') as fid:
+        for iCell,(dVol,dStd) in dictVol.items():
+            fid.write(f"{iCell:4d} {dVol:14.6e} +- {dStd:12.4e}  exact {dictExact[iCell]:14.6e}  ({100*(dVol/dictExact[iCell] - 1):+.2f} %)\n")
+
+    # TEST 2
+
+    # Same results with several processes
+    print("Same results with 2 processes:", room.EstimateVolumes(n = 10**6, tol = 0.005, seed = 1, workers = 2) == dictVol)
+
+    # TEST 3
+
+    # Volumes of the detector cells written in a VOL card
+    room.EstimateVolumes(cells = [2, 3, 4], n = 10**5, tol = 0.01, seed = 1, write = True)
+    room.WriteMCNPFile("./results/Test3.mcnp", data = ['vol'])
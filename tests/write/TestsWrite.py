@@ -21,3 +21,14 @@ for file in files:
     lat.WriteMCNPFile("./results/Test_" + file)
 
 
+
+# Writing again an unchanged file: the file is not rewritten (same mtime)
+import mcnpgo.mctk as tk
+lat = go("lat_ex1.mcnp")
+lat.WriteMCNPFile("./results/Test_lat_ex1.mcnp")
+iTime = os.stat("./results/Test_lat_ex1.mcnp").st_mtime_ns
+dictStats0 = dict(tk.dictGWriteStats)
+print("Second write:", lat.WriteMCNPFile("./results/Test_lat_ex1.mcnp"))
+print("Same mtime:", os.stat("./results/Test_lat_ex1.mcnp").st_mtime_ns == iTime)
+print("Stats:", {sKey: tk.dictGWriteStats[sKey] - dictStats0[sKey] for sKey in dictStats0})
+print("Temporary files:", [s for s in os.listdir("./results") if s.endswith('.tmp')])